@@ -9,7 +9,7 @@ login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
     # Flask Configuration
@@ -30,17 +30,191 @@ def create_app():
     app.config['MPESA_BASE_URL'] = 'https://sandbox.safaricom.co.ke'
     app.config['BASE_URL'] = 'http://localhost:5000'
     app.config['LISTING_FEE'] = 1
+    # Daraja resilience, per process - bounded concurrency, per-operation timeouts, circuit breaker
+    app.config['MPESA_MAX_CONCURRENT'] = 4  # Daraja calls in flight; the rest wait MPESA_QUEUE_TIMEOUT
+    app.config['MPESA_QUEUE_TIMEOUT'] = 2  # seconds before a waiting call is refused
+    app.config['MPESA_CONNECT_TIMEOUT'] = 3.05
+    app.config['MPESA_TIMEOUTS'] = {'token': 10, 'stk_push': 15, 'status_query': 10}  # read timeouts, seconds
+    app.config['MPESA_BREAKER_THRESHOLD'] = 5  # consecutive failures that open the circuit
+    app.config['MPESA_BREAKER_RESET'] = 30  # seconds open before one probe call is let through
+    # Status polls for one checkout share one stkpushquery; answers are reused briefly
+    app.config['MPESA_STATUS_CACHE_TTL'] = 3  # seconds, while the payment is still processing
+    app.config['MPESA_STATUS_FINAL_TTL'] = 600  # seconds, until the local row records the outcome
+    app.config['MPESA_STATUS_WAIT_TIMEOUT'] = 35  # seconds a coalesced poll waits for the shared call
+
+    # Rate limiting - 'sqlite' shares buckets between workers on one host
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_STORAGE'] = 'memory'
+    app.config['RATELIMIT_RULES'] = {}  # e.g. {'auth.login': {'ip': '10/minute', 'account': '5/minute'}}
+    # A blueprint's name as the key covers all its views, e.g. {'products': {'ip': '60/minute'}}
+
+    # Instrumentation - per-endpoint latency and SQL counts at /metrics
+    app.config['METRICS_ENABLED'] = True
+    app.config['METRICS_QUERY_BUDGET'] = 25  # warn when one request runs more statements than this
+    app.config['METRICS_TOKEN'] = None  # scrapers send "Authorization: Bearer <token>"; otherwise admins only
+
+    # On-demand profiling of single requests - signed X-Profile header, or ?profile=1 for admins
+    app.config['PROFILING_ENABLED'] = False  # needs PROFILING_SECRET set for the header
+    app.config['PROFILING_MODE'] = 'sampling'  # or 'cprofile'
+    app.config['ADMIN_EMAILS'] = []
+
+    # HTTP caching - data-version ETags answer 304 before rendering; gzip (or brotli, if installed) above a size
+    app.config['HTTPCACHE_ENABLED'] = True
+    app.config['COMPRESS_ENABLED'] = True
+    app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; smaller bodies aren't worth the CPU
+    app.config['COMPRESS_LEVEL'] = 6  # gzip, 1-9
+    app.config['COMPRESS_BROTLI_QUALITY'] = 5  # brotli, 0-11
+
+    # Background jobs (file cleanup, ...) - one thread per process, started by the first request
+    app.config['SCHEDULER_ENABLED'] = True
+    app.config['FILEGC_SWEEP_INTERVAL'] = 60  # seconds between unlink batches
+    app.config['FILEGC_RECONCILE_INTERVAL'] = 6 * 3600  # seconds between orphan scans of UPLOAD_FOLDER
+
+    # Homepage trending ranking - rescored incrementally, rebuilt in full so scores decay
+    app.config['TRENDING_REFRESH_INTERVAL'] = 300
+    app.config['TRENDING_REBUILD_INTERVAL'] = 3600
+    app.config['TRENDING_WINDOW_DAYS'] = 14
+    app.config['TRENDING_HOMEPAGE_SIZE'] = 12
+
+    # Contact access - signed list of unlocked product ids in the buyer's session
+    app.config['UNLOCK_CAPABILITY_MAX_AGE'] = 24 * 3600  # seconds before the database is asked again
+    app.config['UNLOCK_CAPABILITY_MAX_IDS'] = 100  # keeps the session cookie well under 4KB
+
+    # Browse page - server-side filters, cached facet counts, keyset pages
+    app.config['BROWSE_PAGE_SIZE'] = 24
+    app.config['BROWSE_FACET_CACHE_TTL'] = 60  # seconds; writes in this process clear it at once
+    app.config['BROWSE_PRICE_BUCKETS'] = [0, 500, 1000, 2500, 5000, 10000, 25000]  # KES, lower edges
+
+    # Similar items on product pages - TF-IDF neighbours precomputed by a background job
+    app.config['SIMILAR_REFRESH_INTERVAL'] = 600
+    app.config['SIMILAR_REBUILD_INTERVAL'] = 24 * 3600  # refreshes the vocabulary too
+    app.config['SIMILAR_TOP_K'] = 8
+    app.config['SIMILAR_MAX_FEATURES'] = 2048  # vocabulary size; vectors are sparse, so memory follows words used
+    app.config['SIMILAR_ADJACENT_CATEGORIES'] = {}  # e.g. {'Electronics': ['Stationery']}
+    app.config['SIMILAR_ADJACENT_WEIGHT'] = 0.8  # score multiplier for matches from an adjacent category
+
+    # Search typeahead - per-worker prefix index over live titles and categories
+    app.config['SUGGEST_ENABLED'] = True
+    app.config['SUGGEST_MAX_PRODUCTS'] = 100000  # newest listings indexed; ~300 bytes each
+    app.config['SUGGEST_SYNC_INTERVAL'] = 30  # seconds; other workers' edits show up within this
+
+    # Duplicate photos - dHash per upload, BK-tree per worker for near-duplicate lookups
+    app.config['IMAGE_HASH_ENABLED'] = True
+    app.config['IMAGE_HASH_MAX_DISTANCE'] = 6  # differing bits of 64 that still count as the same photo
+    app.config['IMAGE_HASH_SYNC_INTERVAL'] = 60
+    app.config['IMAGE_HASH_BACKFILL_INTERVAL'] = 600  # hashes uploads from before hashing existed
+    app.config['IMAGE_HASH_BACKFILL_BATCH_SIZE'] = 200
+
+    # Duplicate text - MinHash per listing, LSH buckets in SQLite
+    app.config['TEXTDUP_ENABLED'] = True
+    app.config['TEXTDUP_THRESHOLD'] = 0.6  # estimated Jaccard similarity of word bigrams
+    app.config['TEXTDUP_MAX_CANDIDATES'] = 50  # bucket collisions checked per lookup
+    app.config['TEXTDUP_BACKFILL_INTERVAL'] = 600
+    app.config['TEXTDUP_BACKFILL_BATCH_SIZE'] = 500
+
+    # Listing galleries - ordered photos per product, each with an inline placeholder
+    app.config['PRODUCT_MAX_IMAGES'] = 8  # per listing; extra uploads in the request are ignored
+    app.config['GALLERY_BACKFILL_INTERVAL'] = 600  # gives pre-gallery listings their cover row
+    app.config['GALLERY_BACKFILL_BATCH_SIZE'] = 200
+
+    # Nearby listings - seller's campus/hostel as an indexed locality on each product
+    app.config['LOCALITY_SYNC_INTERVAL'] = 3600  # catches products listed before localities existed
+
+    # Product view counters - counted in memory, flushed in one batch per interval
+    app.config['VIEWCOUNT_ENABLED'] = True
+    app.config['VIEWCOUNT_FLUSH_INTERVAL'] = 30  # seconds; also the most a crashed worker loses
+
+    # Seller dashboard - daily rollups of views, unlocks and fees
+    app.config['ANALYTICS_ROLLUP_INTERVAL'] = 300
+
+    # Listing expiry - listings come down this long after going live; sellers renew in one click
+    app.config['LISTING_TTL_DAYS'] = 60
+    app.config['LISTING_EXPIRY_GRACE_DAYS'] = 7  # minimum notice for listings from before expiry existed
+    app.config['LISTING_EXPIRY_INTERVAL'] = 900
+    app.config['LISTING_EXPIRY_BATCH_SIZE'] = 500
+    app.config['LISTING_EXPIRY_BATCH_PAUSE'] = 0.05
+
+    # Archival of cold rows into instance/archive.db (ATTACHed as `archive`)
+    app.config['ARCHIVE_ENABLED'] = True
+    app.config['ARCHIVE_INTERVAL'] = 3600
+    app.config['ARCHIVE_SOLD_AFTER_DAYS'] = 90
+    app.config['ARCHIVE_FAILED_AFTER_DAYS'] = 30
+    app.config['ARCHIVE_READ_NOTIFICATIONS_AFTER_DAYS'] = 60
+    app.config['ARCHIVE_EXPIRED_AFTER_DAYS'] = 180  # expired listings nobody renewed
+    app.config['ARCHIVE_BATCH_SIZE'] = 500  # rows per transaction
+    app.config['ARCHIVE_BATCH_PAUSE'] = 0.05  # seconds between batches, so requests get the write lock
+    app.config['ARCHIVE_MAX_BATCHES'] = 200  # per run; None for no limit
+
+    # Reconciliation exports at /admin/exports/<payments|unlocks> and `flask export`
+    app.config['EXPORT_CHUNK_SIZE'] = 1000  # rows per read; memory use doesn't grow past this
+
+    # Logging - JSON lines through a background queue; DEBUG records are sampled
+    app.config['LOG_LEVEL'] = 'INFO'
+    app.config['LOG_LEVELS'] = {}  # per-module overrides, e.g. {'app.mpesa': 'DEBUG'}
+    app.config['LOG_DEBUG_SAMPLE_RATE'] = 0.1
+
+    # Overrides from the caller (benchmarks, scripts)
+    if config:
+        app.config.update(config)
+
+    from app.log import configure_logging
+    configure_logging(app)
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
+
+    from app import signals
+    signals.init_app(app, db)
+
+    from app.ratelimit import limiter
+    limiter.init_app(app)
+
+    from app import metrics
+    metrics.init_app(app, db)
+
+    from app import profiling
+    profiling.init_app(app, db)
+
+    from app import httpcache
+    httpcache.init_app(app)
+
+    # Background jobs; importing a job module registers its jobs
+    from app.scheduler import scheduler
+    from app import filegc, trending, similar, analytics, archive, expiry, suggest, duplicates, textdupes, \
+        gallery  # noqa: F401
+    from app.products import locality
+    from app.viewcounts import view_counter
+    scheduler.init_app(app)
+    view_counter.init_app(app)
+    suggest.init_app(app)
+    duplicates.init_app(app)
+    textdupes.init_app(app)
+    gallery.init_app(app)
+    locality.init_app(app)
     
     # Import and register blueprints
     from app.main.routes import main_bp
     from app.auth.routes import auth_bp
     from app.products.routes import products_bp
+    from app.api.routes import api_bp
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(products_bp)
+    app.register_blueprint(api_bp)
+
+    # Archive database, attached to every connection - so before the first query
+    archive.init_app(app, db)
+
+    from app import exports
+    exports.init_app(app)
+
+    # Create tables and indexes added since the database was made
+    from app.schema import upgrade_schema
+    with app.app_context():
+        upgrade_schema(db)
+        if app.config['ARCHIVE_ENABLED']:
+            upgrade_schema(db, archive.archive_metadata)
+            archive.reserve_ids()
     
     return app
@@ -0,0 +1,142 @@
+# app/analytics.py
+"""Daily per-product rollups behind the seller dashboard.
+
+seller-rollup recomputes whole (product, day) cells from the source tables
+for every day since its watermark (normally just today), so reruns and
+overlaps never double count. The first run backfills all history. The
+dashboard then reads days x products rows, however long the history is.
+
+Unlocks, payments and views are read together with their archived copies.
+The seller of an unlock or payment comes from the row itself
+(ProductUnlock.seller_id, Payment.user_id), so money taken on listings that
+were since archived or deleted stays in.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Product, ProductUnlock, Payment, ProductViewDaily, JobState, ProductDailyStats
+from app.scheduler import scheduler
+from app.archive import history
+
+JOB_NAME = 'seller-rollup'
+
+# Completions stamped just before the watermark may commit just after it
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _source(model):
+    """Live and archived rows of model, as a table-like object"""
+    return history(model) if current_app.config['ARCHIVE_ENABLED'] else model.__table__
+
+
+def compute_cells(since_day=None):
+    """{(product_id, day): {...}} from unlocks, listing payments and views"""
+    cells = {}
+    since = datetime.combine(since_day, datetime.min.time()) if since_day else None
+
+    def cell(product_id, seller_id, day):
+        key = (product_id, _as_date(day))
+        if key not in cells:
+            cells[key] = {
+                'product_id': product_id, 'day': key[1], 'seller_id': seller_id,
+                'views': 0, 'unlocks': 0, 'unlock_revenue': 0.0, 'listing_fees': 0.0,
+            }
+        return cells[key]
+
+    unlock = _source(ProductUnlock).c
+    unlock_day = db.func.date(unlock.completed_at)
+    unlocks = db.select(
+        unlock.product_id, unlock.seller_id, unlock_day, db.func.count(), db.func.sum(unlock.amount),
+    ).where(unlock.status == 'completed', unlock.completed_at.isnot(None))\
+        .group_by(unlock.product_id, unlock.seller_id, unlock_day)
+    if since:
+        unlocks = unlocks.where(unlock.completed_at >= since)
+    for product_id, seller_id, day, count, amount in db.session.execute(unlocks):
+        row = cell(product_id, seller_id, day)
+        row['unlocks'] = count
+        row['unlock_revenue'] = amount or 0.0
+
+    # Listing fees are paid by the seller
+    payment = _source(Payment).c
+    payment_day = db.func.date(payment.completed_at)
+    payments = db.select(
+        payment.product_id, payment.user_id, payment_day, db.func.sum(payment.amount),
+    ).where(payment.status == 'completed', payment.completed_at.isnot(None))\
+        .group_by(payment.product_id, payment.user_id, payment_day)
+    if since:
+        payments = payments.where(payment.completed_at >= since)
+    for product_id, seller_id, day, amount in db.session.execute(payments):
+        cell(product_id, seller_id, day)['listing_fees'] = amount or 0.0
+
+    # Views are archived with their listing; deleted listings' are removed with them
+    products = _source(Product)
+    view = _source(ProductViewDaily).c
+    views = db.select(view.product_id, products.c.seller_id, view.day, view.views)\
+        .join(products, products.c.id == view.product_id)
+    if since_day:
+        views = views.where(view.day >= since_day)
+    for product_id, seller_id, day, count in db.session.execute(views):
+        cell(product_id, seller_id, day)['views'] = count
+
+    return cells
+
+
+@scheduler.job(JOB_NAME, 'ANALYTICS_ROLLUP_INTERVAL', 300)
+def rollup(full=False):
+    """Rebuild the rollup cells for every day since the watermark; returns cells written"""
+    now = datetime.utcnow()
+    state = JobState.get(JOB_NAME)
+    since_day = None if full or state.watermark is None else (state.watermark - WATERMARK_OVERLAP).date()
+
+    cells = compute_cells(since_day)
+    stale = ProductDailyStats.query
+    if since_day:
+        stale = stale.filter(ProductDailyStats.day >= since_day)
+    stale.delete(synchronize_session=False)
+    if cells:
+        db.session.execute(ProductDailyStats.__table__.insert(), list(cells.values()))
+
+    if since_day is None:
+        state.last_full_run = now
+    state.watermark = now
+    db.session.commit()
+    return len(cells)
+
+
+def seller_summary(seller_id, days):
+    """Totals, per-product rows and a daily series for the last `days` days"""
+    start = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = ProductDailyStats.query.filter(
+        ProductDailyStats.seller_id == seller_id,
+        ProductDailyStats.day >= start,
+    ).all()
+
+    totals = {'views': 0, 'unlocks': 0, 'unlock_revenue': 0.0, 'listing_fees': 0.0}
+    per_product, per_day = {}, {}
+    for row in rows:
+        for bucket in (totals,
+                       per_product.setdefault(row.product_id, dict.fromkeys(totals, 0)),
+                       per_day.setdefault(row.day, dict.fromkeys(totals, 0))):
+            bucket['views'] += row.views
+            bucket['unlocks'] += row.unlocks
+            bucket['unlock_revenue'] += row.unlock_revenue
+            bucket['listing_fees'] += row.listing_fees
+
+    # Sold listings may have moved to the archive by now
+    products = _source(Product)
+    titles = dict(db.session.execute(
+        db.select(products.c.id, products.c.title).where(products.c.id.in_(list(per_product)))
+    ).all()) if per_product else {}
+    products = sorted(
+        ({'id': product_id, 'title': titles.get(product_id), **stats} for product_id, stats in per_product.items()),
+        key=lambda item: (-item['unlocks'], -item['views']),
+    )
+    series = [
+        {'day': start + timedelta(days=offset), **per_day.get(start + timedelta(days=offset), dict.fromkeys(totals, 0))}
+        for offset in range(days)
+    ]
+    return {'totals': totals, 'products': products, 'series': series, 'start': start}
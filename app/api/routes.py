@@ -0,0 +1,149 @@
+# app/api/routes.py
+"""Versioned JSON API for mobile clients.
+
+Rows are read as plain column tuples - only the columns the client asked for
+with fields= (plus the keyset columns) - and serialized straight to dicts, so
+no ORM objects are built. Lists use the same filters and keyset cursors as the
+browse page.
+"""
+from flask import Blueprint, jsonify, request, url_for
+from app import db
+from app.models import Product, Category
+from app.products.browse import BrowseFilters, sort_key, seek, encode_cursor
+from app.httpcache import conditional, catalog_version
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_FIELDS = ('id', 'title', 'price', 'image')
+MAX_LIMIT = 100
+MAX_IDS = 100
+
+
+def _image_url(filename):
+    return url_for('static', filename='uploads/product_images/' + filename) if filename else None
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# name -> (column, serializer); contact_info stays behind the paid unlock
+FIELDS = {
+    'id': (Product.id, None),
+    'title': (Product.title, None),
+    'description': (Product.description, None),
+    'price': (Product.price, None),
+    'condition': (Product.condition, None),
+    'image': (Product.image, _image_url),
+    'image_placeholder': (Product.image_placeholder, None),
+    'category_id': (Product.category_id, None),
+    'category': (Category.name, None),
+    'locality_id': (Product.locality_id, None),
+    'seller_id': (Product.seller_id, None),
+    'is_sold': (Product.is_sold, None),
+    'view_count': (Product.view_count, None),
+    'created_at': (Product.created_at, _isoformat),
+    'updated_at': (Product.updated_at, _isoformat),
+    'expires_at': (Product.expires_at, _isoformat),
+}
+
+
+def parse_fields(value):
+    """Requested field names, in order; ValueError for unknown ones"""
+    if not value:
+        return list(DEFAULT_FIELDS)
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}; available: {', '.join(FIELDS)}")
+    return names
+
+
+def parse_ids(value):
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('ids must be a comma separated list of product ids')
+    if len(ids) > MAX_IDS:
+        raise ValueError(f'at most {MAX_IDS} ids per request')
+    return ids
+
+
+def select_products(names, *extra):
+    """A select of just these fields (labelled by name) plus extra columns"""
+    columns = [FIELDS[name][0].label(name) for name in names]
+    query = db.select(*columns, *extra).select_from(Product)
+    if 'category' in names:
+        query = query.outerjoin(Category, Category.id == Product.category_id)
+    return query
+
+
+def serialize(row, names):
+    item = {}
+    for name in names:
+        value = getattr(row, name)
+        serializer = FIELDS[name][1]
+        item[name] = serializer(value) if serializer else value
+    return item
+
+
+def error(message, status=400):
+    return jsonify({'success': False, 'message': message}), status
+
+
+@api_bp.route('/products')
+@conditional(catalog_version)
+def list_products():
+    """Live products, filtered like /all and keyset-paginated; or ids=1,2,3 for a bulk fetch"""
+    try:
+        names = parse_fields(request.args.get('fields'))
+        if 'ids' in request.args:
+            return fetch_by_ids(parse_ids(request.args['ids']), names)
+        filters = BrowseFilters.from_args(request.args)
+        limit = min(max(request.args.get('limit', 24, type=int), 1), MAX_LIMIT)
+        column, _ = sort_key(filters.sort)
+        query = seek(
+            select_products(names, Product.id.label('_id'), column.label('_sort')).where(*filters.conditions()),
+            filters.sort, request.args.get('cursor'))
+    except ValueError as e:
+        return error(str(e))
+
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last._sort, last._id, filters.sort)
+    return jsonify({
+        'success': True,
+        'products': [serialize(row, names) for row in rows[:limit]],
+        'next_cursor': next_cursor,
+    })
+
+
+def fetch_by_ids(ids, names):
+    """Products by id, in the order asked for, in one IN query; unknown or unlisted ids come back in missing"""
+    rows = db.session.execute(
+        select_products(names, Product.id.label('_id'))
+        .where(Product.id.in_(ids), Product.is_active == True)
+    ).all() if ids else []
+    by_id = {row._id: row for row in rows}
+    return jsonify({
+        'success': True,
+        'products': [serialize(by_id[product_id], names) for product_id in ids if product_id in by_id],
+        'missing': [product_id for product_id in ids if product_id not in by_id],
+    })
+
+
+@api_bp.route('/products/<int:product_id>')
+@conditional(catalog_version)
+def get_product(product_id):
+    try:
+        names = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return error(str(e))
+    row = db.session.execute(
+        select_products(names).where(Product.id == product_id, Product.is_active == True)
+    ).first()
+    if row is None:
+        return error('Product not found', 404)
+    return jsonify({'success': True, 'product': serialize(row, names)})
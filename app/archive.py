@@ -0,0 +1,205 @@
+# app/archive.py
+"""Move cold rows out of the hot tables into an attached archive database.
+
+Every connection ATTACHes ARCHIVE_DATABASE as `archive`, which holds a copy of
+the products, payments, product_unlocks, notifications, product_images and
+product_views_daily tables (no foreign keys, plus archived_at). The archive job moves, tier by tier, rows that
+listing and unlock queries never need:
+
+- sold products and expired listings nobody renewed (with their payments,
+  unlocks, notifications, gallery rows and daily views)
+- failed payments and failed unlocks
+- read notifications
+
+Each batch is one short transaction (copy, then delete), with a pause between
+batches so request writers get the lock. history() gives a union of live and
+archived rows for ad hoc queries.
+
+An id identifies one row across both databases: the mirrored tables are
+AUTOINCREMENT, and reserve_ids() keeps SQLite from reissuing an id that is
+only left in the archive. An archived row is therefore never overwritten.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Column, DateTime, Index, MetaData, Table, event, literal
+from app import db
+from app.models import (Product, Payment, ProductUnlock, Notification, TrendingScore, SimilarProduct,
+                        ListingSignature, ListingBand, ProductImage, ProductViewDaily)
+from app.scheduler import scheduler
+
+SCHEMA = 'archive'
+
+archive_metadata = MetaData()
+
+
+def _mirror(table):
+    columns = [Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+               for column in table.columns]
+    columns.append(Column('archived_at', DateTime))
+    return Table(table.name, archive_metadata, *columns, schema=SCHEMA)
+
+
+archive_tables = {model: _mirror(model.__table__) for model in (Product, Payment, ProductUnlock, Notification,
+                                                                ProductImage, ProductViewDaily)}
+
+# For looking history up by owner
+Index('ix_archive_products_seller_id', archive_tables[Product].c.seller_id)
+Index('ix_archive_payments_product_id', archive_tables[Payment].c.product_id)
+Index('ix_archive_product_unlocks_product_id', archive_tables[ProductUnlock].c.product_id)
+Index('ix_archive_notifications_user_id', archive_tables[Notification].c.user_id)
+Index('ix_archive_product_images_product_id', archive_tables[ProductImage].c.product_id)
+
+
+def init_app(app, db):
+    """Attach the archive to every new connection; call before the first query"""
+    app.config.setdefault('ARCHIVE_ENABLED', True)
+    app.config.setdefault('ARCHIVE_DATABASE', os.path.join(app.instance_path, 'archive.db'))
+    if not app.config['ARCHIVE_ENABLED']:
+        return
+
+    path = app.config['ARCHIVE_DATABASE']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def _attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (path,))
+
+    archive_cli = AppGroup('archive', help='Inspect the archive database')
+
+    @archive_cli.command('stats')
+    def stats():
+        """Row counts in the hot tables and the archive"""
+        for model, table in archive_tables.items():
+            live = db.session.execute(db.select(db.func.count()).select_from(model.__table__)).scalar()
+            archived = db.session.execute(db.select(db.func.count()).select_from(table)).scalar()
+            click.echo(f"{model.__tablename__:<20} live {live:>10}  archived {archived:>10}")
+
+    app.cli.add_command(archive_cli)
+
+
+def history(model):
+    """Live and archived rows of model as one subquery, for reports and lookups"""
+    live = model.__table__
+    archived = archive_tables[model]
+    names = [column.name for column in live.columns]
+    return db.union_all(
+        db.select(*[live.c[name] for name in names]),
+        db.select(*[archived.c[name] for name in names]),
+    ).subquery(f'{live.name}_history')
+
+
+def move(model, condition):
+    """Copy rows matching condition into the archive and delete them here"""
+    live = model.__table__
+    names = [column.name for column in live.columns]
+    source = db.select(*[live.c[name] for name in names], literal(datetime.utcnow()).label('archived_at'))\
+        .where(condition)
+    # OR IGNORE: a batch interrupted between copy and delete can simply run again
+    db.session.execute(
+        archive_tables[model].insert().prefix_with('OR IGNORE').from_select(names + ['archived_at'], source)
+    )
+    return db.session.execute(live.delete().where(condition)).rowcount
+
+
+def reserve_ids():
+    """Start each mirrored table's id sequence past its archived ids, in case they're newer"""
+    for model, table in archive_tables.items():
+        if 'id' not in table.c:
+            continue
+        archived = db.session.execute(db.select(db.func.max(table.c.id))).scalar()
+        if archived is None:
+            continue
+        name = model.__tablename__
+        sequence = db.session.execute(
+            db.text('SELECT seq FROM main.sqlite_sequence WHERE name = :name'), {'name': name}).scalar()
+        if sequence is None:
+            db.session.execute(db.text('INSERT INTO main.sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                               {'name': name, 'seq': archived})
+        elif sequence < archived:
+            db.session.execute(db.text('UPDATE main.sqlite_sequence SET seq = :seq WHERE name = :name'),
+                               {'name': name, 'seq': archived})
+    db.session.commit()
+
+
+def _move_products(ids):
+    for model in (Notification, ProductUnlock, Payment, ProductImage, ProductViewDaily):
+        move(model, model.__table__.c.product_id.in_(ids))
+    # Derived rows are rebuilt by their jobs; no need to keep them
+    db.session.execute(TrendingScore.__table__.delete().where(TrendingScore.product_id.in_(ids)))
+    db.session.execute(SimilarProduct.__table__.delete().where(db.or_(
+        SimilarProduct.product_id.in_(ids), SimilarProduct.similar_id.in_(ids))))
+    db.session.execute(ListingSignature.__table__.delete().where(ListingSignature.product_id.in_(ids)))
+    db.session.execute(ListingBand.__table__.delete().where(ListingBand.product_id.in_(ids)))
+    return move(Product, Product.__table__.c.id.in_(ids))
+
+
+def tiers(now=None):
+    """(name, model, condition, mover) in the order the job works through them"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+
+    def older(days):
+        return now - timedelta(days=days)
+
+    return [
+        ('sold products', Product,
+         db.and_(Product.is_sold == True, Product.updated_at < older(config['ARCHIVE_SOLD_AFTER_DAYS'])),
+         _move_products),
+        ('expired listings', Product,
+         db.and_(Product.is_active == False, Product.is_sold == False,
+                 Product.expires_at < older(config['ARCHIVE_EXPIRED_AFTER_DAYS'])),
+         _move_products),
+        ('failed payments', Payment,
+         db.and_(Payment.status == 'failed', Payment.created_at < older(config['ARCHIVE_FAILED_AFTER_DAYS'])),
+         None),
+        ('failed unlocks', ProductUnlock,
+         db.and_(ProductUnlock.status == 'failed',
+                 ProductUnlock.created_at < older(config['ARCHIVE_FAILED_AFTER_DAYS'])),
+         None),
+        ('read notifications', Notification,
+         db.and_(Notification.is_read == True,
+                 Notification.created_at < older(config['ARCHIVE_READ_NOTIFICATIONS_AFTER_DAYS'])),
+         None),
+    ]
+
+
+@scheduler.job('archive', 'ARCHIVE_INTERVAL', 3600)
+def run(max_batches=None):
+    """Archive up to max_batches batches across all tiers; returns rows moved per tier"""
+    config = current_app.config
+    if not config['ARCHIVE_ENABLED']:
+        return {}
+    batch_size = config['ARCHIVE_BATCH_SIZE']
+    pause = config['ARCHIVE_BATCH_PAUSE']
+    budget = max_batches if max_batches is not None else config['ARCHIVE_MAX_BATCHES']
+    moved = {}
+
+    for name, model, condition, mover in tiers():
+        primary_key = model.__table__.primary_key.columns.values()[0]
+        while budget is None or budget > 0:
+            ids = list(db.session.execute(
+                db.select(primary_key).where(condition).order_by(primary_key).limit(batch_size)
+            ).scalars())
+            if not ids:
+                break
+            if mover:
+                count = mover(ids)
+            else:
+                count = move(model, primary_key.in_(ids))
+            db.session.commit()
+            moved[name] = moved.get(name, 0) + count
+            if budget is not None:
+                budget -= 1
+            if len(ids) < batch_size:
+                break
+            time.sleep(pause)
+
+    if moved:
+        current_app.logger.info(f"Archived {moved}")
+    return moved
@@ -0,0 +1,23 @@
+# app/auth/admin.py
+from functools import wraps
+from flask import current_app, abort
+from flask_login import current_user
+
+
+def is_admin(user=None):
+    """Admins are listed by email in ADMIN_EMAILS"""
+    user = user or current_user
+    if not user or not user.is_authenticated:
+        return False
+    admins = current_app.config.get('ADMIN_EMAILS') or ()
+    return (user.email or '').lower() in {email.lower() for email in admins}
+
+
+def admin_required(view):
+    """Like login_required, but 404s for anyone who isn't an admin"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not is_admin():
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapped
@@ -3,10 +3,15 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.models import User
 from app import db
+from app.ratelimit import limiter, form_email
+import logging
+
+logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@limiter.limit(account=form_email)
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -27,7 +32,7 @@ def register():
             password_hash=generate_password_hash(password),
             phone=phone
         )
-        print(f'this is the email{email},{username}')
+        logger.debug("Registering user %s", username)
         
         db.session.add(new_user)
         db.session.commit()
@@ -38,6 +43,7 @@ def register():
     return render_template('auth/register.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit(account=form_email)
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
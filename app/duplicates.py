@@ -0,0 +1,371 @@
+# app/duplicates.py
+"""Near-duplicate listing photos, for catching reposts.
+
+Each uploaded image gets a 64-bit difference hash (dHash): the picture shrunk
+to 9x8 greyscale, one bit per horizontal neighbour pair saying which is
+brighter. Re-saves, re-compressions, resizes and small crops of the same photo
+land within a few bits of each other, so "near duplicate" means a Hamming
+distance of at most IMAGE_HASH_MAX_DISTANCE.
+
+Hashes are stored on the product (image_hash) and held in a BK-tree per
+worker. Hamming distance is a metric, so a lookup only descends into children
+whose edge distance is within the radius of the query's distance to the node;
+for small radii that visits a few percent of the tree instead of every image.
+The tree is built on first use and kept current like the typeahead index:
+edits past the updated_at watermark are applied in place, and a change in the
+number of hashed products (deletes, archival, the backfill) rebuilds it.
+
+Hashes for products uploaded before this existed are filled in by a
+background job, a batch at a time.
+"""
+import os
+import threading
+import time
+import click
+from flask import current_app, request
+from app import db, metrics
+from app.models import Product
+from app.scheduler import scheduler
+from app.signals import product_changed
+
+HASH_MASK = (1 << 64) - 1
+
+NODES_VISITED = metrics.histogram(
+    'image_hash_nodes_visited', 'BK-tree nodes compared per near-duplicate lookup', (),
+    (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+
+def dhash(source):
+    """64-bit difference hash of an image path or file object; None if it can't be read"""
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(source) as image:
+            # JPEGs decode straight to a small greyscale copy instead of full size
+            image.draft('L', (64, 64))
+            pixels = image.convert('L').resize((9, 8), Image.Resampling.BOX).tobytes()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        current_app.logger.warning(f"Could not hash image {getattr(source, 'name', source)}: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def to_column(value):
+    """SQLite integers are signed 64-bit"""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_column(value):
+    return None if value is None else value & HASH_MASK
+
+
+def hash_upload(filename):
+    """Column value for a saved upload, or None"""
+    if not current_app.config['IMAGE_HASH_ENABLED'] or not filename:
+        return None
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.isfile(path):
+        return None
+    return to_column(dhash(path))
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class _Node:
+    __slots__ = ('value', 'ids', 'children')
+
+    def __init__(self, value, product_id):
+        self.value = value
+        self.ids = {product_id}
+        self.children = None  # distance -> _Node
+
+
+class BKTree:
+    """Burkhard-Keller tree over hashes; products with the same hash share a node"""
+
+    def __init__(self):
+        self.root = None
+        self.nodes = 0
+
+    def add(self, value, product_id):
+        if self.root is None:
+            self.root = _Node(value, product_id)
+            self.nodes = 1
+            return
+        node = self.root
+        while True:
+            d = distance(value, node.value)
+            if d == 0:
+                node.ids.add(product_id)
+                return
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(d)
+            if child is None:
+                node.children[d] = _Node(value, product_id)
+                self.nodes += 1
+                return
+            node = child
+
+    def discard(self, value, product_id):
+        # The node stays as a waypoint for its subtree
+        node = self.root
+        while node is not None:
+            d = distance(value, node.value)
+            if d == 0:
+                node.ids.discard(product_id)
+                return
+            node = node.children.get(d) if node.children else None
+
+    def search(self, value, radius):
+        """[(distance, product_id)] within radius, nearest first"""
+        found, visited = [], 0
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            visited += 1
+            d = distance(value, node.value)
+            if d <= radius:
+                found.extend((d, product_id) for product_id in node.ids)
+            if node.children:
+                for edge in range(max(1, d - radius), d + radius + 1):
+                    child = node.children.get(edge)
+                    if child is not None:
+                        stack.append(child)
+        NODES_VISITED.observe(visited)
+        found.sort()
+        return found
+
+
+class DuplicateIndex:
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.hashes = {}  # product id -> hash
+        self.watermark = None
+        self.built_at = None
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def rebuild(self):
+        rows = db.session.execute(
+            db.select(Product.id, Product.image_hash).where(Product.image_hash.isnot(None))
+        ).all()
+        watermark = db.session.execute(db.select(db.func.max(Product.updated_at))).scalar()
+        tree, hashes = BKTree(), {}
+        for product_id, value in rows:
+            hashes[product_id] = from_column(value)
+            tree.add(hashes[product_id], product_id)
+        with self._lock:
+            self.tree, self.hashes = tree, hashes
+            self.watermark = watermark
+            self.built_at = time.time()
+
+    def ensure_current(self):
+        if self.built_at is None:
+            self.rebuild()
+        elif self.dirty:
+            self.sync()
+
+    def sync(self):
+        """Apply edits since the watermark; rebuild if hashes appeared or went away some other way"""
+        self.dirty = False
+        query = db.select(Product.id, Product.image_hash, Product.updated_at)
+        if self.watermark is not None:
+            query = query.where(Product.updated_at >= self.watermark)
+        changed = db.session.execute(query).all()
+        hashed = db.session.execute(
+            db.select(db.func.count()).where(Product.image_hash.isnot(None))
+        ).scalar()
+
+        with self._lock:
+            for product_id, value, updated_at in changed:
+                value = from_column(value)
+                old = self.hashes.get(product_id)
+                if old != value:
+                    if old is not None:
+                        self.tree.discard(old, product_id)
+                        del self.hashes[product_id]
+                    if value is not None:
+                        self.tree.add(value, product_id)
+                        self.hashes[product_id] = value
+                if updated_at and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+            # Deletes, archival and the backfill don't show up past the watermark
+            stale = len(self.hashes) != hashed
+
+        if stale:
+            self.rebuild()
+
+    def near(self, value, max_distance=None, exclude=None):
+        """[(distance, product_id)] of indexed products whose photo is within max_distance"""
+        if max_distance is None:
+            max_distance = current_app.config['IMAGE_HASH_MAX_DISTANCE']
+        with self._lock:
+            return [(d, product_id) for d, product_id in self.tree.search(value, max_distance)
+                    if product_id != exclude]
+
+    def clusters(self, max_distance=None, min_size=2):
+        """Groups of products linked by near-duplicate photos, largest first"""
+        if max_distance is None:
+            max_distance = current_app.config['IMAGE_HASH_MAX_DISTANCE']
+        parent = {}
+
+        def find(item):
+            while parent.setdefault(item, item) != item:
+                parent[item] = parent[parent[item]]
+                item = parent[item]
+            return item
+
+        # Cluster a snapshot in a tree of our own: sync() edits the shared tree in
+        # place, and holding the lock for the whole pass would stall near() lookups
+        with self._lock:
+            hashes = dict(self.hashes)
+        tree = BKTree()
+        for product_id, value in hashes.items():
+            tree.add(value, product_id)
+
+        # One lookup per distinct hash; products sharing a hash are already together
+        for value in set(hashes.values()):
+            linked = [product_id for _, product_id in tree.search(value, max_distance)]
+            root = find(linked[0])
+            for product_id in linked[1:]:
+                parent[find(product_id)] = root
+
+        groups = {}
+        for product_id in hashes:
+            groups.setdefault(find(product_id), []).append(product_id)
+        return sorted((sorted(group) for group in groups.values() if len(group) >= min_size),
+                      key=lambda group: (-len(group), group[0]))
+
+    def stats(self):
+        return {'products': len(self.hashes), 'nodes': self.tree.nodes}
+
+
+duplicate_index = DuplicateIndex()
+
+metrics.gauge('image_hash_index_products', 'Products in the near-duplicate photo index',
+              callback=lambda: len(duplicate_index.hashes))
+
+
+def near_duplicates(value, exclude=None, max_distance=None):
+    """Products whose photo is within max_distance of a hash, as (distance, Product), nearest first"""
+    if value is None or not current_app.config['IMAGE_HASH_ENABLED']:
+        return []
+    duplicate_index.ensure_current()
+    matches = duplicate_index.near(from_column(value), max_distance, exclude)
+    if not matches:
+        return []
+    products = {product.id: product for product in
+                Product.query.filter(Product.id.in_([product_id for _, product_id in matches[:50]]))}
+    return [(d, products[product_id]) for d, product_id in matches if product_id in products]
+
+
+@scheduler.job('image-hash-sync', 'IMAGE_HASH_SYNC_INTERVAL', 60, exclusive=False)
+def sync():
+    """Pick up other workers' uploads; every worker keeps its own tree"""
+    if current_app.config['IMAGE_HASH_ENABLED'] and duplicate_index.built_at is not None:
+        duplicate_index.sync()
+        return len(duplicate_index.hashes)
+
+
+_backfill = {'last_id': 0}
+
+
+@scheduler.job('image-hash-backfill', 'IMAGE_HASH_BACKFILL_INTERVAL', 600)
+def backfill(batch_size=None):
+    """Hash a batch of older uploads; returns how many were hashed"""
+    if not current_app.config['IMAGE_HASH_ENABLED']:
+        return 0
+    batch_size = batch_size or current_app.config['IMAGE_HASH_BACKFILL_BATCH_SIZE']
+    rows = db.session.execute(
+        db.select(Product.id, Product.image)
+        .where(Product.image_hash.is_(None), Product.image.isnot(None), Product.id > _backfill['last_id'])
+        .order_by(Product.id).limit(batch_size)
+    ).all()
+    # Unreadable files are skipped until the next pass over the table
+    _backfill['last_id'] = rows[-1].id if len(rows) == batch_size else 0
+
+    hashed = 0
+    for product_id, filename in rows:
+        value = hash_upload(filename)
+        if value is not None:
+            # Not an edit: leave updated_at (and every cached page keyed on it) alone
+            db.session.execute(
+                db.update(Product).where(Product.id == product_id)
+                .values(image_hash=value, updated_at=Product.updated_at)
+            )
+            hashed += 1
+    db.session.commit()
+    return hashed
+
+
+def _on_product_changed(sender):
+    # No SQL inside a commit hook; the next lookup syncs
+    duplicate_index.dirty = True
+
+
+def _serialize(product):
+    return {'id': product.id, 'title': product.title, 'seller_id': product.seller_id,
+            'image': product.image, 'is_active': product.is_active, 'is_sold': product.is_sold,
+            'created_at': product.created_at.isoformat() if product.created_at else None}
+
+
+def clusters_view():
+    """Moderators: near-duplicate clusters with their listings, largest first"""
+    if not current_app.config['IMAGE_HASH_ENABLED']:
+        return {'clusters': []}
+    max_distance = min(request.args.get('distance', current_app.config['IMAGE_HASH_MAX_DISTANCE'], type=int), 16)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    duplicate_index.ensure_current()
+    clusters = duplicate_index.clusters(max_distance)[:limit]
+    ids = [product_id for group in clusters for product_id in group]
+    products = {}
+    for start in range(0, len(ids), 500):
+        products.update((product.id, product) for product in Product.query.filter(Product.id.in_(ids[start:start + 500])))
+    return {
+        'max_distance': max_distance,
+        'clusters': [{'size': len(group), 'sellers': len({products[product_id].seller_id for product_id in group
+                                                          if product_id in products}),
+                      'products': [_serialize(products[product_id]) for product_id in group if product_id in products]}
+                     for group in clusters],
+    }
+
+
+def init_app(app):
+    app.config.setdefault('IMAGE_HASH_ENABLED', True)
+    app.config.setdefault('IMAGE_HASH_MAX_DISTANCE', 6)
+    app.config.setdefault('IMAGE_HASH_SYNC_INTERVAL', 60)
+    app.config.setdefault('IMAGE_HASH_BACKFILL_INTERVAL', 600)
+    app.config.setdefault('IMAGE_HASH_BACKFILL_BATCH_SIZE', 200)
+    product_changed.connect(_on_product_changed, weak=False)
+
+    from app.auth.admin import admin_required
+    app.add_url_rule('/admin/duplicates', 'duplicates', admin_required(clusters_view))
+
+    @app.cli.command('duplicates')
+    @click.option('--distance', type=int, help='max differing bits (default IMAGE_HASH_MAX_DISTANCE)')
+    @click.option('--backfill', 'run_backfill', is_flag=True, help='hash every unhashed upload first')
+    def duplicates_command(distance, run_backfill):
+        """Print groups of listings that share a near-identical photo"""
+        if run_backfill:
+            _backfill['last_id'] = 0
+            while True:
+                backfill()
+                if not _backfill['last_id']:
+                    break
+        start = time.perf_counter()
+        duplicate_index.rebuild()
+        clusters = duplicate_index.clusters(distance)
+        click.echo(f"{duplicate_index.stats()} - {len(clusters)} clusters "
+                   f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+        for group in clusters:
+            click.echo(' '.join(str(product_id) for product_id in group))
@@ -0,0 +1,95 @@
+# app/expiry.py
+"""Listing expiry: live listings come down LISTING_TTL_DAYS after going live.
+
+The listing-expiry job deactivates expired listings in set-based batches and
+tells each seller with one bulk insert of notifications per batch. Sellers
+renew with one click (renew_products), which puts the listing back up as it
+was - same images and details - with a fresh expiry date.
+"""
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Product, Notification
+from app.scheduler import scheduler
+
+
+def listing_expiry(now=None):
+    """When a listing going live now should expire"""
+    return (now or datetime.utcnow()) + timedelta(days=current_app.config['LISTING_TTL_DAYS'])
+
+
+def renewable(condition=None):
+    """Expired (not sold, not merely unpaid) listings, optionally narrowed"""
+    query = Product.query.filter(
+        Product.is_active == False,
+        Product.is_sold == False,
+        Product.expires_at <= datetime.utcnow(),
+    )
+    return query.filter(condition) if condition is not None else query
+
+
+def renew_products(seller_id, product_ids):
+    """Put a seller's expired listings back up; returns how many were renewed (not committed)"""
+    now = datetime.utcnow()
+    return renewable(db.and_(Product.seller_id == seller_id, Product.id.in_(product_ids)))\
+        .update({'is_active': True, 'expires_at': listing_expiry(now), 'updated_at': now},
+                synchronize_session=False)
+
+
+def backfill_expiry(now):
+    """Give live listings from before expiry existed a date, at least the grace period away"""
+    config = current_app.config
+    grace = now + timedelta(days=config['LISTING_EXPIRY_GRACE_DAYS'])
+    return Product.query.filter(Product.expires_at.is_(None), Product.is_active == True, Product.is_sold == False)\
+        .update({'expires_at': db.func.max(
+            db.func.datetime(Product.created_at, f"+{int(config['LISTING_TTL_DAYS'])} days"),
+            db.func.datetime(grace),
+        )}, synchronize_session=False)
+
+
+@scheduler.job('listing-expiry', 'LISTING_EXPIRY_INTERVAL', 900)
+def expire_listings():
+    """Deactivate expired listings and notify their sellers; returns listings expired"""
+    config = current_app.config
+    batch_size = config['LISTING_EXPIRY_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    if backfill_expiry(now):
+        db.session.commit()
+
+    expired = 0
+    while True:
+        batch = db.session.execute(
+            db.select(Product.id, Product.seller_id, Product.title)
+            .where(Product.is_active == True, Product.is_sold == False, Product.expires_at <= now)
+            .order_by(Product.expires_at)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+
+        ids = [product_id for product_id, _, _ in batch]
+        Product.query.filter(Product.id.in_(ids), Product.is_active == True)\
+            .update({'is_active': False, 'updated_at': now}, synchronize_session=False)
+        db.session.execute(Notification.__table__.insert(), [
+            {
+                'user_id': seller_id,
+                'product_id': product_id,
+                'kind': 'expired',
+                'message': f"Your listing '{title}' has expired and is no longer shown to buyers. "
+                           f"Renew it to put it back up for another {config['LISTING_TTL_DAYS']} days.",
+                'is_read': False,
+                'created_at': now,
+            }
+            for product_id, seller_id, title in batch
+        ])
+        db.session.commit()
+        expired += len(batch)
+        if len(batch) < batch_size:
+            break
+        time.sleep(config['LISTING_EXPIRY_BATCH_PAUSE'])
+
+    if expired:
+        current_app.logger.info(f"Expired {expired} listings")
+    return expired
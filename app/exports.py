@@ -0,0 +1,182 @@
+# app/exports.py
+"""Streaming CSV / NDJSON exports of payments and unlocks, for reconciling
+against M-Pesa statements.
+
+Rows are read in keyset chunks of EXPORT_CHUNK_SIZE (id > last id), each one
+a short read transaction that ends before the chunk is written out. Memory
+stays at one chunk whatever the row count, and a slow download never holds
+SQLite's read lock - which, without WAL, would block every writer - for
+longer than one chunk takes to read. Archived rows follow the live ones.
+
+    GET /admin/exports/payments?format=csv&since=2026-01-01&until=2026-02-01&status=completed
+    flask export unlocks --format ndjson --receipt QFT12ABC34,QFT56DEF78 -o unlocks.ndjson
+"""
+import csv
+import io
+import json
+from datetime import datetime, date
+import click
+from flask import Response, current_app, request, stream_with_context, abort
+from app import db
+from app.auth.admin import admin_required
+from app.models import Payment, ProductUnlock
+
+# kind -> (model, exported columns)
+EXPORTS = {
+    'payments': (Payment, ('id', 'product_id', 'user_id', 'amount', 'phone_number', 'checkout_request_id',
+                           'merchant_request_id', 'mpesa_receipt_number', 'status', 'transaction_date',
+                           'created_at', 'completed_at')),
+    'unlocks': (ProductUnlock, ('id', 'product_id', 'user_id', 'seller_id', 'amount', 'phone_number',
+                                'checkout_request_id', 'merchant_request_id', 'mpesa_receipt_number', 'status',
+                                'created_at', 'completed_at')),
+}
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+STATUSES = ('pending', 'completed', 'failed')
+
+
+class ExportFilters:
+    """Date range (on completed_at, else created_at), statuses and receipt numbers"""
+
+    def __init__(self, since=None, until=None, statuses=None, receipts=None):
+        self.since = since
+        self.until = until
+        self.statuses = statuses or []
+        self.receipts = receipts or []
+
+    @classmethod
+    def parse(cls, since=None, until=None, status=None, receipt=None):
+        """From query-string style values; ValueError on bad input"""
+        statuses = _split(status)
+        unknown = [value for value in statuses if value not in STATUSES]
+        if unknown:
+            raise ValueError(f"unknown status {', '.join(unknown)}; use {', '.join(STATUSES)}")
+        return cls(
+            since=_parse_date(since),
+            until=_parse_date(until),
+            statuses=statuses,
+            receipts=[value.upper() for value in _split(receipt)],
+        )
+
+    def conditions(self, table):
+        conditions = []
+        when = db.func.coalesce(table.c.completed_at, table.c.created_at)
+        if self.since:
+            conditions.append(when >= self.since)
+        if self.until:
+            conditions.append(when < self.until)
+        if self.statuses:
+            conditions.append(table.c.status.in_(self.statuses))
+        if self.receipts:
+            conditions.append(db.func.upper(table.c.mpesa_receipt_number).in_(self.receipts))
+        return conditions
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}; use YYYY-MM-DD or an ISO timestamp")
+
+
+def _tables(model):
+    tables = [(model.__table__, False)]
+    if current_app.config['ARCHIVE_ENABLED']:
+        from app.archive import archive_tables
+        tables.append((archive_tables[model], True))
+    return tables
+
+
+def iter_rows(kind, filters, chunk_size=None):
+    """Export rows as tuples (columns..., archived), one short read per chunk"""
+    model, columns = EXPORTS[kind]
+    chunk_size = chunk_size or current_app.config['EXPORT_CHUNK_SIZE']
+    for table, archived in _tables(model):
+        last_id = 0
+        while True:
+            query = db.select(*[table.c[name] for name in columns])\
+                .where(table.c.id > last_id, *filters.conditions(table))\
+                .order_by(table.c.id).limit(chunk_size)
+            chunk = db.session.execute(query).all()
+            # End the read transaction before handing rows to a possibly slow client
+            db.session.rollback()
+            for row in chunk:
+                yield tuple(row) + (archived,)
+            if len(chunk) < chunk_size:
+                break
+            last_id = chunk[-1][0]
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def render(kind, filters, fmt):
+    """The export as an iterator of text pieces, one per chunk of rows"""
+    header = EXPORTS[kind][1] + ('archived',)
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(header)
+
+    for count, row in enumerate(iter_rows(kind, filters, chunk_size), 1):
+        if writer:
+            writer.writerow(['' if value is None else _value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(header, map(_value, row)))) + '\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@admin_required
+def export_view(kind):
+    if kind not in EXPORTS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return {'success': False, 'message': f"format must be one of {', '.join(FORMATS)}"}, 400
+    try:
+        filters = ExportFilters.parse(request.args.get('since'), request.args.get('until'),
+                                      request.args.get('status'), request.args.get('receipt'))
+    except ValueError as e:
+        return {'success': False, 'message': str(e)}, 400
+
+    current_app.logger.info(f"Export of {kind} ({fmt}) started")
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(stream_with_context(render(kind, filters, fmt)), mimetype=FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+    })
+
+
+def init_app(app):
+    app.config.setdefault('EXPORT_CHUNK_SIZE', 1000)
+    app.add_url_rule('/admin/exports/<kind>', 'export', export_view)
+
+    @app.cli.command('export')
+    @click.argument('kind', type=click.Choice(list(EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+    @click.option('--since', help='YYYY-MM-DD, inclusive (completed_at, else created_at)')
+    @click.option('--until', help='YYYY-MM-DD, exclusive')
+    @click.option('--status', help='comma separated: pending, completed, failed')
+    @click.option('--receipt', help='comma separated M-Pesa receipt numbers')
+    @click.option('-o', '--output', type=click.File('w'), default='-')
+    def export_command(kind, fmt, since, until, status, receipt, output):
+        """Write payments or unlocks for reconciliation to a file or stdout"""
+        try:
+            filters = ExportFilters.parse(since, until, status, receipt)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        for piece in render(kind, filters, fmt):
+            output.write(piece)
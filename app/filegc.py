@@ -0,0 +1,117 @@
+# app/filegc.py
+import os
+import time
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Product, ProductImage, PendingFileDeletion
+from app.archive import archive_tables
+from app.scheduler import scheduler
+
+# Give up on a file after this many failed unlinks (it stays in the table for a human)
+MAX_ATTEMPTS = 5
+
+
+def schedule_deletion(filename, reason):
+    """Queue an upload for deletion as part of the caller's transaction.
+
+    Nothing touches the disk here: if the transaction rolls back, so does the
+    queue entry, and the file is still there for the row that references it.
+    """
+    if filename:
+        db.session.add(PendingFileDeletion(filename=filename, reason=reason))
+
+
+def referenced_filenames(filenames=None):
+    """Upload filenames still referenced by a product's cover or gallery, live or archived"""
+    columns = [Product.__table__.c.image, ProductImage.__table__.c.filename]
+    if current_app.config['ARCHIVE_ENABLED']:
+        columns += [archive_tables[Product].c.image, archive_tables[ProductImage].c.filename]
+    queries = []
+    for column in columns:
+        query = db.select(column).where(column.isnot(None))
+        if filenames is not None:
+            query = query.where(column.in_(filenames))
+        queries.append(query)
+    return set(db.session.execute(db.union(*queries)).scalars())
+
+
+@scheduler.job('file-sweep', 'FILEGC_SWEEP_INTERVAL', 60)
+def sweep(batch_size=None):
+    """Unlink queued files in batches; returns the number of entries cleared"""
+    batch_size = batch_size or current_app.config.get('FILEGC_BATCH_SIZE', 200)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    cleared = 0
+    last_id = 0
+
+    while True:
+        batch = PendingFileDeletion.query.filter(
+            PendingFileDeletion.id > last_id,
+            PendingFileDeletion.attempts < MAX_ATTEMPTS
+        ).order_by(PendingFileDeletion.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        # A newer upload may have reused the name (edit keeps the original filename)
+        still_used = referenced_filenames([entry.filename for entry in batch])
+        done_ids = []
+        for entry in batch:
+            if entry.filename in still_used:
+                done_ids.append(entry.id)
+                continue
+            path = os.path.join(upload_folder, entry.filename)
+            try:
+                os.remove(path)
+                done_ids.append(entry.id)
+            except FileNotFoundError:
+                done_ids.append(entry.id)
+            except OSError as e:
+                entry.attempts += 1
+                entry.last_error = str(e)[:200]
+                current_app.logger.warning(f"⚠️ Could not remove image file {entry.filename}: {e}")
+
+        if done_ids:
+            PendingFileDeletion.query.filter(PendingFileDeletion.id.in_(done_ids))\
+                .delete(synchronize_session=False)
+        db.session.commit()
+        cleared += len(done_ids)
+        if len(batch) < batch_size:
+            break
+
+    return cleared
+
+
+@scheduler.job('file-reconcile', 'FILEGC_RECONCILE_INTERVAL', 6 * 3600)
+def reconcile(grace_seconds=None):
+    """Queue uploads no product references (abandoned or failed listings)
+
+    Files younger than the grace period are skipped: a listing's image is saved
+    before its product row commits.
+    """
+    grace_seconds = grace_seconds if grace_seconds is not None else \
+        current_app.config.get('FILEGC_GRACE_SECONDS', 24 * 3600)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(upload_folder):
+        return 0
+
+    cutoff = time.time() - grace_seconds
+    referenced = referenced_filenames()
+    pending = set(db.session.execute(db.select(PendingFileDeletion.filename)).scalars())
+
+    orphans = []
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name in referenced or entry.name in pending:
+                continue
+            if entry.stat().st_mtime < cutoff:
+                orphans.append(entry.name)
+
+    if orphans:
+        now = datetime.utcnow()
+        db.session.execute(PendingFileDeletion.__table__.insert(), [
+            {'filename': name, 'reason': 'orphaned', 'attempts': 0, 'created_at': now} for name in orphans
+        ])
+        db.session.commit()
+        current_app.logger.info(f"Queued {len(orphans)} orphaned uploads for deletion")
+    return len(orphans)
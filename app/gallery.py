@@ -0,0 +1,159 @@
+# app/gallery.py
+"""Listing photo galleries: several ordered images per product.
+
+Every upload is saved under a random name and gets a ProductImage row with its
+size and a placeholder - the photo shrunk to PLACEHOLDER_SIZE pixels across and
+inlined as a data: URI of a hundred-odd bytes. Templates paint the placeholder
+as the <img> background and let the browser fetch the real file lazily
+(loading="lazy", with width and height so nothing shifts), so a page of cards
+renders at once and only the photos scrolled into view are downloaded.
+
+Position 0 is the cover. Product.image, image_placeholder and the cover size
+are copies of it, so listing pages don't join the gallery. Products listed
+before galleries existed get their row from a background job.
+"""
+import base64
+import io
+import os
+import uuid
+from flask import current_app
+from app import db
+from app.models import Product, ProductImage
+from app.scheduler import scheduler
+from app.filegc import schedule_deletion
+from app.duplicates import hash_upload
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Width of the inline placeholder; the browser's upscaling does the blurring
+PLACEHOLDER_SIZE = 16
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def describe(path):
+    """(width, height, placeholder) of an image file, as the browser will show it; Nones if it can't be read"""
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                # Phone photos stored sideways; browsers apply the EXIF rotation
+                width, height = height, width
+            # JPEGs decode straight to a small copy instead of full size
+            image.draft('RGB', (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+            small = ImageOps.exif_transpose(image).convert('RGB')
+            small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        current_app.logger.warning(f"Could not read image {path}: {e}")
+        return None, None, None
+
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        small.save(buffer, 'WEBP', quality=40)
+        mimetype = 'image/webp'
+    else:
+        small.save(buffer, 'PNG', optimize=True)
+        mimetype = 'image/png'
+    return width, height, f"data:{mimetype};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+def save_uploads(files):
+    """Save the allowed files among uploads, up to PRODUCT_MAX_IMAGES, in order; returns ProductImage rows"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    images = []
+    for file in files:
+        if len(images) >= current_app.config['PRODUCT_MAX_IMAGES']:
+            break
+        if not file or not file.filename or not allowed_file(file.filename):
+            continue
+        filename = f"{uuid.uuid4().hex}.{file.filename.rsplit('.', 1)[1].lower()}"
+        path = os.path.join(upload_folder, filename)
+        file.save(path)
+        width, height, placeholder = describe(path)
+        images.append(ProductImage(filename=filename, width=width, height=height, placeholder=placeholder))
+    return images
+
+
+def set_gallery(product, images, reason='replaced'):
+    """Make images the product's gallery in order and update the cover copies.
+
+    Files of the images being replaced are queued for deletion in the caller's
+    transaction, like any other replaced upload.
+    """
+    kept = {image.filename for image in images}
+    old = {image.filename for image in product.images}
+    if product.image:
+        old.add(product.image)
+    for filename in old - kept:
+        schedule_deletion(filename, reason)
+
+    for position, image in enumerate(images):
+        image.position = position
+    product.images = images
+    cover = images[0] if images else None
+    product.image = cover.filename if cover else None
+    product.image_placeholder = cover.placeholder if cover else None
+    product.image_width = cover.width if cover else None
+    product.image_height = cover.height if cover else None
+    product.image_hash = hash_upload(product.image)
+
+
+def gallery_filenames(product_ids):
+    """Every upload belonging to the products: gallery files and covers"""
+    filenames = set()
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        filenames.update(db.session.execute(
+            db.select(ProductImage.filename).where(ProductImage.product_id.in_(chunk))
+        ).scalars())
+        filenames.update(db.session.execute(
+            db.select(Product.image).where(Product.id.in_(chunk), Product.image.isnot(None))
+        ).scalars())
+    return filenames
+
+
+_backfill = {'last_id': 0}
+
+
+@scheduler.job('gallery-backfill', 'GALLERY_BACKFILL_INTERVAL', 600)
+def backfill(batch_size=None):
+    """Give single-image products from before galleries their cover row; returns how many were filled in"""
+    batch_size = batch_size or current_app.config['GALLERY_BACKFILL_BATCH_SIZE']
+    has_gallery = db.select(ProductImage.id).where(ProductImage.product_id == Product.id).exists()
+    rows = db.session.execute(
+        db.select(Product.id, Product.image)
+        .where(Product.image.isnot(None), ~has_gallery, Product.id > _backfill['last_id'])
+        .order_by(Product.id).limit(batch_size)
+    ).all()
+    # Missing or unreadable files are skipped until the next pass over the table
+    _backfill['last_id'] = rows[-1].id if len(rows) == batch_size else 0
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filled = 0
+    for product_id, filename in rows:
+        path = os.path.join(upload_folder, filename)
+        if not os.path.isfile(path):
+            continue
+        width, height, placeholder = describe(path)
+        if placeholder is None:
+            continue
+        db.session.add(ProductImage(product_id=product_id, position=0, filename=filename,
+                                    width=width, height=height, placeholder=placeholder))
+        # Not an edit: leave updated_at (and every cached page keyed on it) alone
+        db.session.execute(
+            db.update(Product).where(Product.id == product_id)
+            .values(image_placeholder=placeholder, image_width=width, image_height=height,
+                    updated_at=Product.updated_at)
+        )
+        filled += 1
+    db.session.commit()
+    return filled
+
+
+def init_app(app):
+    app.config.setdefault('PRODUCT_MAX_IMAGES', 8)
+    app.config.setdefault('GALLERY_BACKFILL_INTERVAL', 600)
+    app.config.setdefault('GALLERY_BACKFILL_BATCH_SIZE', 200)
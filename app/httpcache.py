@@ -0,0 +1,171 @@
+# app/httpcache.py
+"""Conditional GET and response compression.
+
+Pages that only change when their data does are wrapped in @conditional with
+functions returning that data's version (a cheap aggregate query each). The
+weak ETag is a hash of the endpoint, its arguments, the user, the versions
+and the code/template revision; a matching If-None-Match is answered 304
+before the view runs. Other GET responses (status polls, detail pages) get an
+ETag from their body, which saves the transfer but not the work.
+
+Responses over COMPRESS_MIN_SIZE are gzip- or brotli-compressed (brotli when
+the package is installed and the client asks for it).
+"""
+import gzip
+import hashlib
+import os
+from functools import wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from app import db, metrics
+from app.models import Product, ProductUnlock, Notification, TrendingScore
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+NOT_MODIFIED = metrics.counter('http_not_modified_total', 'Requests answered 304 without rendering', ('endpoint',))
+
+_state = {'revision': ''}
+
+
+def catalog_version():
+    """Changes when any product is added, edited or deleted"""
+    return db.session.execute(db.select(db.func.count(Product.id), db.func.max(Product.updated_at))).one()
+
+
+def trending_version():
+    return db.session.execute(db.select(db.func.max(TrendingScore.computed_at))).scalar()
+
+
+def unlock_version():
+    """The current user's completed unlocks (they change what a product card offers)"""
+    if not current_user.is_authenticated:
+        return None
+    return db.session.execute(
+        db.select(db.func.count(ProductUnlock.id), db.func.max(ProductUnlock.id))
+        .where(ProductUnlock.user_id == current_user.id, ProductUnlock.status == 'completed')
+    ).one()
+
+
+def notification_version():
+    return db.session.execute(
+        db.select(db.func.count(Notification.id), db.func.max(Notification.id),
+                  db.func.sum(db.case((Notification.is_read == True, 1), else_=0)))
+        .where(Notification.user_id == current_user.id)
+    ).one()
+
+
+def seller_version():
+    """The current user's own listings, including view counts (flushed without touching updated_at)"""
+    return db.session.execute(
+        db.select(db.func.count(Product.id), db.func.max(Product.updated_at), db.func.sum(Product.view_count))
+        .where(Product.seller_id == current_user.id)
+    ).one()
+
+
+def _etag(versions):
+    user = current_user.get_id() if current_user.is_authenticated else '-'
+    key = repr((request.endpoint, request.full_path, user, _state['revision'], versions))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(*version_funcs):
+    """Answer 304 without running the view while version_funcs return the same values"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message isn't part of the versions, so render it
+            if not current_app.config['HTTPCACHE_ENABLED'] or request.method not in ('GET', 'HEAD') \
+                    or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            versions = tuple(func() for func in version_funcs)
+            etag = _etag(versions)
+            if request.if_none_match.contains_weak(etag):
+                NOT_MODIFIED.inc(request.endpoint)
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def _add_body_etag(response):
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough \
+            or 'ETag' in response.headers or 'Cache-Control' in response.headers:
+        return response
+    response.add_etag(weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(response):
+    config = current_app.config
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers \
+            or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(body, quality=config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        body = gzip.compress(body, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _after_request(response):
+    if request.method in ('GET', 'HEAD'):
+        if current_app.config['HTTPCACHE_ENABLED']:
+            response = _add_body_etag(response)
+        if current_app.config['COMPRESS_ENABLED']:
+            response = _compress(response)
+    return response
+
+
+def _revision(app):
+    """Newest mtime of the code and templates, so a deploy invalidates every ETag"""
+    newest = 0
+    for root, dirs, files in os.walk(app.root_path):
+        dirs[:] = [name for name in dirs if name not in ('static', '__pycache__')]
+        for name in files:
+            if name.endswith(('.py', '.html')):
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return str(int(newest))
+
+
+def init_app(app):
+    app.config.setdefault('HTTPCACHE_ENABLED', True)
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+    app.config.setdefault('COMPRESS_MIMETYPES', ['text/html', 'application/json', 'text/css',
+                                                 'application/javascript', 'text/plain'])
+
+    _state['revision'] = app.config.get('HTTPCACHE_REVISION') or _revision(app)
+    app.after_request(_after_request)
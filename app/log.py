@@ -0,0 +1,148 @@
+# app/log.py
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+# Keys whose values never leave the process, wherever they appear
+SECRET_KEYS = ('password', 'passkey', 'secret', 'consumer_key', 'authorization', 'access_token', 'token')
+
+_SECRET_PATTERNS = [
+    # "Password": "...", 'access_token': '...', passkey=... in dict/JSON/query dumps
+    (re.compile(r'''(["']?(?:%s)["']?\s*[:=]\s*)(?:"[^"]*"|'[^']*'|[^"',\s}&]+)''' % '|'.join(SECRET_KEYS),
+                re.IGNORECASE),
+     r'\1[REDACTED]'),
+    # Authorization headers anywhere else
+    (re.compile(r'(Bearer|Basic)\s+[A-Za-z0-9._~+/=-]+'), r'\1 [REDACTED]'),
+]
+
+
+def redact(text, literals=()):
+    """Scrub credentials out of a log message"""
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    for literal in literals:
+        if literal and literal in text:
+            text = text.replace(literal, '[REDACTED]')
+    return text
+
+
+class RedactFilter(logging.Filter):
+    """Merges args into the message and redacts secrets before it is queued"""
+
+    def __init__(self, literals=()):
+        super().__init__()
+        self.literals = [value for value in literals if value and len(value) >= 6]
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage(), self.literals)
+        record.args = None
+        for key in list(vars(record)):
+            if key not in _RECORD_FIELDS and any(word in key.lower() for word in SECRET_KEYS):
+                setattr(record, key, '[REDACTED]')
+        return True
+
+
+class DebugSampleFilter(logging.Filter):
+    """Keeps only a fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Defers formatting to the listener thread; only the traceback is rendered here"""
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def configure_logging(app):
+    """Route the app's loggers through a non-blocking queue"""
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_LEVELS', {})
+    app.config.setdefault('LOG_JSON', True)
+    app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', 0.1)
+
+    output = logging.StreamHandler(sys.stdout)
+    if app.config['LOG_JSON']:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s in %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(DebugSampleFilter(app.config['LOG_DEBUG_SAMPLE_RATE']))
+    handler.addFilter(RedactFilter([
+        app.config.get('MPESA_CONSUMER_KEY'),
+        app.config.get('MPESA_CONSUMER_SECRET'),
+        app.config.get('MPESA_PASSKEY'),
+        app.config.get('SECRET_KEY'),
+    ]))
+
+    global _listener
+    if _listener is not None:
+        # create_app() called again in this process (tests, scripts)
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    # app.logger is the "app" logger, so every app.* module logger sits under it
+    from flask.logging import default_handler
+    for existing in list(app.logger.handlers):
+        if existing is default_handler or isinstance(existing, _QueueHandler):
+            app.logger.removeHandler(existing)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.propagate = False
+
+    for name, level in app.config['LOG_LEVELS'].items():
+        logging.getLogger(name).setLevel(level)
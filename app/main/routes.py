@@ -2,14 +2,20 @@ from flask import Blueprint, render_template, jsonify, request, flash, redirect,
 from flask_login import login_required, current_user
 from app import db
 from app.models import Product, Category, Payment, ProductUnlock, User, Notification
+from app.trending import top_products
+from app.httpcache import conditional, catalog_version, trending_version, unlock_version, notification_version
+import logging
+
+logger = logging.getLogger(__name__)
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@conditional(catalog_version, trending_version, unlock_version)
 def index():
     # Show all active, unsold products to everyone
     all_products = Product.query.filter_by(is_active=True, is_sold=False).limit(12).all()
-    fast_moving = Product.query.filter_by(is_fast_moving=True, is_sold=False).all()
+    fast_moving = top_products()
     return render_template('main/index.html', 
                          all_products=all_products, 
                          fast_moving=fast_moving)
@@ -17,6 +23,7 @@ def index():
 # In your main_bp routes file, add these notification routes
 @main_bp.route('/notifications')
 @login_required
+@conditional(notification_version, catalog_version)
 def notification():
     """Display user notifications"""
     page = request.args.get('page', 1, type=int)
@@ -26,13 +33,8 @@ def notification():
         .order_by(Notification.created_at.desc())\
         .paginate(page=page, per_page=per_page, error_out=False)
 
-    # Debug: Print actual notification content
-    print(f"Total notifications: {notifications.total}")
-    print(f"Current page: {notifications.page}")
-    print(f"Total pages: {notifications.pages}")
-    
-    for notification in notifications.items:
-        print(f"Notification {notification.id}: {notification.message} - Read: {notification.is_read}")
+    logger.debug("Notifications for user %s: page %s of %s (%s total)",
+                 current_user.id, notifications.page, notifications.pages, notifications.total)
     
     return render_template('main/notifications.html', notifications=notifications)
 
@@ -45,7 +47,7 @@ def mark_notification_read(notification_id):
     # Ensure the notification belongs to the current user
     if notification.user_id != current_user.id:
         flash('Unauthorized access.', 'error')
-        return redirect(url_for('main.notifications'))
+        return redirect(url_for('main.notification'))
     
     notification.is_read = True
     db.session.commit()
@@ -54,7 +56,7 @@ def mark_notification_read(notification_id):
         return jsonify({'success': True})
     
     flash('Notification marked as read.', 'success')
-    return redirect(url_for('main.notifications'))
+    return redirect(url_for('main.notification'))
 
 @main_bp.route('/notifications/mark-all-read', methods=['POST'])
 @login_required
@@ -68,10 +70,11 @@ def mark_all_notifications_read():
         return jsonify({'success': True})
     
     flash('All notifications marked as read.', 'success')
-    return redirect(url_for('main.notifications'))
+    return redirect(url_for('main.notification'))
 
 @main_bp.route('/api/notifications/unread-count')
 @login_required
+@conditional(notification_version)
 def get_unread_count():
     """Get count of unread notifications (for AJAX requests)"""
     if current_user.is_authenticated:
@@ -0,0 +1,274 @@
+# app/metrics.py
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, request, has_request_context, abort
+from sqlalchemy import event
+
+# Latency buckets in seconds, roughly log-spaced from 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_string(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        # Copy under the lock: a request may be adding a label set meanwhile
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_label_string(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time when built with a callback"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_label_string(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            values = {labels: list(state) for labels, state in self._values.items()}
+        for labels, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _label_string(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _label_string(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {state[-1]}')
+            label_str = _label_string(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_str} {state[-2]}')
+            lines.append(f'{self.name}_count{label_str} {state[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering (e.g. a second create_app) returns the existing series
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+REQUEST_LATENCY = histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = histogram(
+    'http_request_sql_queries', 'SQL statements issued per request', ('endpoint',), QUERY_COUNT_BUCKETS)
+SQL_STATEMENTS = counter('sql_statements_total', 'SQL statements executed', ('endpoint',))
+SQL_SECONDS = counter('sql_seconds_total', 'Time spent executing SQL', ('endpoint',))
+OVER_BUDGET = counter('http_request_query_budget_exceeded_total', 'Requests over the SQL query budget', ('endpoint',))
+DARAJA_LATENCY = histogram('daraja_request_duration_seconds', 'Outbound Daraja call latency', ('operation', 'outcome'))
+
+_state = {'enabled': False}
+
+
+def enabled():
+    return _state['enabled']
+
+
+@contextmanager
+def daraja_timer(operation):
+    """Times one outbound Daraja call; a no-op when metrics are disabled.
+
+    Yields a dict whose 'outcome' the caller sets from the response (a 5xx
+    doesn't raise); an exception in the block is recorded as 'error'.
+    """
+    result = {'outcome': 'ok'}
+    if not _state['enabled']:
+        yield result
+        return
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result['outcome'] = 'error'
+        raise
+    finally:
+        DARAJA_LATENCY.observe(time.perf_counter() - start, operation, result['outcome'])
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0) + elapsed
+    else:
+        SQL_STATEMENTS.inc('background')
+        SQL_SECONDS.inc('background', amount=elapsed)
+
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0
+
+
+def _record_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    endpoint = _endpoint()
+    REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint, request.method, response.status_code)
+    REQUEST_QUERIES.observe(g.sql_count, endpoint)
+    SQL_STATEMENTS.inc(endpoint, amount=g.sql_count)
+    SQL_SECONDS.inc(endpoint, amount=g.sql_time)
+
+    budget = current_app.config['METRICS_QUERY_BUDGET']
+    if budget and g.sql_count > budget:
+        OVER_BUDGET.inc(endpoint)
+        current_app.logger.warning(
+            "Query budget exceeded: %s %s ran %s statements (budget %s, %.1fms in SQL)",
+            request.method, request.path, g.sql_count, budget, g.sql_time * 1000
+        )
+    return response
+
+
+def metrics_view():
+    """Scrapers send METRICS_TOKEN as a bearer token; admins can look without one"""
+    from app.auth.admin import is_admin
+    token = current_app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())) and not is_admin():
+        abort(403)
+    return current_app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app, db):
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_QUERY_BUDGET', 25)
+    app.config.setdefault('METRICS_TOKEN', None)
+
+    # When disabled nothing is hooked in at all, so the cost is zero
+    if not app.config['METRICS_ENABLED']:
+        return
+    _state['enabled'] = True
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -36,6 +36,31 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class Locality(db.Model):
+    """A campus, or a hostel on one, where sellers hand items over"""
+    __tablename__ = 'localities'
+    __table_args__ = (
+        db.UniqueConstraint('campus_key', 'hostel_key', name='uq_localities_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # As the first seller typed them
+    campus = db.Column(db.String(100))
+    hostel = db.Column(db.String(100))
+    # Lowercased with whitespace collapsed; '' when not given
+    campus_key = db.Column(db.String(100), nullable=False, default='')
+    hostel_key = db.Column(db.String(100), nullable=False, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    products = db.relationship('Product', backref='locality', lazy=True)
+
+    @property
+    def name(self):
+        return ', '.join(part for part in (self.hostel, self.campus) if part)
+
+    def __repr__(self):
+        return f'<Locality {self.name}>'
+
 class Category(db.Model):
     __tablename__ = 'categories'
     
@@ -50,6 +75,17 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Keyset pages of the live catalog, newest first or by price
+        db.Index('ix_products_live_created', 'is_active', 'is_sold', 'created_at', 'id'),
+        db.Index('ix_products_live_price', 'is_active', 'is_sold', 'price', 'id'),
+        # Background jobs pick up changed products from a watermark
+        db.Index('ix_products_updated_at', 'updated_at'),
+        # Nearby listings: one range per locality, already newest first
+        db.Index('ix_products_live_locality', 'locality_id', 'is_active', 'is_sold', 'created_at', 'id'),
+        # Never hand a deleted or archived listing's id to a new one
+        {'sqlite_autoincrement': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -61,13 +97,32 @@ class Product(db.Model):
     is_fast_moving = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     is_sold = db.Column(db.Boolean, default=False)
+    # Flushed in batches by app.viewcounts; lags real traffic by up to VIEWCOUNT_FLUSH_INTERVAL
+    view_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     Token = db.Column(db.Float, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     seller_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set when the listing goes live; the listing-expiry job deactivates it after this
+    expires_at = db.Column(db.DateTime, index=True)
+    # 64-bit dHash of the photo (signed), for app.duplicates
+    image_hash = db.Column(db.BigInteger)
+    # Cover photo's placeholder and size, copied from its ProductImage so cards need no join
+    image_placeholder = db.Column(db.Text)
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    # Seller's campus/hostel when listed, kept current by app.products.locality
+    locality_id = db.Column(db.Integer, db.ForeignKey('localities.id'))
     
+    images = db.relationship(
+        'ProductImage',
+        backref='product',
+        lazy=True,
+        order_by='ProductImage.position',
+        cascade="all, delete-orphan"
+    )
     payments = db.relationship(
         'Payment',
         backref='product',
@@ -88,6 +143,12 @@ class Product(db.Model):
         
         return unlock is not None
     
+    @property
+    def is_expired(self):
+        """Taken down by the expiry job; the seller can renew it"""
+        return not self.is_active and not self.is_sold and \
+            self.expires_at is not None and self.expires_at <= datetime.utcnow()
+
     def get_unlock_fee(self):
         """Calculate unlock fee - you can customize this logic"""
         base_fee = current_app.config.get('UNLOCK_FEE', 1)  # Default KES 20
@@ -101,6 +162,8 @@ class Product(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    # Ids stay unique across the live table and the archive
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -114,10 +177,12 @@ class Payment(db.Model):
     transaction_date = db.Column(db.DateTime)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime, index=True)
 
 class ProductUnlock(db.Model):
     __tablename__ = 'product_unlocks'
+    # Ids stay unique across the live table and the archive
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     # User who wants to unlock the product
@@ -136,8 +201,8 @@ class ProductUnlock(db.Model):
     
     # Status and timestamps
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime, index=True)
     unlocked_at = db.Column(db.DateTime)  # When they actually accessed the details
     
     # Relationships
@@ -151,11 +216,15 @@ class ProductUnlock(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    # Ids stay unique across the live table and the archive
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
-    unlock_id = db.Column(db.Integer, db.ForeignKey('product_unlocks.id'), nullable=False)
+    # Only unlock notifications have an unlock
+    unlock_id = db.Column(db.Integer, db.ForeignKey('product_unlocks.id'))
+    kind = db.Column(db.String(20), default='unlock', server_default='unlock', nullable=False)  # unlock, expired
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -166,4 +235,157 @@ class Notification(db.Model):
     unlock = db.relationship('ProductUnlock', backref=db.backref('notification', lazy=True))
 
     def __repr__(self):
-        return f'<Notification {self.id} for User {self.user_id}>'
\ No newline at end of file
+        return f'<Notification {self.id} for User {self.user_id}>'
+
+
+class PendingFileDeletion(db.Model):
+    """An upload to unlink once the transaction that orphaned it has committed"""
+    __tablename__ = 'pending_file_deletions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Path relative to UPLOAD_FOLDER
+    filename = db.Column(db.String(200), nullable=False)
+    reason = db.Column(db.String(50))  # deleted, replaced, orphaned, failed_payment
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<PendingFileDeletion {self.filename}>'
+
+
+
+class JobState(db.Model):
+    """Per-job bookkeeping for background jobs, e.g. incremental high-water marks"""
+    __tablename__ = 'job_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime)
+    last_full_run = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def get(cls, name):
+        """State row for a job, created (not committed) on first use"""
+        state = db.session.get(cls, name)
+        if state is None:
+            state = cls(name=name)
+            db.session.add(state)
+        return state
+
+    def __repr__(self):
+        return f'<JobState {self.name} @ {self.watermark}>'
+
+
+class TrendingScore(db.Model):
+    """Materialized homepage ranking, maintained by the trending-refresh job"""
+    __tablename__ = 'trending_scores'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, index=True)
+    recent_unlocks = db.Column(db.Integer, default=0, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    product = db.relationship('Product', backref=db.backref('trending', lazy=True, uselist=False,
+                                                            cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<TrendingScore {self.product_id}: {self.score:.3f}>'
+
+
+class SimilarProduct(db.Model):
+    """Precomputed neighbours of a product, maintained by the similar-products job"""
+    __tablename__ = 'similar_products'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    similar_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<SimilarProduct {self.product_id} #{self.rank} -> {self.similar_id}>'
+
+
+class ProductViewDaily(db.Model):
+    """Views per product per day, for trending and seller dashboards"""
+    __tablename__ = 'product_views_daily'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    views = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductViewDaily {self.product_id} {self.day}: {self.views}>'
+
+
+class ProductDailyStats(db.Model):
+    """Per product per day rollup for the seller dashboard, maintained by app.analytics"""
+    __tablename__ = 'product_daily_stats'
+    __table_args__ = (
+        db.Index('ix_product_daily_stats_seller_day', 'seller_id', 'day'),
+    )
+    
+    product_id = db.Column(db.Integer, primary_key=True)  # no FK: history outlives deleted listings
+    day = db.Column(db.Date, primary_key=True, index=True)
+    seller_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    views = db.Column(db.Integer, default=0, nullable=False)
+    unlocks = db.Column(db.Integer, default=0, nullable=False)
+    unlock_revenue = db.Column(db.Float, default=0, nullable=False)
+    listing_fees = db.Column(db.Float, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductDailyStats {self.product_id} {self.day}>'
+
+
+class ListingSignature(db.Model):
+    """MinHash of a listing's text, maintained by app.textdupes"""
+    __tablename__ = 'listing_signatures'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    # Closest earlier listing above TEXTDUP_THRESHOLD when this one was written
+    duplicate_of = db.Column(db.Integer, index=True)
+    similarity = db.Column(db.Float)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ListingSignature {self.product_id}>'
+
+
+class ListingBand(db.Model):
+    """LSH buckets: listings sharing a (band, bucket) are duplicate candidates"""
+    __tablename__ = 'listing_bands'
+    __table_args__ = (
+        db.Index('ix_listing_bands_product_id', 'product_id'),
+        {'sqlite_with_rowid': False},
+    )
+    
+    band = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+
+    def __repr__(self):
+        return f'<ListingBand {self.band}:{self.bucket} {self.product_id}>'
+
+
+class ProductImage(db.Model):
+    """One photo of a listing's gallery; position 0 is the cover, mirrored on Product.image"""
+    __tablename__ = 'product_images'
+    __table_args__ = (
+        db.Index('ix_product_images_product_position', 'product_id', 'position'),
+        # Ids stay unique across the live table and the archive
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    filename = db.Column(db.String(200), nullable=False, index=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    # Tiny blurred copy as a data: URI, painted until the real file loads
+    placeholder = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductImage {self.product_id}:{self.position} {self.filename}>'
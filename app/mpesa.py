@@ -1,9 +1,137 @@
 # app/mpesa.py
 import requests
 import base64
+import threading
+import time
 from datetime import datetime
-import json
+import logging
 from flask import current_app
+from app.metrics import daraja_timer, counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUERIES = counter('daraja_status_queries_total', 'Payment status lookups by how they were answered', ('source',))
+QUERIES_PER_CHECKOUT = histogram('daraja_status_queries_per_checkout', 'Upstream status queries before a checkout settled',
+                                 buckets=(1, 2, 3, 5, 10, 20, 50))
+DARAJA_REJECTED = counter('daraja_rejected_total', 'Daraja calls refused without being made', ('operation', 'reason'))
+
+
+class DarajaUnavailable(requests.exceptions.RequestException):
+    """Refused without calling Daraja: the circuit is open or too many calls are in flight"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and fails fast for `reset_after`
+    seconds, then lets one probe through (half-open): success closes it, failure
+    opens it again."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def cancel_probe(self):
+        """An allowed call never reached Daraja; let the next one probe instead"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                if self.state != self.CLOSED:
+                    logger.info("Daraja circuit closed")
+                self.state, self.failures, self._probing = self.CLOSED, 0, False
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Daraja circuit open after %s consecutive failures", self.failures)
+                self.state, self.opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+
+def _still_processing(response):
+    """stkpushquery answers HTTP 500 with this code while the customer hasn't responded yet"""
+    try:
+        return response.json().get('errorCode') == '500.001.1001'
+    except ValueError:
+        return False
+
+
+class DarajaGuard:
+    """Every outbound Daraja call in this process goes through request(): at most
+    MPESA_MAX_CONCURRENT in flight, per-operation timeouts, and a circuit breaker,
+    so a slow or failing Daraja ties up a few workers instead of all of them."""
+
+    def __init__(self):
+        self.breaker = None
+        self._slots = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _setup(self, config):
+        with self._lock:
+            if self.breaker is None:
+                self._slots = threading.BoundedSemaphore(config['MPESA_MAX_CONCURRENT'])
+                self.breaker = CircuitBreaker(config['MPESA_BREAKER_THRESHOLD'], config['MPESA_BREAKER_RESET'])
+
+    def request(self, operation, method, url, **kwargs):
+        config = current_app.config
+        if self.breaker is None:
+            self._setup(config)
+        if not self.breaker.allow():
+            DARAJA_REJECTED.inc(operation, 'circuit_open')
+            raise DarajaUnavailable('Payment service is temporarily unavailable, please try again shortly')
+        if not self._slots.acquire(timeout=config['MPESA_QUEUE_TIMEOUT']):
+            DARAJA_REJECTED.inc(operation, 'saturated')
+            self.breaker.cancel_probe()
+            raise DarajaUnavailable('Payment service is busy, please try again shortly')
+
+        with self._lock:
+            self._in_flight += 1
+        ok = False
+        try:
+            timeout = (config['MPESA_CONNECT_TIMEOUT'], config['MPESA_TIMEOUTS'].get(operation, 30))
+            with daraja_timer(operation) as timing:
+                response = requests.request(method, url, timeout=timeout, **kwargs)
+                # 4xx is our request's fault, not a sign Daraja is down
+                ok = response.status_code < 500 or _still_processing(response)
+                timing['outcome'] = 'ok' if ok else 'error'
+            return response
+        finally:
+            self.breaker.record(ok)
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def state(self):
+        """0 closed, 1 half-open, 2 open (for the gauge)"""
+        if self.breaker is None:
+            return 0
+        return {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[self.breaker.state]
+
+
+daraja = DarajaGuard()
+gauge('daraja_circuit_state', 'Daraja circuit breaker: 0 closed, 1 half-open, 2 open', callback=daraja.state)
+gauge('daraja_in_flight', 'Daraja calls in flight in this process', callback=lambda: daraja._in_flight)
+
 
 class MpesaGateway:
     def __init__(self):
@@ -18,11 +146,8 @@ class MpesaGateway:
             consumer_secret = current_app.config.get('MPESA_CONSUMER_SECRET')
             base_url = current_app.config.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
             
-            print(f"DEBUG: Consumer Key: {consumer_key}")
-            print(f"DEBUG: Consumer Secret: {consumer_secret}")
-            
             if not consumer_key or not consumer_secret:
-                print("DEBUG: Missing M-Pesa credentials")
+                logger.error("Missing M-Pesa credentials")
                 return None
             
             url = f"{base_url}/oauth/v1/generate?grant_type=client_credentials"
@@ -33,34 +158,24 @@ class MpesaGateway:
                 'Authorization': f'Basic {encoded_auth}'
             }
             
-            print(f"DEBUG: Token URL: {url}")
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            print(f"DEBUG: Token Response Status: {response.status_code}")
-            print(f"DEBUG: Token Response Headers: {dict(response.headers)}")
-            print(f"DEBUG: Token Response Text: {response.text}")
+            response = daraja.request('token', 'GET', url, headers=headers)
+            logger.debug("Token response status %s", response.status_code)
             
             response.raise_for_status()
             
             token_data = response.json()
             token = token_data.get('access_token')
             
-            if token:
-                print(f"DEBUG: Access Token Received: {token[:50]}...")
-                # Test if token is valid by making a simple API call
-                test_headers = {'Authorization': f'Bearer {token}'}
-                test_response = requests.get(f"{base_url}/oauth/v1/check", headers=test_headers, timeout=10)
-                print(f"DEBUG: Token Validation Status: {test_response.status_code}")
-            else:
-                print("DEBUG: No access token in response")
+            if not token:
+                logger.error("No access token in M-Pesa token response")
                 
             return token
             
         except requests.exceptions.RequestException as e:
-            print(f"DEBUG: Token Request Error: {str(e)}")
+            logger.error("Token request error: %s", e)
             return None
         except Exception as e:
-            print(f"DEBUG: Token General Error: {str(e)}")
+            logger.exception("Token general error: %s", e)
             return None
     
     def stk_push(self, phone_number, amount, account_reference, description):
@@ -76,9 +191,6 @@ class MpesaGateway:
             base_url = current_app.config.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
             callback_url = current_app.config.get('BASE_URL', 'http://localhost:5000')
             
-            print(f"DEBUG: Shortcode: {business_shortcode}")
-            print(f"DEBUG: Passkey: {passkey}")
-            
             if not business_shortcode or not passkey:
                 return None, "M-Pesa configuration missing"
             
@@ -108,16 +220,13 @@ class MpesaGateway:
                 'Content-Type': 'application/json'
             }
             
-            # Use the exact URL from working example
-            url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-            print(f"DEBUG: STK Push URL: {url}")
-            print(f"DEBUG: STK Payload: {json.dumps(payload, indent=2)}")
-            print(f"DEBUG: Headers: {headers}")
+            # Same endpoint as the working example, on the configured host
+            url = f"{base_url}/mpesa/stkpush/v1/processrequest"
+            logger.debug("STK push to %s for %s, reference %s", url, phone_number, account_reference)
             
             # Send request EXACTLY like the working example
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
-            print(f"DEBUG: STK Response Status: {response.status_code}")
-            print(f"DEBUG: STK Response Text: {response.text}")
+            response = daraja.request('stk_push', 'POST', url, json=payload, headers=headers)
+            logger.debug("STK response %s: %s", response.status_code, response.text)
             
             response.raise_for_status()
             
@@ -130,10 +239,10 @@ class MpesaGateway:
                 return result, f"STK push failed: {error_message}"
             
         except requests.exceptions.RequestException as e:
-            print(f"DEBUG: STK Request Error: {str(e)}")
+            logger.error("STK request error: %s", e)
             return None, f"Network error: {str(e)}"
         except Exception as e:
-            print(f"DEBUG: STK General Error: {str(e)}")
+            logger.exception("STK general error: %s", e)
             return None, str(e)
     def stk_push1(self, phone_number, amount, account_reference, description):
         """Initiate STK push for payment"""
@@ -148,9 +257,6 @@ class MpesaGateway:
             base_url = current_app.config.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
             callback_url = current_app.config.get('BASE_URL', 'http://localhost:5000')
             
-            print(f"DEBUG: Shortcode: {business_shortcode}")
-            print(f"DEBUG: Passkey: {passkey}")
-            
             if not business_shortcode or not passkey:
                 return None, "M-Pesa configuration missing"
             
@@ -180,16 +286,13 @@ class MpesaGateway:
                 'Content-Type': 'application/json'
             }
             
-            # Use the exact URL from working example
-            url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-            print(f"DEBUG: STK Push URL: {url}")
-            print(f"DEBUG: STK Payload: {json.dumps(payload, indent=2)}")
-            print(f"DEBUG: Headers: {headers}")
+            # Same endpoint as the working example, on the configured host
+            url = f"{base_url}/mpesa/stkpush/v1/processrequest"
+            logger.debug("STK push to %s for %s, reference %s", url, phone_number, account_reference)
             
             # Send request EXACTLY like the working example
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
-            print(f"DEBUG: STK Response Status: {response.status_code}")
-            print(f"DEBUG: STK Response Text: {response.text}")
+            response = daraja.request('stk_push', 'POST', url, json=payload, headers=headers)
+            logger.debug("STK response %s: %s", response.status_code, response.text)
             
             response.raise_for_status()
             
@@ -202,10 +305,10 @@ class MpesaGateway:
                 return result, f"STK push failed: {error_message}"
             
         except requests.exceptions.RequestException as e:
-            print(f"DEBUG: STK Request Error: {str(e)}")
+            logger.error("STK request error: %s", e)
             return None, f"Network error: {str(e)}"
         except Exception as e:
-            print(f"DEBUG: STK General Error: {str(e)}")
+            logger.exception("STK general error: %s", e)
             return None, str(e)
     
     def check_transaction_status(self, checkout_request_id):
@@ -238,12 +341,90 @@ class MpesaGateway:
             }
             
             url = f"{base_url}/mpesa/stkpushquery/v1/query"
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = daraja.request('status_query', 'POST', url, json=payload, headers=headers)
             response.raise_for_status()
             
             return response.json()
             
         except Exception as e:
-            print(f"DEBUG: Status Check Error: {str(e)}")
+            logger.error("Status check error: %s", e)
             return None
-            
\ No newline at end of file
+            
+
+class StatusQueries:
+    """Coalesced, briefly cached stkpushquery lookups, per process.
+
+    Concurrent polls for one checkout share a single upstream call. Answers
+    without a ResultCode (still processing, or the query failed) are reused
+    for MPESA_STATUS_CACHE_TTL seconds. Final answers are kept until forget()
+    - called once the local row records the outcome - or MPESA_STATUS_FINAL_TTL.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._cache = {}      # checkout id -> (expires, result)
+        self._inflight = {}   # checkout id -> Event set when the upstream call returns
+        self._calls = {}      # checkout id -> upstream calls so far
+        self._lock = threading.Lock()
+
+    def query(self, checkout_request_id, gateway=None):
+        while True:
+            with self._lock:
+                entry = self._cache.get(checkout_request_id)
+                if entry and entry[0] > time.monotonic():
+                    STATUS_QUERIES.inc('cached')
+                    return entry[1]
+                done = self._inflight.get(checkout_request_id)
+                if done is None:
+                    done = self._inflight[checkout_request_id] = threading.Event()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                STATUS_QUERIES.inc('coalesced')
+                # The leader always caches before it sets the event; loop to read it
+                done.wait(current_app.config['MPESA_STATUS_WAIT_TIMEOUT'])
+                if done.is_set():
+                    continue
+                return None
+
+            try:
+                STATUS_QUERIES.inc('upstream')
+                result = (gateway or MpesaGateway()).check_transaction_status(checkout_request_id)
+                final = bool(result) and 'ResultCode' in result
+                ttl = current_app.config['MPESA_STATUS_FINAL_TTL' if final else 'MPESA_STATUS_CACHE_TTL']
+                with self._lock:
+                    if len(self._cache) >= self.max_entries:
+                        self._prune()
+                    self._cache[checkout_request_id] = (time.monotonic() + ttl, result)
+                    self._calls[checkout_request_id] = self._calls.get(checkout_request_id, 0) + 1
+                return result
+            finally:
+                with self._lock:
+                    self._inflight.pop(checkout_request_id, None)
+                done.set()
+
+    def forget(self, checkout_request_id):
+        """The local row now has the outcome; drop the cached answer and record the call count"""
+        with self._lock:
+            self._cache.pop(checkout_request_id, None)
+            calls = self._calls.pop(checkout_request_id, None)
+        if calls is not None:
+            QUERIES_PER_CHECKOUT.observe(calls)
+            logger.debug("Checkout %s settled after %s status queries", checkout_request_id, calls)
+
+    def calls(self, checkout_request_id):
+        return self._calls.get(checkout_request_id, 0)
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+            self._calls.pop(key, None)
+        if len(self._cache) >= self.max_entries:
+            self._cache.clear()
+            self._calls.clear()
+
+
+status_queries = StatusQueries()
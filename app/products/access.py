@@ -0,0 +1,92 @@
+# app/products/access.py
+"""Who may see a product's seller contact details.
+
+The seller always may; anyone else needs a completed ProductUnlock. Once
+we've seen one, the buyer's session carries a signed capability listing the
+products they've unlocked (with their user id, and expiring after
+UNLOCK_CAPABILITY_MAX_AGE), so later contact-page views are answered
+without a query. A product missing from the capability - or a capability
+that's missing, expired, tampered with or someone else's - falls back to the
+database, and a hit there adds the product to a fresh capability.
+
+A capability only ever grants access that the database granted first. Each
+entry is the product's id together with its created_at, so it stops
+matching if the listing is deleted and a database from before ids were
+AUTOINCREMENT gives that id to a new one. An unlock removed with its
+listing is the only other way access is lost.
+"""
+import calendar
+from datetime import datetime
+from flask import current_app, session
+from flask_login import current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from app import db, metrics
+from app.models import ProductUnlock
+
+SESSION_KEY = 'unlocks'
+
+ACCESS_CHECKS = metrics.counter('unlock_access_checks_total', 'Contact access checks by how they were answered',
+                                ('source',))
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='unlock-capability')
+
+
+def _key(product):
+    """What a capability holds for a product: its id and when it was listed"""
+    created = calendar.timegm(product.created_at.utctimetuple()) if product.created_at else 0
+    return (product.id, created)
+
+
+def capability_keys(user=None):
+    """Product keys in the session's capability, or an empty set if it isn't valid for user"""
+    user = user or current_user
+    token = session.get(SESSION_KEY)
+    if not token:
+        return set()
+    try:
+        payload = _serializer().loads(token, max_age=current_app.config['UNLOCK_CAPABILITY_MAX_AGE'])
+    except BadSignature:  # includes SignatureExpired
+        return set()
+    if payload.get('u') != user.id:
+        return set()
+    return {tuple(key) for key in payload.get('k', ())}
+
+
+def grant(products, user=None):
+    """Add products to the session's capability and re-sign it"""
+    user = user or current_user
+    keys = capability_keys(user) | {_key(product) for product in products}
+    # Session cookies are capped at 4KB; keep the highest (newest) ids
+    keys = sorted(keys)[-current_app.config['UNLOCK_CAPABILITY_MAX_IDS']:]
+    session[SESSION_KEY] = _serializer().dumps({'u': user.id, 'k': keys})
+
+
+def completed_unlock(product_id, user):
+    return ProductUnlock.query.filter_by(product_id=product_id, user_id=user.id, status='completed').first()
+
+
+def has_contact_access(product, user=None):
+    """True for the seller and for buyers with a completed unlock; checks the capability before the database"""
+    user = user or current_user
+    if not user.is_authenticated:
+        return False
+    if product.seller_id == user.id:
+        ACCESS_CHECKS.inc('seller')
+        return True
+    if _key(product) in capability_keys(user):
+        ACCESS_CHECKS.inc('capability')
+        return True
+
+    unlock = completed_unlock(product.id, user)
+    if unlock is None:
+        ACCESS_CHECKS.inc('denied')
+        return False
+    ACCESS_CHECKS.inc('database')
+    if not unlock.unlocked_at:
+        # First time the buyer opens what they paid for
+        unlock.unlocked_at = datetime.utcnow()
+        db.session.commit()
+    grant([product], user)
+    return True
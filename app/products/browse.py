@@ -0,0 +1,259 @@
+# app/products/browse.py
+"""Server-side browsing of the live catalog: filters, facet counts, keyset pages.
+
+Facet counts come from one grouped query over (category, condition, price
+bucket) for the live set, cached per search/price range/locality and dropped
+whenever products change; locality counts come from a second one over
+(category, condition, locality). Each facet ignores its own selection, so
+picking a category still shows how many items the other categories have.
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Product, Category, Locality
+from app.signals import product_changed
+
+SORTS = ('newest', 'price_low', 'price_high')
+
+CONDITIONS = {
+    'new': 'Brand New',
+    'like_new': 'Like New',
+    'good': 'Good',
+    'fair': 'Fair',
+    'needs_repair': 'Needs Repair',
+}
+
+
+class BrowseFilters:
+    """What the shopper asked for; built from request args"""
+
+    def __init__(self, q=None, category_id=None, condition=None, min_price=None, max_price=None, sort='newest',
+                 locality_id=None):
+        self.q = (q or '').strip() or None
+        self.category_id = category_id
+        self.condition = condition or None
+        self.min_price = min_price
+        self.max_price = max_price
+        self.sort = sort if sort in SORTS else 'newest'
+        self.locality_id = locality_id
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            q=args.get('q'),
+            category_id=args.get('category', type=int),
+            condition=args.get('condition'),
+            min_price=args.get('min_price', type=float),
+            max_price=args.get('max_price', type=float),
+            sort=args.get('sort', 'newest'),
+            locality_id=args.get('locality', type=int),
+        )
+
+    def to_args(self, **changes):
+        """Query args for a link with these filters (None drops a filter)"""
+        args = {
+            'q': self.q,
+            'category': self.category_id,
+            'condition': self.condition,
+            'min_price': self.min_price,
+            'max_price': self.max_price,
+            'sort': self.sort if self.sort != 'newest' else None,
+            'locality': self.locality_id,
+        }
+        args.update(changes)
+        return {key: value for key, value in args.items() if value is not None}
+
+    def base_conditions(self, locality=True):
+        """Filters shared by the page and the facet counts"""
+        conditions = [Product.is_active == True, Product.is_sold == False]
+        if locality and self.locality_id:
+            conditions.append(Product.locality_id == self.locality_id)
+        if self.q:
+            conditions.append(Product.title.ilike(f"%{self.q}%"))
+        if self.min_price is not None:
+            conditions.append(Product.price >= self.min_price)
+        if self.max_price is not None:
+            conditions.append(Product.price < self.max_price)
+        return conditions
+
+    def conditions(self):
+        conditions = self.base_conditions()
+        if self.category_id:
+            conditions.append(Product.category_id == self.category_id)
+        if self.condition:
+            conditions.append(Product.condition == self.condition)
+        return conditions
+
+
+class FacetCache:
+    """Grouped facet rows per (search, price range), dropped on product writes.
+
+    Other workers' writes only show up after BROWSE_FACET_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        product_changed.connect(self.clear, weak=False)
+
+    def get(self, key, ttl, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and now - entry[0] < ttl:
+            return entry[1]
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= 1000:
+                self._entries.clear()
+            self._entries[key] = (now, value)
+        return value
+
+    def clear(self, sender=None):
+        with self._lock:
+            self._entries.clear()
+
+
+facet_cache = FacetCache()
+
+
+def price_buckets():
+    """[(low, high), ...] from BROWSE_PRICE_BUCKETS edges; the last one is open-ended"""
+    edges = current_app.config['BROWSE_PRICE_BUCKETS']
+    return list(zip(edges, edges[1:] + [None]))
+
+
+def _facet_rows(filters):
+    buckets = price_buckets()
+    bucket = db.case(
+        *[(Product.price < high, index) for index, (low, high) in enumerate(buckets) if high is not None],
+        else_=len(buckets) - 1,
+    ).label('bucket')
+    query = db.select(Product.category_id, Product.condition, bucket, db.func.count())\
+        .where(*filters.base_conditions())\
+        .group_by(Product.category_id, Product.condition, bucket)
+    rows = [tuple(row) for row in db.session.execute(query)]
+    categories = db.session.execute(db.select(Category.id, Category.name).order_by(Category.name)).all()
+    return rows, [tuple(category) for category in categories]
+
+
+def _locality_rows(filters):
+    query = db.select(Product.category_id, Product.condition, Product.locality_id, db.func.count())\
+        .where(*filters.base_conditions(locality=False), Product.locality_id.isnot(None))\
+        .group_by(Product.category_id, Product.condition, Product.locality_id)
+    rows = [tuple(row) for row in db.session.execute(query)]
+    names = {locality.id: locality.name for locality in Locality.query.filter(
+        Locality.id.in_({locality_id for _, _, locality_id, _ in rows}))}
+    return rows, names
+
+
+def facets(filters):
+    """Counts per category, condition and price bucket for the current filters"""
+    key = (filters.q, filters.min_price, filters.max_price)
+    ttl = current_app.config['BROWSE_FACET_CACHE_TTL']
+    rows, categories = facet_cache.get(key + (filters.locality_id,), ttl, lambda: _facet_rows(filters))
+    locality_rows, locality_names = facet_cache.get(('localities',) + key, ttl, lambda: _locality_rows(filters))
+
+    by_category, by_condition, by_bucket, total = {}, {}, {}, 0
+    for category_id, condition, bucket, count in rows:
+        in_category = not filters.category_id or category_id == filters.category_id
+        in_condition = not filters.condition or condition == filters.condition
+        if in_condition:
+            by_category[category_id] = by_category.get(category_id, 0) + count
+        if in_category:
+            by_condition[condition] = by_condition.get(condition, 0) + count
+        if in_category and in_condition:
+            by_bucket[bucket] = by_bucket.get(bucket, 0) + count
+            total += count
+
+    by_locality = {}
+    for category_id, condition, locality_id, count in locality_rows:
+        if (not filters.category_id or category_id == filters.category_id) and \
+                (not filters.condition or condition == filters.condition):
+            by_locality[locality_id] = by_locality.get(locality_id, 0) + count
+
+    return {
+        'total': total,
+        'categories': [
+            {'id': category_id, 'name': name, 'count': by_category.get(category_id, 0)}
+            for category_id, name in categories
+        ],
+        'conditions': [
+            {'value': value, 'label': label, 'count': by_condition.get(value, 0)}
+            for value, label in CONDITIONS.items()
+        ],
+        'price_buckets': [
+            {'min': low, 'max': high, 'count': by_bucket.get(index, 0)}
+            for index, (low, high) in enumerate(price_buckets())
+        ],
+        'localities': sorted((
+            {'id': locality_id, 'name': locality_names.get(locality_id, ''), 'count': count}
+            for locality_id, count in by_locality.items()
+        ), key=lambda locality: (-locality['count'], locality['name'])),
+    }
+
+
+def sort_key(sort):
+    """(column, descending) a sort orders by; ties break on id"""
+    if sort == 'price_low':
+        return Product.price, False
+    if sort == 'price_high':
+        return Product.price, True
+    return Product.created_at, True
+
+
+def encode_cursor(value, product_id, sort):
+    """Opaque cursor for the page after the row with this sort value and id"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """(value, id) after which the next page starts; ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, product_id = json.loads(raw)
+        if cursor_sort != sort or not isinstance(product_id, int):
+            raise ValueError('cursor is for a different sort')
+        if sort == 'newest':
+            value = datetime.fromisoformat(value)
+        else:
+            value = float(value)
+    except (TypeError, ValueError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {e}")
+    return value, product_id
+
+
+def seek(query, sort, cursor=None):
+    """Order an ORM query or select for this sort and start it after cursor"""
+    column, descending = sort_key(sort)
+    if cursor:
+        value, product_id = decode_cursor(cursor, sort)
+        position = db.tuple_(column, Product.id)
+        query = query.filter(position < (value, product_id) if descending else position > (value, product_id))
+
+    if descending:
+        return query.order_by(column.desc(), Product.id.desc())
+    return query.order_by(column.asc(), Product.id.asc())
+
+
+def page(filters, cursor=None, limit=None):
+    """One page of live products and the cursor for the next (None at the end)"""
+    limit = limit or current_app.config['BROWSE_PAGE_SIZE']
+    column, _ = sort_key(filters.sort)
+    query = Product.query.options(joinedload(Product.category), joinedload(Product.seller))\
+        .filter(*filters.conditions())
+
+    products = seek(query, filters.sort, cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(products) > limit:
+        last = products[limit - 1]
+        next_cursor = encode_cursor(getattr(last, column.key), last.id, filters.sort)
+    return products[:limit], next_cursor
@@ -0,0 +1,41 @@
+# app/products/deletion.py
+"""Deleting listings along with every row that points at them.
+
+SQLite doesn't enforce the foreign keys here, so nothing else removes the
+rows that point at a listing, and reports and jobs would keep reading them.
+Deletes therefore go through delete_products(), which clears the dependent
+rows in the caller's transaction. Completed unlocks and listing fees are
+moved to the archive (deleted when it's off), so seller totals and
+reconciliation exports keep the money that was taken.
+"""
+from flask import current_app
+from app import db
+from app.models import (Product, ProductUnlock, Payment, Notification, TrendingScore, SimilarProduct,
+                        ListingSignature, ListingBand, ProductImage, ProductViewDaily)
+from app.archive import move
+from app.filegc import schedule_deletion
+from app.gallery import gallery_filenames
+
+
+def delete_products(product_ids, reason='deleted'):
+    """Delete the products and their dependent rows and queue their uploads; returns products deleted"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    filenames = gallery_filenames(product_ids)
+
+    for model in (ProductUnlock, Payment):
+        owned = model.__table__.c.product_id.in_(product_ids)
+        if current_app.config['ARCHIVE_ENABLED']:
+            move(model, db.and_(owned, model.__table__.c.status == 'completed'))
+        db.session.execute(model.__table__.delete().where(owned))
+    for model in (Notification, TrendingScore, ListingSignature, ListingBand, ProductImage,
+                  ProductViewDaily):
+        db.session.execute(model.__table__.delete().where(model.__table__.c.product_id.in_(product_ids)))
+    db.session.execute(SimilarProduct.__table__.delete().where(db.or_(
+        SimilarProduct.product_id.in_(product_ids), SimilarProduct.similar_id.in_(product_ids))))
+    deleted = Product.query.filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
+
+    for filename in filenames:
+        schedule_deletion(filename, reason)
+    return deleted
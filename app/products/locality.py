@@ -0,0 +1,129 @@
+# app/products/locality.py
+"""Where a listing can be picked up: its seller's campus and hostel.
+
+Sellers type both on the contact-details form. Every distinct pair - compared
+ignoring case and extra whitespace - is one Locality row, and each product
+carries its seller's locality_id. Products are indexed on (locality_id,
+is_active, is_sold, created_at, id), so the live listings at one locality,
+newest first, are a single range of that index: no join to users and no sort.
+A campus-wide search is one such range per hostel on the campus.
+
+locality_id is set when a listing is created and rewritten for all of a
+seller's products when they change their details. The locality-sync job
+fills it in for products listed before this existed and repairs any drift.
+"""
+from datetime import datetime
+import click
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Locality, Product, User
+from app.products.browse import seek, encode_cursor
+from app.scheduler import scheduler
+
+SCOPES = ('locality', 'campus')
+
+
+def normalize(text):
+    return ' '.join((text or '').split())[:100]
+
+
+def locality_id_for(campus, hostel, create=True):
+    """Id of the locality for this campus and hostel, added if new; None if neither is given"""
+    campus, hostel = normalize(campus), normalize(hostel)
+    campus_key, hostel_key = campus.casefold(), hostel.casefold()
+    if not campus_key and not hostel_key:
+        return None
+    query = db.select(Locality.id).where(Locality.campus_key == campus_key, Locality.hostel_key == hostel_key)
+    locality_id = db.session.execute(query).scalar()
+    if locality_id is None and create:
+        # OR IGNORE: another request may be adding the same one
+        db.session.execute(Locality.__table__.insert().prefix_with('OR IGNORE').values(
+            campus=campus or None, hostel=hostel or None, campus_key=campus_key, hostel_key=hostel_key,
+            created_at=datetime.utcnow()))
+        locality_id = db.session.execute(query).scalar()
+    return locality_id
+
+
+def user_locality_id(user, create=True):
+    return locality_id_for(user.campus_location, user.hostel_name, create)
+
+
+def assign_seller(user):
+    """Move the seller's products to their current locality, in the caller's transaction; returns rows changed"""
+    locality_id = user_locality_id(user)
+    return Product.query.filter(Product.seller_id == user.id, Product.locality_id.is_not(locality_id))\
+        .update({'locality_id': locality_id, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+
+
+def scope_ids(locality, scope):
+    """Locality ids a nearby search covers: this one, or every one on its campus"""
+    if scope == 'campus' and locality.campus_key:
+        return list(db.session.execute(
+            db.select(Locality.id).where(Locality.campus_key == locality.campus_key)
+        ).scalars())
+    return [locality.id]
+
+
+def nearby(locality, scope='locality', cursor=None, limit=None):
+    """One page of live products at the locality (or its campus), newest first, and the next cursor"""
+    limit = limit or current_app.config['BROWSE_PAGE_SIZE']
+    ids = scope_ids(locality, scope)
+    query = Product.query.options(joinedload(Product.category))\
+        .filter(Product.locality_id.in_(ids) if len(ids) > 1 else Product.locality_id == ids[0],
+                Product.is_active == True, Product.is_sold == False)
+    products = seek(query, 'newest', cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(products) > limit:
+        last = products[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id, 'newest')
+    return products[:limit], next_cursor
+
+
+def live_localities():
+    """[(id, name, live product count)] for localities with something on sale, busiest first"""
+    rows = db.session.execute(
+        db.select(Locality, db.func.count(Product.id))
+        .join(Product, Product.locality_id == Locality.id)
+        .where(Product.is_active == True, Product.is_sold == False)
+        .group_by(Locality.id)
+        .order_by(db.func.count(Product.id).desc())
+    ).all()
+    return [(locality.id, locality.name, count) for locality, count in rows]
+
+
+@scheduler.job('locality-sync', 'LOCALITY_SYNC_INTERVAL', 3600)
+def sync():
+    """Point every product at its seller's current locality; returns rows changed"""
+    sellers = db.session.execute(
+        db.select(User.id, User.campus_location, User.hostel_name)
+        .where(User.id.in_(db.select(Product.seller_id).distinct()))
+    ).all()
+    by_locality = {}
+    for user_id, campus, hostel in sellers:
+        by_locality.setdefault(locality_id_for(campus, hostel), []).append(user_id)
+
+    changed = 0
+    for locality_id, user_ids in by_locality.items():
+        for start in range(0, len(user_ids), 500):
+            # Not an edit: leave updated_at (and every cached page keyed on it) alone
+            changed += db.session.execute(
+                db.update(Product)
+                .where(Product.seller_id.in_(user_ids[start:start + 500]), Product.locality_id.is_not(locality_id))
+                .values(locality_id=locality_id, updated_at=Product.updated_at)
+            ).rowcount
+    db.session.commit()
+    return changed
+
+
+def init_app(app):
+    app.config.setdefault('LOCALITY_SYNC_INTERVAL', 3600)
+
+    @app.cli.command('localities')
+    @click.option('--sync', 'run_sync', is_flag=True, help='update every product from its seller first')
+    def localities_command(run_sync):
+        """Print localities with live listings"""
+        if run_sync:
+            click.echo(f"Updated {sync()} products")
+        for locality_id, name, count in live_localities():
+            click.echo(f"{locality_id:>6}  {count:>7}  {name}")
@@ -5,16 +5,31 @@ from datetime import datetime
 import requests
 import base64
 from werkzeug.utils import secure_filename
-from app.models import Product, Category, Payment, ProductUnlock, User, Notification
+from app.models import Product, Category, Payment, ProductUnlock, User, Notification, Locality
 
 from app import db
-from app.mpesa import MpesaGateway
+from app.mpesa import MpesaGateway, status_queries
+from app.ratelimit import limiter, current_user_id
+from app.products import browse
+from app.products.browse import BrowseFilters
+from app.similar import similar_products
+from app.viewcounts import view_counter
+from app.analytics import seller_summary
+from app.expiry import listing_expiry, renew_products
+from app.httpcache import conditional, catalog_version, unlock_version, seller_version
+from app.suggest import suggest_index
+from app.duplicates import dhash, near_duplicates, to_column
+from app.gallery import allowed_file, save_uploads, set_gallery
+from app.textdupes import index_listing
+from app.products.access import has_contact_access, grant
+from app.products import locality as localities
+from app.products.deletion import delete_products
 import uuid  # We'll create this
+import logging
 
-products_bp = Blueprint('products', __name__)
+logger = logging.getLogger(__name__)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
+products_bp = Blueprint('products', __name__)
 
 @products_bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -49,7 +64,7 @@ def handle_free_listing(request):
     token_discount = request.form.get('token_discount')
     address= request.form.get('address')
 
-    print(f'this is the adress{address}')
+    logger.debug("Free listing requested, address provided: %s", bool(address))
     categories = Category.query.all()
     if not address:
             flash('Please provide your address number', 'error')
@@ -94,15 +109,8 @@ def handle_mpesa_payment(request):
         else:  # meetup
             contact_info = "Campus meetup - contact seller for location"
         
-        # Handle image upload
-        image_filename = None
-        if 'image' in request.files:
-            file = request.files['image']
-        if file and file.filename != '' and allowed_file(file.filename):
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}.{ext}"
-            file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            image_filename = unique_filename
+        # Handle image uploads; the first is the cover
+        images = save_uploads(request.files.getlist('image'))
             ##########################
         discount = token_discount
         if token_discount == discount:
@@ -112,16 +120,18 @@ def handle_mpesa_payment(request):
                 price=price,
                 condition=condition,
                 contact_info=contact_info,
-                image=image_filename,
                 category_id=category_id,
                 is_fast_moving=is_fast_moving,
                 seller_id=current_user.id,
+                locality_id=localities.user_locality_id(current_user),
                 is_active=False,
                 Token=0  # Product not active until payment confirmed
             )
         #####################################################3
+        set_gallery(new_product, images)
         db.session.add(new_product)
         db.session.flush()  # Get the ID without committing
+        index_listing(new_product.id, title, description)
         
         # Initialize M-Pesa gateway
         mpesa = MpesaGateway()
@@ -207,6 +217,7 @@ def payment_callback():
                 product = Product.query.get(payment.product_id)
                 if product:
                     product.is_active = True
+                    product.expires_at = listing_expiry()
 
                 db.session.commit()
                 current_app.logger.info(f"✅ Payment confirmed & product {payment.product_id} activated.")
@@ -219,17 +230,18 @@ def payment_callback():
                 current_app.logger.warning(f"❌ Payment failed/cancelled for CheckoutRequestID: {checkout_request_id}")
                 product = Product.query.get(payment.product_id)
 
-                # delete product if exists and still inactive
+                # delete product (with this payment) if exists and still inactive
                 if product and not product.is_active:
-                    db.session.delete(product)
+                    delete_products([product.id], 'failed_payment')
                     current_app.logger.info(f"🗑️ Deleted inactive product ID {product.id} after failed payment.")
-
-                # delete payment record
-                db.session.delete(payment)
+                else:
+                    # delete payment record
+                    db.session.delete(payment)
                 db.session.commit()
             else:
                 current_app.logger.warning(f"⚠️ No matching payment record to clean for failed transaction.")
 
+        status_queries.forget(checkout_request_id)
         return jsonify({'ResultCode': 0, 'ResultDesc': 'Success'})
 
     except Exception as e:
@@ -252,9 +264,9 @@ def check_payment_status(checkout_request_id):
 
     elif payment.status == 'pending':
         current_app.logger.info(f"🔎 Checking M-Pesa status for {checkout_request_id}")
-        mpesa = MpesaGateway()
         try:
-            status_result = mpesa.check_transaction_status(checkout_request_id)
+            # Shared with concurrent polls for this checkout and cached briefly
+            status_result = status_queries.query(checkout_request_id)
             current_app.logger.debug(f"🔁 M-Pesa Query Response: {status_result}")
 
             if status_result and status_result.get('ResultCode') == 0:
@@ -263,7 +275,9 @@ def check_payment_status(checkout_request_id):
                 product = Product.query.get(payment.product_id)
                 if product:
                     product.is_active = True
+                    product.expires_at = listing_expiry()
                 db.session.commit()
+                status_queries.forget(checkout_request_id)
                 return jsonify({'status': 'completed', 'product_id': payment.product_id})
 
             # if user canceled or timed out
@@ -271,6 +285,7 @@ def check_payment_status(checkout_request_id):
                 current_app.logger.warning(f"❌ Payment failed or cancelled during check for {checkout_request_id}")
                 payment.status = 'failed'
                 db.session.commit()
+                status_queries.forget(checkout_request_id)
                 return jsonify({'status': 'failed'})
 
             else:
@@ -283,15 +298,175 @@ def check_payment_status(checkout_request_id):
 # Keep your existing routes (they remain the same)
 @products_bp.route('/my-products')
 @login_required
+@conditional(seller_version)
 def my_products_list():
     products = Product.query.filter_by(seller_id=current_user.id).order_by(Product.created_at.desc()).all()
     categories = Category.query.all()
     return render_template('products/my_products.html', products=products, categories=categories)
 
+@products_bp.route('/product/<int:product_id>/renew', methods=['POST'])
+@login_required
+def renew_product(product_id):
+    """Put an expired listing back up as it was, with a fresh expiry date"""
+    product = Product.query.get_or_404(product_id)
+    if product.seller_id != current_user.id:
+        flash('You can only renew your own listings.', 'error')
+        return redirect(url_for('products.my_products_list'))
+
+    if renew_products(current_user.id, [product.id]):
+        db.session.commit()
+        flash(f"'{product.title}' is live again until {listing_expiry().strftime('%b %d, %Y')}.", 'success')
+    else:
+        flash('Only expired listings can be renewed.', 'info')
+    return redirect(request.referrer or url_for('products.my_products_list'))
+
+ANALYTICS_PERIODS = (7, 30, 90)
+
+@products_bp.route('/my-products/analytics')
+@login_required
+def seller_analytics():
+    """Views, unlocks and fees per listing, from the daily rollups"""
+    days = request.args.get('days', 30, type=int)
+    if days not in ANALYTICS_PERIODS:
+        days = 30
+    summary = seller_summary(current_user.id, days)
+    return render_template('products/analytics.html', summary=summary, days=days, periods=ANALYTICS_PERIODS)
+
 @products_bp.route('/all')
+@conditional(catalog_version, unlock_version)
 def all_products():
-    products = Product.query.filter_by(is_sold=False, is_active=True).order_by(Product.created_at.desc()).all()
-    return render_template('products/all.html', products=products)
+    filters = BrowseFilters.from_args(request.args)
+    try:
+        products, next_cursor = browse.page(filters, request.args.get('cursor'))
+    except ValueError:
+        # Stale or hand-edited cursor - start again from the first page
+        products, next_cursor = browse.page(filters)
+    return render_template('products/all.html',
+                         products=products,
+                         next_cursor=next_cursor,
+                         facets=browse.facets(filters),
+                         filters=filters,
+                         unlocked_ids=unlocked_product_ids(products))
+
+@products_bp.route('/api/products/browse')
+@conditional(catalog_version)
+def browse_products_api():
+    """One page of the live catalog plus facet counts, as JSON"""
+    filters = BrowseFilters.from_args(request.args)
+    try:
+        products, next_cursor = browse.page(filters, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'products': [listing_json(product) for product in products],
+        'next_cursor': next_cursor,
+        'facets': browse.facets(filters),
+    })
+
+def listing_json(product):
+    return {
+        'id': product.id,
+        'title': product.title,
+        'price': product.price,
+        'condition': product.condition,
+        'category': product.category.name if product.category else None,
+        'image': url_for('static', filename='uploads/product_images/' + product.image) if product.image else None,
+        'image_placeholder': product.image_placeholder,
+        'created_at': product.created_at.isoformat() if product.created_at else None,
+        'url': url_for('products.view_product', product_id=product.id),
+    }
+
+@products_bp.route('/api/products/nearby')
+@conditional(catalog_version)
+def nearby_products():
+    """Live listings at a locality (default: the shopper's own), newest first, as JSON
+
+    scope=campus widens it to every hostel on the same campus.
+    """
+    locality_id = request.args.get('locality', type=int)
+    if locality_id is None and current_user.is_authenticated:
+        locality_id = localities.user_locality_id(current_user, create=False)
+    if locality_id is None:
+        return jsonify({'success': False, 'message': 'Pass locality, or set your campus in your contact details'}), 400
+    locality = db.session.get(Locality, locality_id)
+    if locality is None:
+        return jsonify({'success': False, 'message': 'Unknown locality'}), 404
+    scope = request.args.get('scope', 'locality')
+    if scope not in localities.SCOPES:
+        return jsonify({'success': False, 'message': f"scope must be one of {', '.join(localities.SCOPES)}"}), 400
+
+    try:
+        products, next_cursor = localities.nearby(locality, scope, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'locality': {'id': locality.id, 'name': locality.name, 'campus': locality.campus, 'hostel': locality.hostel},
+        'scope': scope,
+        'products': [listing_json(product) for product in products],
+        'next_cursor': next_cursor,
+    })
+
+@products_bp.route('/api/suggest')
+def suggest_titles():
+    """Typeahead for the search box, from the in-process prefix index"""
+    q = request.args.get('q', '')[:100]
+    if not current_app.config['SUGGEST_ENABLED'] or not q.strip():
+        return jsonify({'query': q, 'products': [], 'categories': []})
+
+    suggest_index.ensure_current()
+    products, categories = suggest_index.suggest(q, limit=min(request.args.get('limit', 8, type=int), 20))
+    return jsonify({
+        'query': q,
+        'products': [{'id': product_id, 'title': title,
+                      'url': url_for('products.view_product', product_id=product_id)}
+                     for product_id, title in products],
+        'categories': [{'id': category_id, 'name': name,
+                        'url': url_for('products.all_products', category=category_id)}
+                       for category_id, name in categories],
+    })
+
+@products_bp.route('/api/image-duplicates', methods=['POST'])
+@limiter.limit(account=current_user_id)
+@login_required
+def image_duplicates():
+    """Listings whose photo looks like the one about to be uploaded, for the create form's warning"""
+    file = request.files.get('image')
+    if not file or not allowed_file(file.filename or ''):
+        return jsonify({'success': False, 'message': 'Send an image as "image"'}), 400
+    if not current_app.config['IMAGE_HASH_ENABLED']:
+        return jsonify({'success': True, 'matches': []})
+
+    value = dhash(file.stream)
+    if value is None:
+        return jsonify({'success': False, 'message': 'Could not read the image'}), 400
+    matches = [(distance, product) for distance, product in near_duplicates(to_column(value))
+               if product.seller_id == current_user.id or (product.is_active and not product.is_sold)]
+    return jsonify({
+        'success': True,
+        'matches': [{
+            'id': product.id,
+            'title': product.title,
+            'distance': distance,
+            'own': product.seller_id == current_user.id,
+            'live': product.is_active and not product.is_sold,
+            'url': url_for('products.view_product', product_id=product.id),
+        } for distance, product in matches[:5]],
+    })
+
+def unlocked_product_ids(products):
+    """Ids among products the current user has unlocked, in one query"""
+    if not current_user.is_authenticated or not products:
+        return set()
+    return set(db.session.execute(
+        db.select(ProductUnlock.product_id).where(
+            ProductUnlock.user_id == current_user.id,
+            ProductUnlock.status == 'completed',
+            ProductUnlock.product_id.in_([product.id for product in products]),
+        )
+    ).scalars())
 
 @products_bp.route('/product/<int:product_id>')
 def view_product(product_id):
@@ -301,19 +476,16 @@ def view_product(product_id):
     if not current_user.is_authenticated:
         return redirect(url_for('auth.login', next=url_for('products.view_product', product_id=product_id)))
     
-    # Check if user is the seller - they get free access
-    if product.seller_id == current_user.id:
-        return render_template('products/view_product.html', product=product)
-    
-    # Check if user has unlocked this product
-    has_unlocked = product.is_unlocked_by(current_user)
-    
-    if not has_unlocked:
+    # The seller gets free access; buyers need an unlock
+    if not has_contact_access(product):
         # Redirect to unlock/payment page
         flash('Please unlock this product to view seller details', 'info')
         return redirect(url_for('products.unlock_product', product_id=product_id))
     
-    return render_template('products/view_product.html', product=product)
+    if product.seller_id != current_user.id:
+        view_counter.record(product.id)
+    return render_template('products/view_product.html', product=product, has_access=True,
+                         similar=similar_products(product))
 @products_bp.route('/payment-required/<int:product_id>')
 @login_required
 def payment_required(product_id):
@@ -337,18 +509,12 @@ def edit_product(product_id):
         product.category_id = request.form.get('category_id')
         product.is_fast_moving = bool(request.form.get('is_fast_moving'))
         
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename != '' and allowed_file(file.filename):
-                if product.image:
-                    old_image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], product.image)
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-                
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-                product.image = filename
+        # New photos replace the whole gallery; old files are unlinked by the sweeper only once this commit succeeds
+        images = save_uploads(request.files.getlist('image'))
+        if images:
+            set_gallery(product, images)
         
+        index_listing(product.id, product.title, product.description)
         db.session.commit()
         flash('Product updated successfully!', 'success')
         return redirect(url_for('products.my_products_list'))
@@ -365,17 +531,8 @@ def delete_product(product_id):
         if product.seller_id != current_user.id:
             return jsonify({'success': False, 'message': 'You can only delete your own products!'}), 403
 
-        # Handle image deletion safely
-        upload_folder = current_app.config.get('UPLOAD_FOLDER')
-        if upload_folder and product.image:
-            image_path = os.path.join(upload_folder, product.image)
-            if os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except Exception as e:
-                    current_app.logger.warning(f"⚠️ Could not remove image file: {e}")
-
-        db.session.delete(product)
+        # Images are unlinked by the sweeper only once this commit succeeds
+        delete_products([product.id])
         db.session.commit()
 
         return jsonify({'success': True, 'message': 'Product deleted successfully!'})
@@ -395,9 +552,73 @@ def mark_sold(product_id):
     
     product.is_sold = True
     db.session.commit()
-    
+
     return jsonify({'success': True, 'message': 'Product marked as sold!'})
 
+BULK_ACTIONS = ('mark_sold', 'reactivate', 'delete')
+MAX_BULK_PRODUCTS = 500
+
+@products_bp.route('/products/bulk', methods=['POST'])
+@login_required
+def bulk_update_products():
+    """Apply one action to many of the seller's products in a single transaction.
+
+    Expects JSON: {"action": "mark_sold" | "reactivate" | "delete", "ids": [1, 2, 3]}
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    try:
+        product_ids = sorted({int(product_id) for product_id in data.get('ids') or []})
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'ids must be a list of product ids'}), 400
+
+    if action not in BULK_ACTIONS:
+        return jsonify({'success': False, 'message': f"action must be one of {', '.join(BULK_ACTIONS)}"}), 400
+    if not product_ids:
+        return jsonify({'success': False, 'message': 'No products selected'}), 400
+    if len(product_ids) > MAX_BULK_PRODUCTS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BULK_PRODUCTS} products per request'}), 400
+
+    try:
+        # One query for ownership
+        owned = set(db.session.execute(
+            db.select(Product.id)
+            .where(Product.id.in_(product_ids), Product.seller_id == current_user.id)
+        ).scalars())
+        not_owned = [product_id for product_id in product_ids if product_id not in owned]
+        if not_owned:
+            return jsonify({
+                'success': False,
+                'message': 'You can only change your own products!',
+                'ids': not_owned
+            }), 403
+
+        selected = Product.query.filter(Product.id.in_(product_ids))
+        if action == 'mark_sold':
+            updated = selected.update({'is_sold': True, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        elif action == 'reactivate':
+            # Only listings whose listing fee was paid go back on the market; only
+            # those coming back get a fresh expiry, live ones keep theirs
+            paid = db.select(Payment.product_id).where(Payment.status == 'completed')
+            returning = db.and_(Product.id.in_(paid), Product.is_active == False)
+            updated = selected.update({
+                'is_sold': False,
+                'is_active': db.case((Product.id.in_(paid), True), else_=Product.is_active),
+                'expires_at': db.case((returning, listing_expiry()), else_=Product.expires_at),
+                'updated_at': datetime.utcnow(),
+            }, synchronize_session=False)
+        else:
+            updated = delete_products(product_ids)
+
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"❌ Bulk {action} error for products {product_ids}: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'message': 'Server error occurred while updating products.'}), 500
+
+    return jsonify({'success': True, 'action': action, 'updated': updated, 'ids': product_ids})
+
 @products_bp.route("/payment-pending/<checkout_request_id>")
 @login_required
 def payment_pending(checkout_request_id):
@@ -411,35 +632,32 @@ def advpayment_pending(checkout_request_id):
     return render_template("products/advert_payment_pending.html",
        checkout_request_id=checkout_request_id)
 @products_bp.route('/product/<int:product_id>/unlock', methods=['GET', 'POST'])
+@limiter.limit(account=current_user_id)
 @login_required
 def unlock_product(product_id):
     """Initiate payment to unlock product contact details"""
     product = Product.query.get_or_404(product_id)
     
-    # Check if user already unlocked this product
-    existing_unlock = ProductUnlock.query.filter_by(
-        product_id=product_id,
-        user_id=current_user.id,
-        status='completed'
-    ).first()
-    
-    if existing_unlock:
-        flash('You have already unlocked this product!', 'info')
-        return redirect(url_for('products.view_product_contact', product_id=product_id))
-    
     # Check if user is trying to unlock their own product
     if product.seller_id == current_user.id:
         flash('This is your own product! You can view the details.', 'info')
         return redirect(url_for('products.view_product_contact', product_id=product_id))
     
+    # Check if user already unlocked this product
+    if has_contact_access(product):
+        flash('You have already unlocked this product!', 'info')
+        return redirect(url_for('products.view_product_contact', product_id=product_id))
+    
     if request.method == 'POST':
         return handle_unlock_payment(request, product)
     
     # GET request - show unlock payment page
+    view_counter.record(product.id)
     unlock_fee = product.get_unlock_fee()
     return render_template('products/unlock_product.html', 
                          product=product, 
-                         unlock_fee=unlock_fee)
+                         unlock_fee=unlock_fee,
+                         similar=similar_products(product))
 
 def handle_unlock_payment(request, product):
     """Handle the unlock payment process"""
@@ -453,7 +671,6 @@ def handle_unlock_payment(request, product):
         
         # Format phone number (using simple version)
         phone_number = format_phone_number_simple(phone_number)
-        print(f"Formatted phone number: {phone_number}")  # Debug
         
         # Validate the formatted number
         if not phone_number or len(phone_number) != 12 or not phone_number.startswith('254'):
@@ -465,13 +682,12 @@ def handle_unlock_payment(request, product):
         
         # Get unlock fee
         unlock_fee = product.get_unlock_fee()
-        print(f"Unlock fee: {unlock_fee}")  # Debug
         
         # Initiate M-Pesa STK push
         account_reference = f"UNLOCK{product.id}"
         description = f"Unlock: {product.title}"
         
-        print(f"Initiating STK push for {phone_number}, amount: {unlock_fee}")  # Debug
+        logger.debug("Initiating unlock STK push for product %s, amount %s", product.id, unlock_fee)
         
         result, message = mpesa.stk_push1(
             phone_number=phone_number,
@@ -480,16 +696,13 @@ def handle_unlock_payment(request, product):
             description=description
         )
         
-        print(f"STK push result: {result}")  # Debug
-        print(f"STK push message: {message}")  # Debug
+        logger.debug("Unlock STK push result for product %s: %s", product.id, message)
         
         if result and result.get('ResponseCode') == '0':
             # Payment initiated successfully
             checkout_request_id = result.get('CheckoutRequestID')
             merchant_request_id = result.get('MerchantRequestID')
             
-            print(f"Payment initiated successfully. CheckoutRequestID: {checkout_request_id}")  # Debug
-            
             # Create pending unlock record
             unlock = ProductUnlock(
                 product_id=product.id,
@@ -514,16 +727,13 @@ def handle_unlock_payment(request, product):
         else:
             # Payment failed to initiate
             error_message = result.get('errorMessage', 'Failed to initiate payment') if result else message
-            print(f"Payment failed: {error_message}")  # Debug
+            logger.info("Unlock payment for product %s failed to start: %s", product.id, error_message)
             flash(f'Payment failed: {error_message}', 'error')
             return redirect(url_for('products.unlock_product', product_id=product.id))
             
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Unlock payment error: {str(e)}")
-        print(f"Exception in handle_unlock_payment: {str(e)}")  # Debug
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")  # Debug
+        logger.exception("Unlock payment error: %s", e)
         flash('An error occurred during payment. Please try again.', 'error')
         return redirect(url_for('products.unlock_product', product_id=product.id))
 
@@ -532,36 +742,13 @@ def handle_unlock_payment(request, product):
 def view_product_contact(product_id):
     """View seller contact details after payment"""
     product = Product.query.get_or_404(product_id)
-    seller = User.query.get(product.seller_id)
-    
-    # Check if user has unlocked this product or is the seller
-    has_access = False
-    
-    if product.seller_id == current_user.id:
-        has_access = True
-    else:
-        unlock = ProductUnlock.query.filter_by(
-            product_id=product_id,
-            user_id=current_user.id,
-            status='completed'
-        ).first()
-        has_access = unlock is not None
     
-    if not has_access:
+    # Seller, or a buyer who unlocked it (the first check also marks the unlock as accessed)
+    if not has_contact_access(product):
         flash('Please unlock this product to view seller contact details', 'error')
         return redirect(url_for('products.unlock_product', product_id=product_id))
     
-    # Mark as accessed (update unlocked_at timestamp)
-    if product.seller_id != current_user.id:
-        unlock = ProductUnlock.query.filter_by(
-            product_id=product_id,
-            user_id=current_user.id,
-            status='completed'
-        ).first()
-        if unlock and not unlock.unlocked_at:
-            unlock.unlocked_at = datetime.utcnow()
-            db.session.commit()
-    
+    seller = User.query.get(product.seller_id)
     return render_template('products/product_contact.html', 
                          product=product, 
                          seller=seller)
@@ -587,6 +774,10 @@ def check_unlock_status(checkout_request_id):
             create_unlock_notification(unlock)
             
             db.session.commit()
+        
+        if unlock.status == 'completed' and unlock.product:
+            # Contact pages can now skip the unlock lookup
+            grant([unlock.product])
             
         return jsonify({
             'status': unlock.status,
@@ -653,10 +844,8 @@ def unlock_payment_callback():
             unlock.unlocked_at = datetime.utcnow()  # Set the unlock timestamp
             unlock.transaction_date = datetime.utcnow()
             notification = create_unlock_notification(unlock)
-            if notification:
-                print(f"✅ Notification created: ID {notification.id}")
-            else:
-                print("❌ Failed to create notification")
+            if not notification:
+                logger.warning("Failed to create notification for unlock %s", unlock.id)
             current_app.logger.info(f"Product unlock completed for product {unlock.product_id}")
             return jsonify({"ResultCode": 0, "ResultDesc": "Success"})
             
@@ -746,6 +935,8 @@ def edit_contact_details(product_id):
         current_user.hostel_name = request.form.get('hostel_name')
         current_user.hostel_room = request.form.get('hostel_room')
         current_user.contact_preference = request.form.get('contact_preference')
+        # Their listings move with them in the nearby browse
+        localities.assign_seller(current_user)
         
         db.session.commit()
         
@@ -768,22 +959,11 @@ def view_buyer_contact(product_id):
                                  product=product, 
                                  seller=current_user)
         
-        # Check if buyer has unlocked this product
-        unlock = ProductUnlock.query.filter_by(
-            product_id=product_id,
-            user_id=current_user.id,
-            status='completed'
-        ).first()
-        
-        if not unlock:
+        # Check if buyer has unlocked this product (marks it as accessed the first time)
+        if not has_contact_access(product):
             flash('Please unlock this product to view seller contact details', 'error')
             return redirect(url_for('products.unlock_product', product_id=product_id))
         
-        # Mark as accessed
-        if not unlock.unlocked_at:
-            unlock.unlocked_at = datetime.utcnow()
-            db.session.commit()
-        
         # Get the seller - FIX: Make sure User model is imported
         seller = User.query.get(product.seller_id)
         if not seller:
@@ -801,24 +981,15 @@ def view_buyer_contact(product_id):
 def create_unlock_notification(product_unlock):
     """Create a notification for the seller when their product is unlocked"""
     try:
-        print(f"\n🎯 CREATING NOTIFICATION FOR UNLOCK {product_unlock.id}")
-        
         buyer = User.query.get(product_unlock.user_id)
         product = Product.query.get(product_unlock.product_id)
         seller = User.query.get(product.seller_id) if product else None
         
-        print(f"   Buyer: {buyer.id if buyer else 'None'} - {buyer.username if buyer else 'None'}")
-        print(f"   Product: {product.id if product else 'None'} - {product.title if product else 'None'}")
-        print(f"   Seller: {seller.id if seller else 'None'} - {seller.username if seller else 'None'}")
-        
-        if not buyer:
-            print("❌ Buyer not found!")
-            return None
-        if not product:
-            print("❌ Product not found!")
-            return None
-        if not seller:
-            print("❌ Seller not found!")
+        if not buyer or not product or not seller:
+            logger.warning(
+                "Cannot notify for unlock %s: buyer=%s product=%s seller=%s",
+                product_unlock.id, bool(buyer), bool(product), bool(seller)
+            )
             return None
         
         # Get current timestamp for when it was unlocked
@@ -837,18 +1008,11 @@ def create_unlock_notification(product_unlock):
         db.session.add(notification)
         db.session.commit()
         
-        print(f"✅ NOTIFICATION CREATED SUCCESSFULLY:")
-        print(f"   - ID: {notification.id}")
-        print(f"   - For seller: {seller.username} (ID: {seller.id})")
-        print(f"   - Product: {product.title}")
-        print(f"   - Buyer: {buyer.username}")
-        print(f"   - Message: {message}")
+        logger.debug("Notification %s created for seller %s (unlock %s)", notification.id, seller.id, product_unlock.id)
         
         return notification
         
     except Exception as e:
-        print(f"💥 ERROR creating notification: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error creating notification for unlock %s: %s", product_unlock.id, e)
         db.session.rollback()
         return None
\ No newline at end of file
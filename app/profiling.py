@@ -0,0 +1,184 @@
+# app/profiling.py
+import cProfile
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+import click
+from flask import current_app, g, request
+from sqlalchemy import event
+
+# Threads currently being profiled -> list of captured SQL statements.
+# Empty for every normal request, so the SQL hook is a single falsy check.
+_profiled_threads = {}
+
+
+def sign(path, expires, secret):
+    """Signature for the X-Profile header: '<expires>.<hex hmac of expires:path>'"""
+    digest = hmac.new(secret.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{digest}"
+
+
+def _valid_signature(header, path, secret, max_ttl):
+    expires, _, _ = header.partition('.')
+    now = time.time()
+    # A far-off expiry would be a key that never runs out
+    if not expires.isdigit() or not now <= int(expires) <= now + max_ttl:
+        return False
+    return hmac.compare_digest(header, sign(path, expires, secret))
+
+
+def _wants_profile():
+    header = request.headers.get('X-Profile')
+    if header:
+        # No fallback to SECRET_KEY: a guessable one would let anyone start profiles
+        secret = current_app.config['PROFILING_SECRET']
+        return bool(secret) and _valid_signature(header, request.path, secret,
+                                                 current_app.config['PROFILING_MAX_TTL'])
+    if 'profile' in request.args:
+        from app.auth.admin import is_admin
+        return is_admin()
+    return False
+
+
+class SamplingProfiler:
+    """Samples one thread's stack on a timer and counts collapsed stacks"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def write(self, path):
+        # Brendan Gregg's collapsed format - feed to flamegraph.pl or speedscope
+        with open(path + '.folded', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path + '.folded'
+
+
+class DeterministicProfiler:
+    """cProfile for the whole request; the .prof opens in snakeviz or flameprof"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path + '.prof')
+        return path + '.prof'
+
+
+def _capture_sql(conn, cursor, statement, parameters, context, executemany):
+    statements = _profiled_threads.get(threading.get_ident()) if _profiled_threads else None
+    if statements is not None:
+        statements.append({'sql': statement, 'at': time.perf_counter()})
+
+
+def _start_profile():
+    if 'X-Profile' not in request.headers and 'profile' not in request.args:
+        return
+    if not _wants_profile():
+        return
+
+    if current_app.config['PROFILING_MODE'] == 'cprofile':
+        profiler = DeterministicProfiler()
+    else:
+        profiler = SamplingProfiler(threading.get_ident(), current_app.config['PROFILING_INTERVAL'])
+    _profiled_threads[threading.get_ident()] = []
+    g.profiler = profiler
+    g.profile_start = time.perf_counter()
+    profiler.start()
+
+
+def _finish_profile(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.stop()
+    start = g.pop('profile_start')
+    elapsed = time.perf_counter() - start
+    statements = _profiled_threads.pop(threading.get_ident(), [])
+    for statement in statements:
+        statement['at_ms'] = round((statement.pop('at') - start) * 1000, 3)
+
+    out_dir = current_app.config['PROFILING_DIR']
+    os.makedirs(out_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(out_dir, name)
+    profile_file = profiler.write(path)
+
+    with open(path + '.json', 'w') as f:
+        json.dump({
+            'method': request.method,
+            'path': request.full_path,
+            'endpoint': request.endpoint,
+            'seconds': elapsed,
+            'error': repr(exc) if exc else None,
+            'profile': os.path.basename(profile_file),
+            'sql': statements,
+        }, f, indent=2)
+
+    current_app.logger.info("Profiled %s %s in %.1fms -> %s", request.method, request.path, elapsed * 1000, path)
+
+
+def init_app(app, db):
+    app.config.setdefault('PROFILING_ENABLED', False)
+    app.config.setdefault('PROFILING_MODE', 'sampling')  # or 'cprofile'
+    app.config.setdefault('PROFILING_INTERVAL', 0.002)
+    app.config.setdefault('PROFILING_SECRET', None)  # X-Profile headers are refused until this is set
+    app.config.setdefault('PROFILING_MAX_TTL', 3600)  # latest expiry a header may carry, in seconds
+    app.config.setdefault('PROFILING_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _capture_sql):
+        event.listen(engine, 'before_cursor_execute', _capture_sql)
+
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
+
+    @app.cli.command('profile-header')
+    @click.argument('path')
+    @click.option('--ttl', default=600, help='Seconds the header stays valid (at most PROFILING_MAX_TTL)')
+    def profile_header(path, ttl):
+        """Print an X-Profile header value for PATH"""
+        secret = app.config['PROFILING_SECRET']
+        if not secret:
+            raise click.ClickException('Set PROFILING_SECRET first; headers are refused without it')
+        ttl = min(ttl, app.config['PROFILING_MAX_TTL'])
+        click.echo(f"X-Profile: {sign(path, int(time.time()) + ttl, secret)}")
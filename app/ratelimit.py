@@ -0,0 +1,245 @@
+# app/ratelimit.py
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask_login import current_user
+
+# Seconds in each window we accept in rate strings like "5/minute"
+_PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+DEFAULT_RULES = {
+    # Blueprint-wide defaults for every view in the blueprint, overridden by endpoint entries below
+    'auth': {'ip': '30/minute', 'methods': ['POST']},
+    # Each login / register POST does a user lookup and a password hash
+    'auth.login': {'ip': '10/minute', 'account': '5/minute', 'methods': ['POST']},
+    'auth.register': {'ip': '5/minute', 'account': '3/minute', 'methods': ['POST']},
+    # Each unlock POST fires an STK push to the buyer's phone
+    'products.unlock_product': {'ip': '10/minute', 'account': '3/minute', 'methods': ['POST']},
+}
+
+
+def parse_rate(rate):
+    """Turn '5/minute' into (capacity, refill tokens per second)"""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    seconds = _PERIODS[period.strip().rstrip('s')]
+    return count, count / float(seconds)
+
+
+class MemoryStore:
+    """Token buckets kept in this process only"""
+
+    def __init__(self, max_keys=50000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate, now=None):
+        """Take one token from the bucket; returns (allowed, retry_after_seconds)"""
+        now = now or time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / refill_rate
+
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # Drop the least recently touched half; a dropped bucket just starts full again
+        oldest = sorted(self._buckets.items(), key=lambda item: item[1][1])
+        for key, _ in oldest[:len(oldest) // 2]:
+            del self._buckets[key]
+
+
+class SQLiteStore:
+    """Token buckets in a small SQLite file so every worker on the host shares them"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, refill_rate, now=None):
+        """Take one token from the bucket; returns (allowed, retry_after_seconds)"""
+        now = now or time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                allowed, retry_after = True, 0
+            else:
+                allowed, retry_after = False, (1 - tokens) / refill_rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+class RateLimiter:
+    """Per-IP and per-account token buckets for expensive POST endpoints"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.rules = {}
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        app.config.setdefault('RATELIMIT_SQLITE_PATH', os.path.join(app.instance_path, 'ratelimit.db'))
+        app.config.setdefault('RATELIMIT_RULES', {})
+
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(app.config['RATELIMIT_RULES'])
+
+        if app.config['RATELIMIT_STORAGE'] == 'sqlite':
+            self.store = SQLiteStore(app.config['RATELIMIT_SQLITE_PATH'])
+        else:
+            self.store = MemoryStore()
+
+        # Blueprint rules cover every view in the blueprint, decorated or not
+        for name in self.rules:
+            if '.' not in name:
+                app.before_request_funcs.setdefault(name, []).append(self._check_blueprint)
+
+        app.extensions['ratelimit'] = self
+
+    def _scope(self, endpoint):
+        """(name, rule): the endpoint's own rule if there is one, else its blueprint's"""
+        if endpoint in self.rules:
+            return endpoint, self.rules[endpoint]
+        blueprint = endpoint.rsplit('.', 1)[0] if '.' in endpoint else None
+        return blueprint, self.rules.get(blueprint)
+
+    def rule_for(self, endpoint):
+        """Endpoint rule if there is one, else the rule for its blueprint"""
+        return self._scope(endpoint)[1]
+
+    def check(self, endpoint, account=None):
+        """Returns seconds to wait if the request is over its limit, else None.
+
+        `account` is called for the account key only once the IP is within
+        its limit, so a flood from one address costs no user lookups.
+        """
+        scope, rule = self._scope(endpoint)
+        if not rule or request.method not in rule.get('methods', ['POST']):
+            return None
+
+        if rule.get('ip'):
+            retry_after = self._take(f"ip:{scope}:{request.remote_addr}", rule['ip'])
+            if retry_after is not None:
+                return retry_after
+        account_key = account() if rule.get('account') and account else None
+        if account_key:
+            return self._take(f"acct:{scope}:{account_key}", rule['account'])
+        return None
+
+    def _take(self, key, rate):
+        capacity, refill_rate = parse_rate(rate)
+        allowed, retry_after = self.store.take(key, capacity, refill_rate)
+        return None if allowed else retry_after
+
+    def _check_blueprint(self):
+        # Views with @limit check themselves, under the same rule
+        view = current_app.view_functions.get(request.endpoint)
+        if not self.enabled or view is None or getattr(view, 'rate_limited', False):
+            return None
+        retry_after = self.check(request.endpoint, current_user_id)
+        if retry_after is not None:
+            return too_many_requests(retry_after)
+        return None
+
+    def limit(self, account=None):
+        """Decorator: reject over-limit requests before the view touches the database.
+
+        `account` is a callable returning the account key for the request
+        (e.g. the submitted email). Stack this above @login_required so the
+        IP is checked before the user is loaded.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if self.enabled:
+                    retry_after = self.check(request.endpoint, account)
+                    if retry_after is not None:
+                        return too_many_requests(retry_after)
+                return view(*args, **kwargs)
+            # Seen through later decorators too, since wraps() copies __dict__
+            wrapped.rate_limited = True
+            return wrapped
+        return decorator
+
+
+def too_many_requests(retry_after):
+    """Cheap 429 - no template rendering, no session work"""
+    retry_after = max(1, int(retry_after + 0.999))
+    current_app.logger.warning(f"Rate limited {request.endpoint} from {request.remote_addr}")
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+    else:
+        response = current_app.response_class(
+            f"Too many requests. Please try again in {retry_after} seconds.",
+            mimetype='text/plain'
+        )
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def form_email():
+    """Account key for login/register: the submitted email address"""
+    email = request.form.get('email')
+    return email.strip().lower() if email else None
+
+
+def current_user_id():
+    """Account key for logged-in endpoints"""
+    return current_user.get_id() if current_user.is_authenticated else None
+
+
+limiter = RateLimiter()
@@ -0,0 +1,139 @@
+# app/scheduler.py
+import os
+import random
+import threading
+import time
+import click
+
+try:
+    import fcntl
+except ImportError:  # Windows - jobs just aren't serialised across processes
+    fcntl = None
+
+
+class Job:
+    def __init__(self, name, func, interval_key, default_interval, exclusive=True):
+        self.name = name
+        self.func = func
+        self.interval_key = interval_key
+        self.default_interval = default_interval
+        self.exclusive = exclusive
+        self.last_run = 0
+        self.last_duration = None
+        self.last_error = None
+
+    def interval(self, app):
+        return app.config.get(self.interval_key, self.default_interval)
+
+
+class Scheduler:
+    """Runs periodic maintenance jobs on one background thread per process.
+
+    Each job holds an flock on instance/jobs/<name>.lock while it runs, so with
+    several workers only one of them does a given job at a time. Jobs should be
+    idempotent and work in bounded batches. Jobs registered with
+    exclusive=False (flushing per-process state) run in every process.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SCHEDULER_ENABLED', True)
+        app.config.setdefault('SCHEDULER_TICK', 5)
+        self.app = app
+        app.extensions['scheduler'] = self
+
+        if app.config['SCHEDULER_ENABLED']:
+            # Start with the first request, so the reloader's parent process and
+            # CLI commands never spin up a background thread
+            app.before_request(self._ensure_started)
+
+        jobs_cli = click.Group('jobs', help='Run or list background maintenance jobs')
+
+        @jobs_cli.command('list')
+        def list_jobs():
+            for job in self.jobs.values():
+                click.echo(f"{job.name:<24} every {job.interval(app)}s ({job.interval_key})")
+
+        @jobs_cli.command('run')
+        @click.argument('name')
+        def run_job(name):
+            """Run one job now, in the foreground"""
+            if name not in self.jobs:
+                raise click.BadParameter(f"unknown job {name}; try 'flask jobs list'")
+            result = self.run(name)
+            click.echo(f"{name}: {result}")
+
+        app.cli.add_command(jobs_cli)
+
+    def job(self, name, interval_key, default_interval, exclusive=True):
+        """Decorator registering func as a periodic job; interval comes from config"""
+        def decorator(func):
+            self.jobs[name] = Job(name, func, interval_key, default_interval, exclusive)
+            return func
+        return decorator
+
+    def run(self, name):
+        """Run a job inside an app context under its cross-process lock"""
+        job = self.jobs[name]
+        app = self.app
+        lock_file = self._acquire(name) if job.exclusive else None
+        if lock_file is False:
+            return 'skipped (running elsewhere)'
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                result = job.func()
+            job.last_error = None
+            return result
+        except Exception as e:
+            job.last_error = repr(e)
+            app.logger.error("Job %s failed: %s", name, e, exc_info=True)
+        finally:
+            job.last_run = time.time()
+            job.last_duration = time.perf_counter() - start
+            if lock_file:
+                lock_file.close()
+
+    def _acquire(self, name):
+        if fcntl is None:
+            return None
+        lock_dir = os.path.join(self.app.instance_path, 'jobs')
+        os.makedirs(lock_dir, exist_ok=True)
+        lock_file = open(os.path.join(lock_dir, f'{name}.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        tick = self.app.config['SCHEDULER_TICK']
+        # Random phase per job, so a restart neither runs everything at once
+        # nor pushes long-interval jobs back by a full interval
+        for job in self.jobs.values():
+            job.last_run = time.time() - random.uniform(0, job.interval(self.app))
+        while not self._stop.wait(tick):
+            for job in list(self.jobs.values()):
+                if time.time() - job.last_run >= job.interval(self.app):
+                    self.run(job.name)
+
+    def stop(self):
+        self._stop.set()
+
+
+scheduler = Scheduler()
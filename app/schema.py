@@ -0,0 +1,75 @@
+# app/schema.py
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.schema import CreateTable
+
+
+def upgrade_schema(db, metadata=None):
+    """Bring an existing database up to the models without a migration tool.
+
+    create_all() only creates missing tables; columns and indexes declared
+    later on an existing table are added here. New columns must be nullable
+    or have a server_default. A NOT NULL column the model now allows to be
+    NULL, or a table the model now declares sqlite_autoincrement, needs a
+    table rebuild, which SQLite has no ALTER for. Safe to run on every start.
+    """
+    metadata = metadata if metadata is not None else db.metadata
+    metadata.create_all(db.engine)
+    inspector = inspect(db.engine)
+    for table in metadata.sorted_tables:
+        columns = {column['name']: column for column in inspector.get_columns(table.name, schema=table.schema)}
+        if lacks_autoincrement(db, table) or any(
+                column.nullable and column.name in columns and not columns[column.name]['nullable']
+                for column in table.columns if not column.primary_key):
+            rebuild_table(db, table, set(columns))
+            inspector = inspect(db.engine)
+            continue
+        for column in table.columns:
+            if column.name not in columns:
+                add_column(db, table, column)
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name, schema=table.schema)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+
+
+def lacks_autoincrement(db, table):
+    """Whether the model wants AUTOINCREMENT and the table was created without it"""
+    if not table.dialect_options['sqlite']['autoincrement']:
+        return False
+    prefix = f'{table.schema}.' if table.schema else ''
+    with db.engine.connect() as connection:
+        ddl = connection.exec_driver_sql(
+            f"SELECT sql FROM {prefix}sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).scalar()
+    return ddl is not None and 'AUTOINCREMENT' not in ddl.upper()
+
+
+def add_column(db, table, column):
+    ddl = f'ALTER TABLE {table.fullname} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}'
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(ddl)
+
+
+def rebuild_table(db, table, existing_columns):
+    """Recreate a table from the model, keeping its rows (SQLite's documented procedure)"""
+    prefix = f'{table.schema}.' if table.schema else ''
+    new_name = f'_new_{table.name}'
+    # The copy's foreign keys resolve against copies of the tables they point at
+    scratch = MetaData()
+    for other in table.metadata.tables.values():
+        if other is not table:
+            other.to_metadata(scratch)
+    new_table = table.to_metadata(scratch, name=new_name)
+    copied = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+    with db.engine.begin() as connection:
+        connection.execute(CreateTable(new_table))
+        connection.exec_driver_sql(
+            f'INSERT INTO {prefix}{new_name} ({copied}) SELECT {copied} FROM {table.fullname}')
+        connection.exec_driver_sql(f'DROP TABLE {table.fullname}')
+        connection.exec_driver_sql(f'ALTER TABLE {prefix}{new_name} RENAME TO {table.name}')
+        for index in table.indexes:
+            index.create(connection)
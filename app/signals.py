@@ -0,0 +1,38 @@
+# app/signals.py
+import itertools
+from blinker import Namespace
+from flask import current_app
+from sqlalchemy import event
+
+_signals = Namespace()
+
+# Sent after a commit that added, changed or deleted products (ORM or bulk
+# query.update/delete); receivers get the app as sender. Use it to drop caches.
+product_changed = _signals.signal('product-changed')
+
+
+def init_app(app, db):
+    from app.models import Product
+
+    @event.listens_for(db.session, 'after_flush')
+    def _track_flush(session, flush_context):
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, Product):
+                session.info['products_changed'] = True
+                return
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def _track_bulk(orm_execute_state):
+        if (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+                orm_execute_state.bind_mapper is not None and \
+                orm_execute_state.bind_mapper.class_ is Product:
+            orm_execute_state.session.info['products_changed'] = True
+
+    @event.listens_for(db.session, 'after_commit')
+    def _send(session):
+        if session.info.pop('products_changed', False):
+            product_changed.send(current_app._get_current_object())
+
+    @event.listens_for(db.session, 'after_rollback')
+    def _reset(session):
+        session.info.pop('products_changed', None)
@@ -0,0 +1,302 @@
+# app/similar.py
+"""Precomputed "similar items" for product pages.
+
+An offline job turns each live product's title and description into a sparse
+TF-IDF vector (NumPy, L2-normalised, so a dot product is the cosine) and
+stores its top-k neighbours from the same or an adjacent category in
+similar_products.
+Pages then read one product's neighbours with a primary-key range lookup.
+
+The vocabulary, IDF weights and vectors are kept in instance/similar/ so
+normal runs only vectorise products changed since the watermark and merge
+them into existing neighbour lists; a periodic rebuild refreshes the
+vocabulary and every list.
+"""
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Product, Category, JobState, SimilarProduct
+from app.scheduler import scheduler
+
+JOB_NAME = 'similar-products'
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or the this to was with '
+    'very good condition new used item sale selling price kes ksh'.split()
+)
+# Title terms count this many times over description terms
+TITLE_WEIGHT = 2
+# Edits committed just before the watermark may land just after it
+WATERMARK_OVERLAP = timedelta(minutes=2)
+# Rows made dense and multiplied at once, on each side; bounds peak memory
+CHUNK = 1024
+
+
+def tokenize(title, description):
+    tokens = []
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1)):
+        words = [w for w in TOKEN_RE.findall((text or '').lower()) if len(w) > 1 and w not in STOPWORDS]
+        tokens.extend(words * weight)
+    return tokens
+
+
+def related_categories(category_id, names_by_id):
+    """The product's own category plus the adjacent ones from config"""
+    adjacent = current_app.config['SIMILAR_ADJACENT_CATEGORIES']
+    ids_by_name = {name: category_id for category_id, name in names_by_id.items()}
+    related = {category_id}
+    for name in adjacent.get(names_by_id.get(category_id), ()):
+        if name in ids_by_name:
+            related.add(ids_by_name[name])
+    return related
+
+
+class Model:
+    """Vocabulary, IDF weights and the vector of every live product.
+
+    Vectors are the rows of a CSR matrix - indptr, indices (term columns) and
+    data - since a listing uses a few dozen of the terms at most. Blocks of
+    rows are made dense only while they're being multiplied.
+    """
+
+    def __init__(self, terms, idf, ids, categories, indptr, indices, data):
+        import numpy as np
+        self.terms = list(terms)
+        self.index = {term: i for i, term in enumerate(self.terms)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.categories = np.asarray(categories, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, rows, max_features, min_df=2):
+        """Build the vocabulary from (id, category_id, title, description) rows"""
+        docs = [tokenize(title, description) for _, _, title, description in rows]
+        df = Counter(term for doc in docs for term in set(doc))
+        max_df = max(min_df, int(0.5 * len(docs)))
+        common = [term for term, count in df.most_common() if min_df <= count <= max_df][:max_features]
+        terms = sorted(common)
+        idf = [math.log((1 + len(docs)) / (1 + df[term])) + 1 for term in terms]
+        model = cls(terms, idf, [], [], [0], [], [])
+        return model.with_rows(rows, docs)
+
+    def vectorize(self, docs):
+        """(indptr, indices, data) of the docs' L2-normalised TF-IDF vectors"""
+        import numpy as np
+        indptr, indices, data = [0], [], []
+        for doc in docs:
+            row = {}
+            for term, count in Counter(doc).items():
+                column = self.index.get(term)
+                if column is not None:
+                    row[column] = (1 + math.log(count)) * float(self.idf[column])
+            norm = math.sqrt(sum(value * value for value in row.values())) or 1
+            for column in sorted(row):
+                indices.append(column)
+                data.append(row[column] / norm)
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32), np.array(data, dtype=np.float32)
+
+    def _take(self, rows):
+        """(indptr, indices, data) of just these rows, in order"""
+        import numpy as np
+        starts = self.indptr[rows]
+        lengths = self.indptr[np.asarray(rows) + 1] - starts
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return indptr, self.indices[positions], self.data[positions]
+
+    def _dense(self, rows):
+        import numpy as np
+        indptr, indices, data = self._take(rows)
+        block = np.zeros((len(rows), len(self.terms)), dtype=np.float32)
+        block[np.repeat(np.arange(len(rows)), np.diff(indptr)), indices] = data
+        return block
+
+    def with_rows(self, rows, docs=None):
+        """Copy of the model with these products (re)vectorised; others are kept"""
+        import numpy as np
+        if docs is None:
+            docs = [tokenize(title, description) for _, _, title, description in rows]
+        new_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        kept = np.flatnonzero(~np.isin(self.ids, new_ids))
+        indptr, indices, data = self._take(kept)
+        new_indptr, new_indices, new_data = self.vectorize(docs)
+        return Model(
+            self.terms, self.idf,
+            np.concatenate([self.ids[kept], new_ids]),
+            np.concatenate([self.categories[kept], np.array([row[1] for row in rows], dtype=np.int64)]),
+            np.concatenate([indptr, new_indptr[1:] + indptr[-1]]),
+            np.concatenate([indices, new_indices]),
+            np.concatenate([data, new_data]),
+        )
+
+    def without(self, ids):
+        import numpy as np
+        kept = np.flatnonzero(~np.isin(self.ids, np.asarray(list(ids), dtype=np.int64)))
+        return Model(self.terms, self.idf, self.ids[kept], self.categories[kept], *self._take(kept))
+
+    def neighbours(self, ids, k, names_by_id):
+        """{product_id: [(similar_id, score), ...]} best first, for each of ids"""
+        import numpy as np
+        adjacent_weight = current_app.config['SIMILAR_ADJACENT_WEIGHT']
+        position = {product_id: i for i, product_id in enumerate(self.ids.tolist())}
+        result = {}
+        by_category = {}
+        for product_id in ids:
+            if product_id in position:
+                by_category.setdefault(int(self.categories[position[product_id]]), []).append(product_id)
+
+        for category_id, members in by_category.items():
+            related = related_categories(category_id, names_by_id)
+            candidates = np.flatnonzero(np.isin(self.categories, list(related)))
+            if not len(candidates):
+                continue
+            weights = np.where(self.categories[candidates] == category_id, 1.0, adjacent_weight).astype(np.float32)
+            for start in range(0, len(members), CHUNK):
+                chunk = members[start:start + CHUNK]
+                rows = np.array([position[product_id] for product_id in chunk])
+                query = self._dense(rows)
+                # Running top k over blocks of candidates, as (score, candidate position) pairs
+                best_scores = np.zeros((len(rows), 0), dtype=np.float32)
+                best = np.zeros((len(rows), 0), dtype=np.int64)
+                for block_start in range(0, len(candidates), CHUNK):
+                    block = np.arange(block_start, min(block_start + CHUNK, len(candidates)))
+                    scores = (query @ self._dense(candidates[block]).T) * weights[block]
+                    # Never recommend the product itself
+                    scores[self.ids[candidates[block]][None, :] == self.ids[rows][:, None]] = 0
+                    scores = np.hstack([best_scores, scores])
+                    positions = np.hstack([best, np.broadcast_to(block, scores[:, best.shape[1]:].shape)])
+                    top = min(k, scores.shape[1])
+                    keep = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+                    best_scores = np.take_along_axis(scores, keep, axis=1)
+                    best = np.take_along_axis(positions, keep, axis=1)
+                for i, product_id in enumerate(chunk):
+                    ranked = sorted(
+                        ((int(self.ids[candidates[j]]), float(score))
+                         for j, score in zip(best[i], best_scores[i]) if score > 0),
+                        key=lambda pair: -pair[1],
+                    )
+                    result[product_id] = ranked
+        return result
+
+    def save(self, path):
+        import numpy as np
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, terms=np.array(self.terms, dtype=str), idf=self.idf, ids=self.ids,
+                            categories=self.categories, indptr=self.indptr, indices=self.indices, data=self.data)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if 'indptr' not in data:
+                return None  # dense vectors from an older version; rebuilt on the next run
+            return cls(data['terms'].tolist(), data['idf'], data['ids'], data['categories'],
+                       data['indptr'], data['indices'], data['data'])
+
+
+def model_path():
+    return os.path.join(current_app.instance_path, 'similar', 'tfidf.npz')
+
+
+def _live_rows(changed_since=None):
+    query = db.select(Product.id, Product.category_id, Product.title, Product.description)\
+        .where(Product.is_active == True, Product.is_sold == False)
+    if changed_since is not None:
+        query = query.where(Product.updated_at > changed_since)
+    return [tuple(row) for row in db.session.execute(query)]
+
+
+def _write(lists):
+    """Replace the neighbour lists of these products"""
+    if not lists:
+        return
+    ids = list(lists)
+    for start in range(0, len(ids), 500):
+        SimilarProduct.query.filter(SimilarProduct.product_id.in_(ids[start:start + 500]))\
+            .delete(synchronize_session=False)
+    rows = [
+        {'product_id': product_id, 'rank': rank, 'similar_id': similar_id, 'score': round(score, 4)}
+        for product_id, ranked in lists.items()
+        for rank, (similar_id, score) in enumerate(ranked)
+    ]
+    if rows:
+        db.session.execute(SimilarProduct.__table__.insert(), rows)
+
+
+@scheduler.job(JOB_NAME, 'SIMILAR_REFRESH_INTERVAL', 600)
+def refresh(full=None):
+    """Vectorise changed products and update neighbour lists; returns products rescored"""
+    config = current_app.config
+    k = config['SIMILAR_TOP_K']
+    now = datetime.utcnow()
+    state = JobState.get(JOB_NAME)
+    path = model_path()
+    model = None if full else Model.load(path)
+    if full is None:
+        rebuild_every = timedelta(seconds=config['SIMILAR_REBUILD_INTERVAL'])
+        full = model is None or state.watermark is None or state.last_full_run is None or \
+            now - state.last_full_run >= rebuild_every
+    names_by_id = dict(db.session.execute(db.select(Category.id, Category.name)).all())
+
+    if full:
+        model = Model.fit(_live_rows(), config['SIMILAR_MAX_FEATURES'])
+        lists = model.neighbours(model.ids.tolist(), k, names_by_id)
+        SimilarProduct.query.delete(synchronize_session=False)
+        _write(lists)
+        state.last_full_run = now
+    else:
+        changed = _live_rows(state.watermark - WATERMARK_OVERLAP)
+        # Products that left the live set stop being candidates; their stale
+        # rows are filtered out when pages read neighbours
+        gone = set(model.ids.tolist()) - set(db.session.execute(
+            db.select(Product.id).where(Product.id.in_(model.ids.tolist()),
+                                        Product.is_active == True, Product.is_sold == False)
+        ).scalars())
+        model = model.without(gone).with_rows(changed) if changed or gone else model
+        changed_ids = [row[0] for row in changed]
+        lists = model.neighbours(changed_ids, k, names_by_id)
+
+        # Similarity is symmetric: a changed product may now belong in the
+        # lists of its own neighbours
+        reverse = {}
+        for product_id, ranked in lists.items():
+            for similar_id, score in ranked:
+                if similar_id not in lists:
+                    reverse.setdefault(similar_id, []).append((product_id, score))
+        if reverse:
+            current = {}
+            for row in SimilarProduct.query.filter(SimilarProduct.product_id.in_(list(reverse))):
+                current.setdefault(row.product_id, []).append((row.similar_id, row.score))
+            for product_id, offers in reverse.items():
+                merged = dict(current.get(product_id, []))
+                merged.update(offers)
+                lists[product_id] = sorted(merged.items(), key=lambda pair: -pair[1])[:k]
+        _write(lists)
+
+    model.save(path)
+    state.watermark = now
+    db.session.commit()
+    return len(lists)
+
+
+def similar_products(product, limit=None):
+    """Precomputed neighbours of product that are still live, best first"""
+    limit = limit or current_app.config['SIMILAR_TOP_K']
+    return Product.query.join(SimilarProduct, SimilarProduct.similar_id == Product.id)\
+        .filter(SimilarProduct.product_id == product.id,
+                Product.is_active == True, Product.is_sold == False)\
+        .order_by(SimilarProduct.rank)\
+        .limit(limit).all()
@@ -0,0 +1,276 @@
+# app/suggest.py
+"""Typeahead suggestions from an in-process prefix index.
+
+Live product titles are split into lowercase tokens kept in one sorted list;
+a prefix is a bisect range over it, and each token maps to the products whose
+title has it. Category names get the same treatment. A lookup touches only
+the matching range, so it stays well under a millisecond without a query.
+
+The index is built on first use in each worker and kept current by sync():
+products whose updated_at moved past the watermark are re-indexed (create,
+edit, sold, expiry, renew all touch it), and when the live count disagrees
+with the index the missing ids are dropped (deletes, archival). sync() runs
+on the first lookup after a commit that touched products in this worker, and
+on a short interval for writes made by other workers. At most SUGGEST_MAX_PRODUCTS
+products are indexed, always the newest: once full, a new listing evicts the
+oldest entry, and one that is sold or deleted makes room for the next-newest.
+"""
+import bisect
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from app import db, metrics
+from app.models import Product, Category
+from app.scheduler import scheduler
+from app.signals import product_changed
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Matching tokens looked at per lookup; a one-letter prefix can match thousands
+MAX_PREFIX_TOKENS = 200
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SuggestIndex:
+
+    def __init__(self):
+        self.titles = {}      # product id -> title
+        self.postings = {}    # token -> set of product ids
+        self.tokens = []      # sorted keys of postings
+        self.ages = {}        # product id -> (created_at, id)
+        self.order = []       # sorted values of ages, oldest first
+        self.categories = []  # (lowercase name, id, name), sorted
+        self.watermark = None
+        self.truncated = False
+        self.built_at = None
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    # -- maintenance -------------------------------------------------------
+
+    def rebuild(self):
+        limit = current_app.config['SUGGEST_MAX_PRODUCTS']
+        rows = db.session.execute(
+            db.select(Product.id, Product.title, Product.created_at)
+            .where(Product.is_active == True, Product.is_sold == False)
+            .order_by(Product.created_at.desc(), Product.id.desc())
+            .limit(limit + 1)
+        ).all()
+        categories = db.session.execute(db.select(Category.id, Category.name)).all()
+        watermark = db.session.execute(db.select(db.func.max(Product.updated_at))).scalar()
+
+        titles, postings, ages = {}, {}, {}
+        for product_id, title, created_at in rows[:limit]:
+            titles[product_id] = title
+            ages[product_id] = _age(created_at, product_id)
+            for token in set(tokenize(title)):
+                postings.setdefault(token, set()).add(product_id)
+        with self._lock:
+            self.titles, self.postings, self.ages = titles, postings, ages
+            self.tokens = sorted(postings)
+            self.order = sorted(ages.values())
+            self.categories = sorted((name.lower(), category_id, name) for category_id, name in categories)
+            self.watermark = watermark
+            self.truncated = len(rows) > limit
+            self.built_at = time.time()
+
+    def _add(self, product_id, title, created_at):
+        age = _age(created_at, product_id)
+        self._remove(product_id)
+        if len(self.titles) >= current_app.config['SUGGEST_MAX_PRODUCTS']:
+            self.truncated = True
+            if age < self.order[0]:
+                return  # older than everything indexed
+            self._remove(self.order[0][1])
+        self.titles[product_id] = title
+        self.ages[product_id] = age
+        bisect.insort(self.order, age)
+        for token in set(tokenize(title)):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                bisect.insort(self.tokens, token)
+            ids.add(product_id)
+
+    def _remove(self, product_id):
+        title = self.titles.pop(product_id, None)
+        if title is None:
+            return
+        del self.order[bisect.bisect_left(self.order, self.ages.pop(product_id))]
+        for token in set(tokenize(title)):
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(product_id)
+            if not ids:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def ensure_current(self):
+        """Build on first use; apply this worker's product writes since the last lookup"""
+        if self.built_at is None:
+            self.rebuild()
+        elif self.dirty:
+            self.sync()
+
+    def sync(self):
+        """Apply product changes since the last sync"""
+        self.dirty = False
+        query = db.select(Product.id, Product.title, Product.created_at, Product.is_active, Product.is_sold,
+                          Product.updated_at)
+        if self.watermark is not None:
+            query = query.where(Product.updated_at >= self.watermark)
+        changed = db.session.execute(query).all()
+
+        with self._lock:
+            for product_id, title, created_at, is_active, is_sold, updated_at in changed:
+                if is_active and not is_sold:
+                    self._add(product_id, title, created_at)
+                else:
+                    self._remove(product_id)
+                if updated_at and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+            oldest = self.order[0] if self.truncated and self.order else None
+            indexed = len(self.titles)
+
+        # Live products the index should hold: all of them, or when truncated those from its oldest entry on
+        live = [Product.is_active == True, Product.is_sold == False]
+        if oldest:
+            live.append(db.tuple_(Product.created_at, Product.id) >= oldest)
+        if db.session.execute(db.select(db.func.count()).where(*live)).scalar() != indexed:
+            # Something was deleted or archived; drop ids that aren't live any more
+            live_ids = set(db.session.execute(db.select(Product.id).where(*live)).scalars())
+            with self._lock:
+                for product_id in [product_id for product_id in self.titles if product_id not in live_ids]:
+                    self._remove(product_id)
+
+        if self.truncated:
+            self._top_up()
+
+    def _top_up(self):
+        """Refill a truncated index that lost entries with the next-newest products"""
+        room = current_app.config['SUGGEST_MAX_PRODUCTS'] - len(self.titles)
+        if room <= 0:
+            return
+        query = db.select(Product.id, Product.title, Product.created_at)\
+            .where(Product.is_active == True, Product.is_sold == False)
+        if self.order:
+            query = query.where(db.tuple_(Product.created_at, Product.id) < self.order[0])
+        rows = db.session.execute(
+            query.order_by(Product.created_at.desc(), Product.id.desc()).limit(room + 1)
+        ).all()
+        with self._lock:
+            for product_id, title, created_at in rows[:room]:
+                self._add(product_id, title, created_at)
+            self.truncated = len(rows) > room
+
+    # -- lookups -----------------------------------------------------------
+
+    def _prefix_range(self, prefix):
+        start = bisect.bisect_left(self.tokens, prefix)
+        end = bisect.bisect_left(self.tokens, prefix + '\U0010ffff', start)
+        return self.tokens[start:min(end, start + MAX_PREFIX_TOKENS)]
+
+    def suggest(self, query, limit=8):
+        """(titles, categories) matching query; the last word is a prefix"""
+        words = tokenize(query)
+        if not words:
+            return [], []
+        *leading, last = words
+        with self._lock:
+            # Earlier words narrow the candidates; they may be unfinished too
+            allowed = None
+            for word in leading:
+                ids = set().union(*(self.postings[token] for token in self._prefix_range(word)))
+                allowed = ids if allowed is None else allowed & ids
+            candidates, seen, wanted = [], set(), limit * 20
+            for token in self._prefix_range(last):
+                for product_id in self.postings[token]:
+                    if product_id not in seen and (allowed is None or product_id in allowed):
+                        seen.add(product_id)
+                        candidates.append(product_id)
+                        if len(candidates) >= wanted:
+                            break
+                if len(candidates) >= wanted:
+                    break
+            titles = [(product_id, self.titles[product_id]) for product_id in candidates]
+            categories = [(category_id, name) for lower, category_id, name in self.categories
+                          if any(part.startswith(last) for part in tokenize(lower))][:3]
+
+        phrase = ' '.join(words)
+        # Titles starting with what was typed first, then shorter ones
+        titles.sort(key=lambda item: (not item[1].lower().startswith(phrase), len(item[1]), item[1].lower()))
+
+        results, shown = [], set()
+        for product_id, title in titles:
+            if title.lower() not in shown:
+                shown.add(title.lower())
+                results.append((product_id, title))
+                if len(results) >= limit:
+                    break
+        return results, categories
+
+    # -- reporting ---------------------------------------------------------
+
+    def memory_bytes(self):
+        """Rough size of the index's containers and strings"""
+        with self._lock:
+            size = sys.getsizeof(self.titles) + sys.getsizeof(self.postings) + sys.getsizeof(self.tokens)
+            size += sum(sys.getsizeof(title) for title in self.titles.values())
+            size += sum(sys.getsizeof(token) + sys.getsizeof(ids) for token, ids in self.postings.items())
+        return size
+
+    def stats(self):
+        return {
+            'products': len(self.titles),
+            'tokens': len(self.tokens),
+            'categories': len(self.categories),
+            'truncated': self.truncated,
+            'bytes': self.memory_bytes(),
+        }
+
+
+def _age(created_at, product_id):
+    return (created_at or datetime.min, product_id)
+
+
+suggest_index = SuggestIndex()
+
+metrics.gauge('suggest_index_products', 'Products in the typeahead index', callback=lambda: len(suggest_index.titles))
+metrics.gauge('suggest_index_tokens', 'Distinct tokens in the typeahead index', callback=lambda: len(suggest_index.tokens))
+metrics.gauge('suggest_index_bytes', 'Approximate typeahead index size', callback=suggest_index.memory_bytes)
+
+
+@scheduler.job('suggest-sync', 'SUGGEST_SYNC_INTERVAL', 30, exclusive=False)
+def sync():
+    """Pick up other workers' product writes; every worker keeps its own index"""
+    if current_app.config['SUGGEST_ENABLED'] and suggest_index.built_at is not None:
+        suggest_index.sync()
+        return len(suggest_index.titles)
+
+
+def _on_product_changed(sender):
+    # No SQL inside a commit hook; the next lookup syncs
+    suggest_index.dirty = True
+
+
+def init_app(app):
+    app.config.setdefault('SUGGEST_ENABLED', True)
+    app.config.setdefault('SUGGEST_MAX_PRODUCTS', 100000)
+    app.config.setdefault('SUGGEST_SYNC_INTERVAL', 30)
+    product_changed.connect(_on_product_changed, weak=False)
+
+    @app.cli.command('suggest-stats')
+    def suggest_stats():
+        """Build the typeahead index and print its size"""
+        start = time.perf_counter()
+        suggest_index.rebuild()
+        stats = suggest_index.stats()
+        click.echo(f"Built in {(time.perf_counter() - start) * 1000:.0f}ms: {stats}")
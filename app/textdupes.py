@@ -0,0 +1,336 @@
+# app/textdupes.py
+"""Near-duplicate listing text: MinHash signatures with an LSH index in SQLite.
+
+A listing's title and description become a set of word bigrams; its MinHash
+signature is the minimum of each of NUM_PERM hash permutations over that set,
+and the fraction of positions two signatures agree on estimates the Jaccard
+similarity of the sets. The signature is cut into BANDS bands of ROWS values
+and each band hashed into listing_bands. Two listings that share any bucket
+are candidates - at ROWS=4 and BANDS=16 that catches about 89% of pairs at
+Jaccard 0.6 and 99% at 0.7, and 2.5% at 0.2 - and candidates are confirmed by
+comparing signatures. A lookup is one indexed query over BANDS keys, however
+big the catalog.
+
+Listings are indexed on create and edit inside the request's transaction;
+duplicate_of records the closest earlier listing above TEXTDUP_THRESHOLD.
+Older listings are picked up by a backfill job, and `flask text-dupes
+--rebuild` re-indexes the whole catalog and clusters it in one pass.
+
+NUM_PERM, BANDS, ROWS and the seed are part of the stored data: change them
+only together with a rebuild.
+"""
+import hashlib
+import re
+import time
+import zlib
+from datetime import datetime
+import click
+from flask import current_app, request
+from app import db, metrics
+from app.models import Product, ListingSignature, ListingBand
+from app.scheduler import scheduler
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = 4
+SEED = 1
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Longer descriptions add little beyond this many words
+MAX_WORDS = 400
+# Buckets bigger than this (boilerplate text) are only checked against their first member when clustering
+MAX_PAIRWISE_BUCKET = 64
+_MERSENNE = (1 << 61) - 1
+
+FLAGGED = metrics.counter('textdup_flagged_total', 'Listings written as near-duplicates of an earlier one')
+LOOKUP_CANDIDATES = metrics.histogram(
+    'textdup_candidates', 'LSH candidates confirmed per lookup', (), (0, 1, 2, 5, 10, 25, 50, 100))
+
+_permutations = {}
+_queries = {}
+
+
+def _hash_params():
+    if 'a' not in _permutations:
+        import numpy as np
+        rng = np.random.RandomState(SEED)
+        _permutations['a'] = rng.randint(1, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+        _permutations['b'] = rng.randint(0, _MERSENNE, size=NUM_PERM, dtype=np.uint64)
+    return _permutations['a'], _permutations['b']
+
+
+def shingles(title, description):
+    """32-bit hashes of the word bigrams (one word on its own if that's all there is)"""
+    words = TOKEN_RE.findall(f"{title or ''} {description or ''}".lower())[:MAX_WORDS]
+    if len(words) < 2:
+        return {zlib.crc32(word.encode()) for word in words}
+    return {zlib.crc32(f'{a} {b}'.encode()) for a, b in zip(words, words[1:])}
+
+
+def signature(title, description):
+    """NUM_PERM uint32 minimums, or None for a listing without words"""
+    import numpy as np
+    values = shingles(title, description)
+    if not values:
+        return None
+    a, b = _hash_params()
+    x = np.fromiter(values, dtype=np.uint64, count=len(values))
+    # Overflow wraps mod 2**64 - still a fine permutation for our purposes
+    hashed = (np.outer(x, a) + b) % np.uint64(_MERSENNE)
+    return (hashed & np.uint64(0xffffffff)).min(axis=0).astype(np.uint32)
+
+
+def band_keys(sig):
+    """(band, bucket) pairs; bucket is a signed 64-bit hash of the band's values"""
+    return [
+        (band, int.from_bytes(hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                              digest_size=8).digest(), 'little', signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def from_blob(blob):
+    import numpy as np
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two listings' bigram sets"""
+    return float((sig_a == sig_b).mean())
+
+
+def _candidates_query():
+    """Built once: constructing the 16-way OR per lookup costs more than running it"""
+    if 'candidates' not in _queries:
+        # OR of (band, bucket) pairs: SQLite answers it with one primary key search per band,
+        # where a row-value IN would scan the whole table
+        colliding = db.select(ListingBand.product_id)\
+            .where(db.or_(*(db.and_(ListingBand.band == band, ListingBand.bucket == db.bindparam(f'bucket{band}'))
+                            for band in range(BANDS))),
+                   ListingBand.product_id != db.bindparam('exclude'))\
+            .group_by(ListingBand.product_id)\
+            .order_by(db.func.count().desc())\
+            .limit(db.bindparam('limit'))
+        _queries['candidates'] = db.select(ListingSignature.product_id, ListingSignature.signature)\
+            .where(ListingSignature.product_id.in_(colliding))
+    return _queries['candidates']
+
+
+def candidates(sig, exclude=None, threshold=None):
+    """[(similarity, product_id)] of indexed listings above threshold, most similar first"""
+    config = current_app.config
+    threshold = config['TEXTDUP_THRESHOLD'] if threshold is None else threshold
+    params = {f'bucket{band}': bucket for band, bucket in band_keys(sig)}
+    params.update(exclude=-1 if exclude is None else exclude, limit=config['TEXTDUP_MAX_CANDIDATES'])
+    rows = db.session.execute(_candidates_query(), params).all()
+    matches = [(similarity(sig, from_blob(blob)), product_id) for product_id, blob in rows]
+    matches = sorted(((score, product_id) for score, product_id in matches if score >= threshold),
+                     key=lambda match: (-match[0], match[1]))
+    LOOKUP_CANDIDATES.observe(len(rows))
+    return matches
+
+
+def index_listing(product_id, title, description):
+    """(Re)index one listing in the current transaction; returns its (similarity, earlier id) matches"""
+    if not current_app.config['TEXTDUP_ENABLED']:
+        return []
+    sig = signature(title, description)
+    db.session.execute(ListingBand.__table__.delete().where(ListingBand.product_id == product_id))
+    earlier = []
+    if sig is not None:
+        earlier = [(score, other) for score, other in candidates(sig, exclude=product_id) if other < product_id]
+    best_score, best_id = earlier[0] if earlier else (None, None)
+    # A listing without words keeps an empty signature, so the backfill doesn't pick it up again
+    db.session.execute(ListingSignature.__table__.insert().prefix_with('OR REPLACE'), [{
+        'product_id': product_id, 'signature': b'' if sig is None else sig.tobytes(),
+        'duplicate_of': best_id, 'similarity': best_score, 'computed_at': datetime.utcnow(),
+    }])
+    if sig is not None:
+        db.session.execute(ListingBand.__table__.insert(), [
+            {'band': band, 'bucket': bucket, 'product_id': product_id} for band, bucket in band_keys(sig)
+        ])
+    if best_id is not None:
+        FLAGGED.inc()
+        current_app.logger.info(f"Listing {product_id} looks like listing {best_id} ({best_score:.2f})")
+    return earlier
+
+
+@scheduler.job('textdup-backfill', 'TEXTDUP_BACKFILL_INTERVAL', 600)
+def backfill(batch_size=None):
+    """Index a batch of listings that have no signature yet, oldest first; returns how many"""
+    if not current_app.config['TEXTDUP_ENABLED']:
+        return 0
+    batch_size = batch_size or current_app.config['TEXTDUP_BACKFILL_BATCH_SIZE']
+    rows = db.session.execute(
+        db.select(Product.id, Product.title, Product.description)
+        .outerjoin(ListingSignature, ListingSignature.product_id == Product.id)
+        .where(ListingSignature.product_id.is_(None))
+        .order_by(Product.id).limit(batch_size)
+    ).all()
+    for product_id, title, description in rows:
+        index_listing(product_id, title, description)
+    db.session.commit()
+    return len(rows)
+
+
+def rebuild(chunk_size=1000):
+    """Re-sign every listing in keyset chunks, without per-listing lookups; returns the count.
+
+    Clears duplicate_of - follow with cluster() to set it again.
+    """
+    db.session.execute(ListingBand.__table__.delete())
+    db.session.execute(ListingSignature.__table__.delete())
+    db.session.commit()
+    last_id, total, now = 0, 0, datetime.utcnow()
+    while True:
+        rows = db.session.execute(
+            db.select(Product.id, Product.title, Product.description)
+            .where(Product.id > last_id).order_by(Product.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        signatures, bands = [], []
+        for product_id, title, description in rows:
+            sig = signature(title, description)
+            signatures.append({'product_id': product_id, 'signature': b'' if sig is None else sig.tobytes(),
+                               'computed_at': now})
+            if sig is not None:
+                bands.extend({'band': band, 'bucket': bucket, 'product_id': product_id}
+                             for band, bucket in band_keys(sig))
+        db.session.execute(ListingSignature.__table__.insert(), signatures)
+        if bands:
+            db.session.execute(ListingBand.__table__.insert(), bands)
+        # One transaction per chunk, so requests get the write lock in between
+        db.session.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
+
+
+def cluster(threshold=None, record=True):
+    """Groups of near-duplicate listings across the catalog, largest first.
+
+    Only listings that share an LSH bucket are compared, so the work follows
+    the number of candidate pairs rather than the square of the catalog. With
+    record, each listing's duplicate_of becomes its most similar earlier
+    listing in its group.
+    """
+    import numpy as np
+    threshold = current_app.config['TEXTDUP_THRESHOLD'] if threshold is None else threshold
+    rows = db.session.execute(
+        db.select(ListingSignature.product_id, ListingSignature.signature)
+        .where(db.func.length(ListingSignature.signature) > 0)
+        .order_by(ListingSignature.product_id)
+    ).all()
+    if not rows:
+        return []
+    ids = [product_id for product_id, _ in rows]
+    position = {product_id: i for i, product_id in enumerate(ids)}
+    matrix = np.vstack([from_blob(blob) for _, blob in rows])
+    parent = list(range(len(ids)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Only buckets with company; SQLite does the grouping
+    buckets = db.session.execute(
+        db.select(db.func.group_concat(ListingBand.product_id))
+        .group_by(ListingBand.band, ListingBand.bucket)
+        .having(db.func.count() > 1)
+    ).scalars()
+    for members in buckets:
+        rows_ = [position[int(product_id)] for product_id in members.split(',') if int(product_id) in position]
+        if len(rows_) < 2:
+            continue
+        sub = matrix[rows_]
+        if len(rows_) <= MAX_PAIRWISE_BUCKET:
+            scores = (sub[:, None, :] == sub[None, :, :]).mean(axis=2)
+            pairs = zip(*np.nonzero(np.triu(scores >= threshold, 1)))
+        else:
+            pairs = ((0, j) for j in np.flatnonzero((sub == sub[0]).mean(axis=1) >= threshold) if j)
+        for i, j in pairs:
+            root_i, root_j = find(rows_[i]), find(rows_[j])
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(len(ids)):
+        groups.setdefault(find(i), []).append(i)
+    clusters = sorted((members for members in groups.values() if len(members) > 1),
+                      key=lambda members: (-len(members), members[0]))
+
+    if record:
+        flags = []
+        for members in clusters:
+            sub = matrix[members]
+            for k in range(1, len(members)):
+                # Positions are in id order, so members[:k] are the earlier listings
+                scores = (sub[:k] == sub[k]).mean(axis=1)
+                best = int(np.argmax(scores))
+                flags.append({'id': ids[members[k]], 'duplicate_of': ids[members[best]],
+                              'similarity': float(scores[best])})
+        table = ListingSignature.__table__
+        db.session.execute(table.update().values(duplicate_of=None, similarity=None))
+        if flags:
+            db.session.execute(
+                table.update().where(table.c.product_id == db.bindparam('id'))
+                .values(duplicate_of=db.bindparam('duplicate_of'), similarity=db.bindparam('similarity')),
+                flags,
+            )
+        db.session.commit()
+    return [[ids[i] for i in members] for members in clusters]
+
+
+def flagged_view():
+    """Moderators: recently written listings that look like an earlier one"""
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    original = db.aliased(Product)
+    rows = db.session.execute(
+        db.select(ListingSignature.similarity, ListingSignature.computed_at, Product, original)
+        .join(Product, Product.id == ListingSignature.product_id)
+        .join(original, original.id == ListingSignature.duplicate_of)
+        .order_by(ListingSignature.computed_at.desc(), ListingSignature.product_id.desc())
+        .limit(limit)
+    ).all()
+
+    def summary(product):
+        return {'id': product.id, 'title': product.title, 'seller_id': product.seller_id,
+                'is_active': product.is_active, 'is_sold': product.is_sold}
+
+    return {'flagged': [{
+        'similarity': round(score, 3),
+        'computed_at': computed_at.isoformat() if computed_at else None,
+        'same_seller': product.seller_id == earlier.seller_id,
+        'listing': summary(product),
+        'duplicate_of': summary(earlier),
+    } for score, computed_at, product, earlier in rows]}
+
+
+def init_app(app):
+    app.config.setdefault('TEXTDUP_ENABLED', True)
+    app.config.setdefault('TEXTDUP_THRESHOLD', 0.6)
+    app.config.setdefault('TEXTDUP_MAX_CANDIDATES', 50)
+    app.config.setdefault('TEXTDUP_BACKFILL_INTERVAL', 600)
+    app.config.setdefault('TEXTDUP_BACKFILL_BATCH_SIZE', 500)
+
+    from app.auth.admin import admin_required
+    app.add_url_rule('/admin/text-duplicates', 'text_duplicates', admin_required(flagged_view))
+
+    @app.cli.command('text-dupes')
+    @click.option('--rebuild', 'run_rebuild', is_flag=True, help='re-sign every listing first')
+    @click.option('--threshold', type=float, help='estimated Jaccard similarity (default TEXTDUP_THRESHOLD)')
+    @click.option('--show', type=int, default=20, help='groups to print')
+    def text_dupes_command(run_rebuild, threshold, show):
+        """Cluster the catalog's near-duplicate listings and record duplicate_of"""
+        if run_rebuild:
+            start = time.perf_counter()
+            count = rebuild()
+            click.echo(f"Signed {count} listings in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        clusters = cluster(threshold)
+        click.echo(f"{len(clusters)} groups, {sum(map(len, clusters))} listings "
+                   f"in {time.perf_counter() - start:.1f}s")
+        for group in clusters[:show]:
+            click.echo(' '.join(map(str, group)))
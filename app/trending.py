@@ -0,0 +1,131 @@
+# app/trending.py
+"""Materialized "fast moving" ranking for the homepage.
+
+A product's score mixes buyer interest (unlock attempts and page views in
+the window, each weighted down by age), how recently it was listed, and its
+price band. The refresh job rescores only products with new unlocks or views
+since the last high-water mark; a periodic full rebuild lets every score decay.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Product, ProductUnlock, ProductViewDaily, JobState, TrendingScore
+from app.scheduler import scheduler
+
+JOB_NAME = 'trending-refresh'
+
+# Unlocks created just before the watermark may commit just after it
+WATERMARK_OVERLAP = timedelta(minutes=2)
+
+# An unlock counts half as much after this many hours
+UNLOCK_HALF_LIFE_HOURS = 48.0
+# A listing with no unlocks is worth this much on the day it goes up
+FRESHNESS_WEIGHT = 0.5
+# One page view is worth this much of an unlock attempt
+VIEW_WEIGHT = 0.02
+
+# Cheap things move fastest on campus; (upper bound in KES, multiplier)
+PRICE_BANDS = [
+    (500, 1.2),
+    (2000, 1.1),
+    (10000, 1.0),
+    (None, 0.9),
+]
+
+
+def price_multiplier(price):
+    for upper, multiplier in PRICE_BANDS:
+        if upper is None or price < upper:
+            return multiplier
+
+
+def score(heat, listed_at, price, now):
+    age_days = max((now - listed_at).total_seconds(), 0) / 86400 if listed_at else None
+    freshness = FRESHNESS_WEIGHT / (1 + age_days) if age_days is not None else 0
+    return (heat + freshness) * price_multiplier(price or 0)
+
+
+def scored_rows(now, product_ids=None):
+    """Score eligible products in one aggregate query; product_ids may be a list or a select"""
+    window_start = now - timedelta(days=current_app.config['TRENDING_WINDOW_DAYS'])
+    age_hours = (db.func.julianday(now) - db.func.julianday(ProductUnlock.created_at)) * 24
+    interest = db.select(
+        ProductUnlock.product_id,
+        db.func.count().label('unlocks'),
+        db.func.sum(1.0 / (1 + age_hours / UNLOCK_HALF_LIFE_HOURS)).label('heat'),
+    ).where(
+        ProductUnlock.created_at >= window_start,
+        ProductUnlock.status != 'failed',
+    ).group_by(ProductUnlock.product_id)
+    view_age_hours = (db.func.julianday(now) - db.func.julianday(ProductViewDaily.day)) * 24
+    views = db.select(
+        ProductViewDaily.product_id,
+        db.func.sum(ProductViewDaily.views / (1 + view_age_hours / UNLOCK_HALF_LIFE_HOURS)).label('heat'),
+    ).where(ProductViewDaily.day >= window_start.date()).group_by(ProductViewDaily.product_id)
+    if product_ids is not None:
+        interest = interest.where(ProductUnlock.product_id.in_(product_ids))
+        views = views.where(ProductViewDaily.product_id.in_(product_ids))
+    interest = interest.subquery()
+    views = views.subquery()
+
+    query = db.select(
+        Product.id, Product.price, Product.created_at, interest.c.unlocks, interest.c.heat, views.c.heat
+    ).outerjoin(interest, interest.c.product_id == Product.id)\
+        .outerjoin(views, views.c.product_id == Product.id).where(
+        Product.is_active == True,
+        Product.is_sold == False,
+        db.or_(interest.c.product_id.isnot(None), views.c.product_id.isnot(None),
+               Product.created_at >= window_start),
+    )
+    if product_ids is not None:
+        query = query.where(Product.id.in_(product_ids))
+
+    return [
+        {
+            'product_id': product_id,
+            'score': score((heat or 0) + VIEW_WEIGHT * (view_heat or 0), created_at, price, now),
+            'recent_unlocks': unlocks or 0,
+            'computed_at': now,
+        }
+        for product_id, price, created_at, unlocks, heat, view_heat in db.session.execute(query)
+    ]
+
+
+@scheduler.job(JOB_NAME, 'TRENDING_REFRESH_INTERVAL', 300)
+def refresh(full=None):
+    """Rescore products with unlocks or views since the watermark, or everything"""
+    now = datetime.utcnow()
+    state = JobState.get(JOB_NAME)
+    if full is None:
+        rebuild_every = timedelta(seconds=current_app.config['TRENDING_REBUILD_INTERVAL'])
+        full = state.watermark is None or state.last_full_run is None or \
+            now - state.last_full_run >= rebuild_every
+
+    if full:
+        rows = scored_rows(now)
+        TrendingScore.query.delete(synchronize_session=False)
+        state.last_full_run = now
+    else:
+        since = state.watermark - WATERMARK_OVERLAP
+        dirty = db.union(
+            db.select(ProductUnlock.product_id).where(ProductUnlock.created_at > since),
+            db.select(ProductViewDaily.product_id).where(ProductViewDaily.day >= since.date()),
+        )
+        rows = scored_rows(now, dirty)
+        # Dirty products that are no longer eligible drop out here too
+        TrendingScore.query.filter(TrendingScore.product_id.in_(dirty)).delete(synchronize_session=False)
+
+    if rows:
+        db.session.execute(TrendingScore.__table__.insert(), rows)
+    state.watermark = now
+    db.session.commit()
+    return len(rows)
+
+
+def top_products(limit=None):
+    """Highest-scoring live products, best first"""
+    limit = limit or current_app.config['TRENDING_HOMEPAGE_SIZE']
+    return Product.query.join(TrendingScore, TrendingScore.product_id == Product.id)\
+        .filter(Product.is_active == True, Product.is_sold == False)\
+        .order_by(TrendingScore.score.desc())\
+        .limit(limit).all()
@@ -0,0 +1,104 @@
+# app/viewcounts.py
+"""Write-behind product view counters.
+
+Views are counted in process memory and flushed every VIEWCOUNT_FLUSH_INTERVAL
+seconds: one UPDATE ... CASE for products.view_count and one batched upsert
+into product_views_daily. A request never takes the SQLite write lock to
+count a view. Each worker flushes its own counts (and again at exit), so a
+crash loses at most one interval of that worker's views.
+"""
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import Product, ProductViewDaily
+from app.scheduler import scheduler
+
+# Products per UPDATE statement (each costs three bound parameters)
+FLUSH_CHUNK = 5000
+
+
+class ViewCounter:
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault('VIEWCOUNT_ENABLED', True)
+        app.config.setdefault('VIEWCOUNT_FLUSH_INTERVAL', 30)
+        self.app = app
+        app.extensions['viewcounts'] = self
+        atexit.register(self._flush_at_exit)
+
+    def record(self, product_id):
+        if not current_app.config['VIEWCOUNT_ENABLED']:
+            return
+        with self._lock:
+            self._pending[product_id] = self._pending.get(product_id, 0) + 1
+
+    def pending(self, product_id):
+        """Views counted here but not yet flushed"""
+        with self._lock:
+            return self._pending.get(product_id, 0)
+
+    def flush(self):
+        """Write pending counts in one statement per table; returns products touched"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            products = Product.__table__
+            items = list(pending.items())
+            # One statement per interval unless traffic exceeds SQLite's bound-parameter limit
+            for start in range(0, len(items), FLUSH_CHUNK):
+                counts = dict(items[start:start + FLUSH_CHUNK])
+                db.session.execute(
+                    products.update()
+                    .where(products.c.id.in_(list(counts)))
+                    .values(
+                        view_count=products.c.view_count + db.case(counts, value=products.c.id, else_=0),
+                        # A view isn't an edit; keep onupdate from bumping the watermark column
+                        updated_at=products.c.updated_at,
+                    )
+                )
+            day = datetime.utcnow().date()
+            upsert = sqlite_insert(ProductViewDaily.__table__)
+            db.session.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=['product_id', 'day'],
+                    set_={'views': ProductViewDaily.__table__.c.views + upsert.excluded.views},
+                ),
+                [{'product_id': product_id, 'day': day, 'views': views} for product_id, views in pending.items()],
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Put the counts back for the next attempt
+            with self._lock:
+                for product_id, views in pending.items():
+                    self._pending[product_id] = self._pending.get(product_id, 0) + views
+            raise
+        return len(pending)
+
+    def _flush_at_exit(self):
+        if not self._pending or self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            self.app.logger.warning(f"Could not flush view counts at exit: {e}")
+
+
+view_counter = ViewCounter()
+
+
+@scheduler.job('view-flush', 'VIEWCOUNT_FLUSH_INTERVAL', 30, exclusive=False)
+def flush_views():
+    return view_counter.flush()
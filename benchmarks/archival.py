@@ -0,0 +1,112 @@
+# benchmarks/archival.py
+"""Listing-query latency before and after archiving cold rows.
+
+    python -m benchmarks.archival --products 100000 --iterations 300
+
+Seeds (or reuses) a catalog spread over two years, times the read-heavy
+scenarios, archives everything the job would eventually move, and times them
+again on the same data. Results land in results/archival-<timestamp>-<rev>.json.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from benchmarks.run import (RESULTS_DIR, Context, SqlCounter, git_revision, make_app,
+                            prepare_database, run_scenario)
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed import scale_counts
+from benchmarks.stub_daraja import make_server
+
+READ_SCENARIOS = 'home,all,product,notifications'
+
+
+def table_counts(db, models):
+    return {
+        model.__tablename__: db.session.execute(db.select(db.func.count()).select_from(model.__table__)).scalar()
+        for model in models
+    }
+
+
+def measure(app, sql, args, label):
+    from app import db
+    from app.models import Product
+    with app.app_context():
+        products = db.session.execute(
+            db.select(Product.id, Product.seller_id).filter_by(is_active=True, is_sold=False)
+        ).all()
+    ctx = Context(app, [tuple(row) for row in products], scale_counts(args.products)['users'], args.seed)
+    results = {}
+    for name in args.scenarios.split(','):
+        stats = run_scenario(ctx, sql, SCENARIOS[name], args.iterations, 1, args.warmup)
+        results[name] = stats
+        print(f"{label:<7} {name:<14} p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  sql {stats['sql_mean']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark listing queries with and without archival')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenarios', default=READ_SCENARIOS, help='comma separated subset')
+    parser.add_argument('--fresh', action='store_true', help='reseed even if the database exists')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    stub, stub_url = make_server()
+    db_path = prepare_database(args.products, args.seed, args.fresh)
+    app = make_app(db_path, MPESA_BASE_URL=stub_url, ARCHIVE_BATCH_PAUSE=0, ARCHIVE_MAX_BATCHES=None)
+
+    from app import db, archive
+    from app.models import Product, Payment, ProductUnlock, Notification
+    models = (Product, Payment, ProductUnlock, Notification)
+    with app.app_context():
+        sql = SqlCounter(db.engine)
+        before_counts = table_counts(db, models)
+
+    before = measure(app, sql, args, 'before')
+
+    with app.app_context():
+        start = time.perf_counter()
+        moved = archive.run()
+        archive_seconds = time.perf_counter() - start
+        db.session.execute(db.text('ANALYZE'))
+        after_counts = table_counts(db, models)
+    print(f"Archived {moved} in {archive_seconds:.1f}s")
+
+    after = measure(app, sql, args, 'after')
+    stub.shutdown()
+
+    print(f"\n{'scenario':<14} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10}")
+    for name in before:
+        print(f"{name:<14} {before[name]['p50_ms']:>11} {after[name]['p50_ms']:>10} "
+              f"{before[name]['p95_ms']:>11} {after[name]['p95_ms']:>10}")
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'products': args.products,
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'rows_before': before_counts,
+        'rows_after': after_counts,
+        'archived': moved,
+        'archive_seconds': round(archive_seconds, 2),
+        'before': before,
+        'after': after,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"archival-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{results['meta']['revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/compare.py
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Exits 1 when any scenario's p95 latency grows by more than the threshold
+or its mean SQL statement count goes up.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, candidate, threshold):
+    regressions = []
+    rows = []
+    for name, base in baseline['scenarios'].items():
+        new = candidate['scenarios'].get(name)
+        if not new or base.get('p95_ms') is None or new.get('p95_ms') is None:
+            continue
+        change = (new['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0
+        rows.append((name, base['p95_ms'], new['p95_ms'], change, base['sql_mean'], new['sql_mean']))
+        if change > threshold:
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {new['p95_ms']}ms ({change:+.0%})")
+        if new['sql_mean'] > base['sql_mean']:
+            regressions.append(f"{name}: SQL statements {base['sql_mean']} -> {new['sql_mean']}")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed relative p95 increase')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{'scenario':<14} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'sql before':>11} {'sql after':>10}")
+    for name, before, after, change, sql_before, sql_after in rows:
+        print(f"{name:<14} {before:>11} {after:>10} {change:>+8.0%} {sql_before:>11} {sql_after:>10}")
+
+    if regressions:
+        print('\nRegressions:')
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print('\nNo regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/resilience.py
+"""Check that a slow or failing Daraja doesn't take the rest of the site down.
+
+    python -m benchmarks.resilience --threads 8
+
+Runs unlock POSTs (each one an STK push) alongside home page requests while
+the stub Daraja is healthy, failing, healthy again, and hanging, and checks:
+
+- failing:    the circuit opens, so later unlocks fail fast without calling Daraja
+- recovered:  after MPESA_BREAKER_RESET a probe closes the circuit again
+- hanging:    unlocks give up within the operation timeout and the home page
+              keeps its latency
+
+Exits 1 if any check fails. Results land in results/resilience-<timestamp>-<rev>.json.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.run import RESULTS_DIR, git_revision, make_app, percentile, prepare_database
+from benchmarks.seed import BENCH_PASSWORD
+from benchmarks.stub_daraja import StubConfig, make_server
+
+OPERATION_TIMEOUT = 1.0
+QUEUE_TIMEOUT = 0.5
+BREAKER_RESET = 2.0
+
+PHASES = (
+    # name, stub faults
+    ('healthy', {}),
+    ('failing', {'error_rate': 1.0}),
+    ('recovered', {}),
+    ('hanging', {'hang_rate': 1.0, 'hang_seconds': 5}),
+)
+
+
+def timed_loop(action, iterations, latencies, lock):
+    for i in range(iterations):
+        start = time.perf_counter()
+        action(i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+
+def run_phase(app, buyers, products, iterations):
+    """Unlock POSTs on one half of the threads, home page GETs on the other"""
+    unlock_latencies, home_latencies = [], []
+    lock = threading.Lock()
+    workers = []
+    for slot, buyer in enumerate(buyers):
+        client = app.test_client()
+        client.post('/login', data={'email': f'user{buyer}@bench.local', 'password': BENCH_PASSWORD})
+        product_id = next(product_id for product_id, seller_id in products[slot:] if seller_id != buyer)
+
+        def unlock(i, client=client, product_id=product_id):
+            client.post(f'/product/{product_id}/unlock', data={'mpesa_phone': '0712345678'})
+
+        def home(i, client=app.test_client()):
+            client.get('/')
+
+        workers.append(threading.Thread(target=timed_loop, args=(unlock, iterations, unlock_latencies, lock)))
+        workers.append(threading.Thread(target=timed_loop, args=(home, iterations * 5, home_latencies, lock)))
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - start
+
+    unlock_latencies.sort()
+    home_latencies.sort()
+    return {
+        'wall_seconds': round(wall, 3),
+        'unlock_p50_ms': round(percentile(unlock_latencies, 50) * 1000, 1),
+        'unlock_max_ms': round(unlock_latencies[-1] * 1000, 1),
+        'home_p95_ms': round(percentile(home_latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resilience check against a fault-injecting Daraja stub')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8, help='unlocking users (as many home page readers run alongside)')
+    parser.add_argument('--iterations', type=int, default=4, help='unlocks per user per phase')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    stub_config = StubConfig()
+    stub, stub_url = make_server(config=stub_config)
+    app = make_app(prepare_database(args.products, args.seed), MPESA_BASE_URL=stub_url,
+                   MPESA_TIMEOUTS={'token': OPERATION_TIMEOUT, 'stk_push': OPERATION_TIMEOUT,
+                                   'status_query': OPERATION_TIMEOUT},
+                   MPESA_CONNECT_TIMEOUT=OPERATION_TIMEOUT, MPESA_QUEUE_TIMEOUT=QUEUE_TIMEOUT,
+                   MPESA_BREAKER_RESET=BREAKER_RESET, HTTPCACHE_ENABLED=False)
+
+    from app import db
+    from app.models import Product
+    from app.mpesa import daraja, DARAJA_REJECTED
+    with app.app_context():
+        products = [tuple(row) for row in db.session.execute(
+            db.select(Product.id, Product.seller_id).filter_by(is_active=True, is_sold=False).order_by(Product.id)
+        ).all()]
+    buyers = list(range(1, args.threads + 1))
+
+    results, failures = {}, []
+    for name, faults in PHASES:
+        if name == 'recovered':
+            time.sleep(BREAKER_RESET + 0.5)
+        for key in ('hang_rate', 'error_rate'):
+            setattr(stub_config, key, faults.get(key, 0.0))
+        if 'hang_seconds' in faults:
+            stub_config.hang_seconds = faults['hang_seconds']
+        calls_before = sum(stub_config.calls.values())
+        rejected_before = DARAJA_REJECTED.value('token', 'circuit_open')
+
+        stats = run_phase(app, buyers, products, args.iterations)
+        stats['daraja_calls'] = sum(stub_config.calls.values()) - calls_before
+        stats['rejected_circuit_open'] = DARAJA_REJECTED.value('token', 'circuit_open') - rejected_before
+        stats['circuit'] = daraja.breaker.state
+        results[name] = stats
+        print(f"{name:<10} unlock p50 {stats['unlock_p50_ms']}ms max {stats['unlock_max_ms']}ms  "
+              f"home p95 {stats['home_p95_ms']}ms  daraja calls {stats['daraja_calls']}  "
+              f"refused {stats['rejected_circuit_open']}  circuit {stats['circuit']}")
+
+    healthy, failing, recovered, hanging = (results[name] for name, _ in PHASES)
+    # A hung call is abandoned after the read timeout, plus any time queued for a slot
+    if hanging['unlock_max_ms'] > (OPERATION_TIMEOUT + QUEUE_TIMEOUT + 1) * 1000:
+        failures.append('hanging: unlocks waited past the operation timeout')
+    if hanging['home_p95_ms'] > max(5 * healthy['home_p95_ms'], 250):
+        failures.append('hanging: home page latency rose with Daraja down')
+    if failing['circuit'] != 'open' or not failing['rejected_circuit_open']:
+        failures.append('failing: circuit did not open')
+    if hanging['circuit'] != 'open':
+        failures.append('hanging: timeouts did not open the circuit')
+    if recovered['circuit'] != 'closed':
+        failures.append('recovered: circuit did not close after the reset period')
+
+    stub.shutdown()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"resilience-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{git_revision() or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {'revision': git_revision(), 'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                     'threads': args.threads, 'iterations': args.iterations},
+            'phases': results,
+            'failures': failures,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if failures:
+        print('\nFailed:')
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    print('\nAll resilience checks passed.')
+
+
+if __name__ == '__main__':
+    main()
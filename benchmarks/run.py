@@ -0,0 +1,257 @@
+# benchmarks/run.py
+"""Run the hot-route scenarios against a seeded database and record results.
+
+    python -m benchmarks.run --products 10000 --iterations 200
+    python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+
+The database is seeded once per scale and reused; Daraja is replaced by
+the local stub, so runs are reproducible and need no network.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+
+from benchmarks.scenarios import SCENARIOS, ScenarioError
+from benchmarks.seed import seed, scale_counts, BENCH_PASSWORD
+from benchmarks.stub_daraja import make_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HERE, '.data')
+RESULTS_DIR = os.path.join(HERE, 'results')
+
+
+def make_app(db_path, **overrides):
+    from app import create_app
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(db_path)}',
+        'ARCHIVE_DATABASE': os.path.abspath(db_path)[:-len('.db')] + '.archive.db',
+        'RATELIMIT_ENABLED': False,
+        'METRICS_QUERY_BUDGET': 0,
+        'LOG_LEVEL': 'ERROR',
+        'SCHEDULER_ENABLED': False,
+        'MPESA_CONSUMER_KEY': 'bench-key',
+        'MPESA_CONSUMER_SECRET': 'bench-secret',
+        'MPESA_PASSKEY': 'bench-passkey',
+    }
+    config.update(overrides)
+    return create_app(config)
+
+
+class SqlCounter:
+    """Counts statements on one engine, per thread"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+class Context:
+    """Logged-in clients and the ids scenarios pick from"""
+
+    def __init__(self, app, products, users, seed_value):
+        self.app = app
+        self.rng = random.Random(seed_value)
+        self.anonymous = app.test_client()
+        self.users = users
+        self.products = products  # list of (product_id, seller_id), active and unsold
+        self.sellers = sorted({seller for _, seller in products})
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def use_slot(self, slot):
+        """Worker threads get their own set of clients (test clients aren't thread-safe)"""
+        self._local.slot = slot
+
+    def login_all(self, indices):
+        """Log in every user the iterations will need, outside the timed loop"""
+        for i in indices:
+            self.client(self.buyer(i))
+            self.client(self.seller(i))
+
+    def client(self, user_id):
+        key = (getattr(self._local, 'slot', 0), user_id)
+        with self._lock:
+            client = self._clients.get(key)
+        if client is None:
+            client = self.app.test_client()
+            response = client.post('/login', data={'email': f'user{user_id}@bench.local', 'password': BENCH_PASSWORD})
+            if response.status_code != 302:
+                raise ScenarioError(f"login for user{user_id} failed")
+            with self._lock:
+                self._clients[key] = client
+        return client
+
+    def buyer(self, i):
+        return 1 + (i * 7919) % self.users
+
+    def seller(self, i):
+        return self.sellers[i % len(self.sellers)]
+
+    def product_for(self, buyer, i):
+        for offset in range(len(self.products)):
+            product_id, seller_id = self.products[(i * 104729 + offset) % len(self.products)]
+            if seller_id != buyer:
+                return product_id
+        raise ScenarioError('no product available')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(ctx, sql, scenario, iterations, threads, warmup):
+    ctx.use_slot(0)
+    for i in range(warmup):
+        scenario(ctx, -1 - i)
+
+    latencies, sql_counts, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(slot, indices):
+        ctx.use_slot(slot)
+        ctx.login_all(indices)
+        ready.wait()
+        for i in indices:
+            before = sql.count
+            start = time.perf_counter()
+            try:
+                scenario(ctx, i)
+            except ScenarioError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                sql_counts.append(sql.count - before)
+
+    ready = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=worker, args=(t, range(t, iterations, threads))) for t in range(threads)]
+    for w in workers:
+        w.start()
+    ready.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'wall_seconds': round(wall, 4),
+        'throughput_per_s': round(len(latencies) / wall, 2) if wall else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'sql_mean': round(sum(sql_counts) / len(sql_counts), 2) if sql_counts else None,
+        'sql_max': max(sql_counts) if sql_counts else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_database(products, seed_value, fresh=False):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db_path = os.path.join(DATA_DIR, f'bench-{products}-{seed_value}.db')
+    if fresh and os.path.exists(db_path):
+        os.remove(db_path)
+    if not os.path.exists(db_path):
+        app = make_app(db_path)
+        start = time.perf_counter()
+        counts = seed(app, products, seed_value)
+        print(f"Seeded {counts} in {time.perf_counter() - start:.1f}s -> {db_path}")
+
+    # Scenarios write (unlocks, callbacks), so every run starts from a copy of the pristine seed
+    run_path = db_path.replace('.db', '.run.db')
+    shutil.copyfile(db_path, run_path)
+    archive_path = run_path.replace('.db', '.archive.db')
+    if os.path.exists(archive_path):
+        os.remove(archive_path)
+    return run_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the marketplace hot routes')
+    parser.add_argument('--products', type=int, default=1000, help='catalog size (1000 up to 1000000)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated subset')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='seconds added to each Daraja call')
+    parser.add_argument('--fresh', action='store_true', help='reseed even if the database exists')
+    parser.add_argument('--output', help='results file (default: results/<timestamp>-<rev>.json)')
+    args = parser.parse_args()
+
+    from benchmarks.stub_daraja import StubConfig
+    stub, stub_url = make_server(config=StubConfig(latency=args.stub_latency))
+    db_path = prepare_database(args.products, args.seed, args.fresh)
+    app = make_app(db_path, MPESA_BASE_URL=stub_url)
+
+    from app import db
+    from app.models import Product
+    with app.app_context():
+        sql = SqlCounter(db.engine)
+        products = db.session.execute(
+            db.select(Product.id, Product.seller_id).filter_by(is_active=True, is_sold=False)
+        ).all()
+    ctx = Context(app, [tuple(row) for row in products], scale_counts(args.products)['users'], args.seed)
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'products': args.products,
+            'iterations': args.iterations,
+            'threads': args.threads,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'scenarios': {},
+    }
+
+    for name in args.scenarios.split(','):
+        stats = run_scenario(ctx, sql, SCENARIOS[name], args.iterations, args.threads, args.warmup)
+        results['scenarios'][name] = stats
+        print(f"{name:<14} {stats['throughput_per_s']:>9} req/s  p50 {stats['p50_ms']}ms  "
+              f"p95 {stats['p95_ms']}ms  p99 {stats['p99_ms']}ms  sql {stats['sql_mean']}  errors {stats['errors']}")
+
+    stub.shutdown()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{results['meta']['revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/scenarios.py
+"""Scripted user journeys over the hot routes.
+
+Each scenario is called once per iteration with the shared context and
+the iteration number, and performs one logical operation (which may be
+several HTTP requests, as in the unlock flow).
+"""
+from urllib.parse import urlparse, parse_qs
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def _expect(response, *codes):
+    if response.status_code not in codes:
+        raise ScenarioError(f"{response.request.path} returned {response.status_code}")
+    return response
+
+
+def home(ctx, i):
+    _expect(ctx.anonymous.get('/'), 200)
+
+
+def browse_all(ctx, i):
+    _expect(ctx.anonymous.get('/all'), 200)
+
+
+def view_product(ctx, i):
+    buyer = ctx.buyer(i)
+    product_id = ctx.product_for(buyer, i)
+    # 200 for unlocked/own products, 302 to the unlock page otherwise
+    _expect(ctx.client(buyer).get(f'/product/{product_id}'), 200, 302)
+
+
+def unlock_flow(ctx, i):
+    """Unlock POST -> STK push against the stub -> Daraja callback -> status poll"""
+    buyer = ctx.buyer(i)
+    product_id = ctx.product_for(buyer, i)
+    client = ctx.client(buyer)
+
+    response = _expect(client.post(f'/product/{product_id}/unlock', data={'mpesa_phone': '0712345678'}), 302)
+    location = urlparse(response.headers['Location'])
+    if '/payment-pending/' not in location.path:
+        # already unlocked by an earlier iteration - still a valid request
+        return
+    checkout_request_id = location.path.rsplit('/', 1)[1] or parse_qs(location.query)['checkout_request_id'][0]
+
+    _expect(ctx.anonymous.post('/unlock/callback', json={
+        'Body': {'stkCallback': {
+            'MerchantRequestID': 'bench',
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 1},
+                {'Name': 'MpesaReceiptNumber', 'Value': f'BENCH{i:06d}'},
+                {'Name': 'PhoneNumber', 'Value': 254712345678},
+            ]},
+        }}
+    }), 200)
+    _expect(client.get(f'/unlock/check-status/{checkout_request_id}'), 200)
+
+
+def notification_poll(ctx, i):
+    """What an open tab does: unread badge poll, occasionally the full list"""
+    client = ctx.client(ctx.seller(i))
+    _expect(client.get('/api/notifications/unread-count'), 200)
+    if i % 10 == 0:
+        _expect(client.get('/notifications'), 200)
+
+
+SCENARIOS = {
+    'home': home,
+    'all': browse_all,
+    'product': view_product,
+    'unlock': unlock_flow,
+    'notifications': notification_poll,
+}
@@ -0,0 +1,186 @@
+# benchmarks/seed.py
+"""Deterministic synthetic data for benchmarks.
+
+    python -m benchmarks.seed --db benchmarks/.data/bench-10000.db --products 10000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+
+CATEGORIES = ['Electronics', 'Furniture', 'Books', 'Clothing', 'Kitchen', 'Sports', 'Stationery', 'Other']
+CONDITIONS = ['new', 'like_new', 'good', 'fair']
+CAMPUSES = ['Main Campus', 'Town Campus', 'Medical Campus', 'Agriculture Campus']
+HOSTELS = ['Hall 1', 'Hall 2', 'Hall 3', 'Kilimanjaro', 'Elgon', 'Kenya', 'Off-campus']
+WORDS = (
+    'laptop phone charger desk chair bed mattress textbook novel calculator kettle fridge '
+    'jacket shoes sneakers bag backpack lamp shelf table fan iron speaker headphones monitor '
+    'keyboard mouse bicycle guitar ball jersey notebook pen cooker sufuria blender radio'
+).split()
+ADJECTIVES = 'used new clean barely-used original cheap quality strong portable big small'.split()
+
+BENCH_PASSWORD = 'benchpass'
+CHUNK = 5000
+
+
+def scale_counts(products):
+    """Row counts for every table, derived from the product count"""
+    return {
+        'users': max(50, products // 10),
+        'products': products,
+        'unlocks': products // 2,
+    }
+
+
+def _chunks(rows, size=CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(db, model, rows):
+    total = 0
+    for batch in _chunks(rows):
+        db.session.execute(model.__table__.insert(), batch)
+        db.session.commit()
+        total += len(batch)
+    return total
+
+
+def seed(app, products=1000, seed_value=42):
+    """Fill an empty database; returns the row counts inserted"""
+    from app import db
+    from app.models import User, Category, Product, Payment, ProductUnlock, Notification
+
+    rng = random.Random(seed_value)
+    counts = scale_counts(products)
+    now = datetime.utcnow()
+    # One hash shared by every synthetic user - hashing is not what we measure
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    with app.app_context():
+        db.create_all()
+        inserted = {}
+
+        inserted['categories'] = _insert(db, Category, (
+            {'id': i + 1, 'name': name, 'description': f'{name} items'} for i, name in enumerate(CATEGORIES)
+        ))
+
+        inserted['users'] = _insert(db, User, (
+            {
+                'id': i,
+                'username': f'user{i}',
+                'email': f'user{i}@bench.local',
+                'password_hash': password_hash,
+                'phone': f'07{i % 100000000:08d}',
+                'phone_number': f'2547{i % 100000000:08d}',
+                'campus_location': rng.choice(CAMPUSES),
+                'hostel_name': rng.choice(HOSTELS),
+                'hostel_room': str(rng.randint(1, 400)),
+                'created_at': now - timedelta(days=rng.randint(0, 1000)),
+            }
+            for i in range(1, counts['users'] + 1)
+        ))
+
+        def product_rows():
+            for i in range(1, products + 1):
+                created = now - timedelta(days=rng.random() * 730)
+                item = rng.choice(WORDS)
+                yield {
+                    'id': i,
+                    'title': f'{rng.choice(ADJECTIVES).title()} {item} {rng.choice(WORDS)}',
+                    'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))),
+                    'price': round(rng.lognormvariate(7, 1.2), -1) or 50,
+                    'image': None,
+                    'condition': rng.choice(CONDITIONS),
+                    'contact_info': 'Campus meetup - contact seller for location',
+                    'is_fast_moving': rng.random() < 0.1,
+                    'is_active': rng.random() < 0.9,
+                    'is_sold': rng.random() < 0.2,
+                    'Token': 0,
+                    'category_id': rng.randint(1, len(CATEGORIES)),
+                    'seller_id': rng.randint(1, counts['users']),
+                    'created_at': created,
+                    'updated_at': created,
+                }
+        inserted['products'] = _insert(db, Product, product_rows())
+
+        inserted['payments'] = _insert(db, Payment, (
+            {
+                'id': i,
+                'product_id': i,
+                'user_id': 1 + (i * 7919) % counts['users'],
+                'amount': 1,
+                'phone_number': '254700000000',
+                'checkout_request_id': f'ws_CO_seed_listing_{i}',
+                'merchant_request_id': f'seed-{i}',
+                'mpesa_receipt_number': f'SEED{i:08d}',
+                'status': 'completed',
+                'created_at': now - timedelta(days=rng.random() * 730),
+                'completed_at': now - timedelta(days=rng.random() * 730),
+            }
+            for i in range(1, products + 1)
+        ))
+
+        unlock_rows, notification_rows = [], []
+        for i in range(1, counts['unlocks'] + 1):
+            product_id = rng.randint(1, products)
+            completed = rng.random() < 0.8
+            created = now - timedelta(days=rng.random() * 730)
+            unlock_rows.append({
+                'id': i,
+                'user_id': rng.randint(1, counts['users']),
+                'product_id': product_id,
+                'seller_id': None,  # filled in below
+                'amount': 1,
+                'phone_number': '254700000000',
+                'checkout_request_id': f'ws_CO_seed_unlock_{i}',
+                'merchant_request_id': f'seed-unlock-{i}',
+                'mpesa_receipt_number': f'SEEDU{i:08d}' if completed else None,
+                'status': 'completed' if completed else rng.choice(['pending', 'failed']),
+                'created_at': created,
+                'completed_at': created + timedelta(seconds=30) if completed else None,
+                'unlocked_at': created + timedelta(seconds=40) if completed else None,
+            })
+
+        # seller_id mirrors the product's seller; fetch them in one pass
+        sellers = dict(db.session.execute(db.select(Product.id, Product.seller_id)).all())
+        for row in unlock_rows:
+            row['seller_id'] = sellers[row['product_id']]
+            if row['status'] == 'completed':
+                notification_rows.append({
+                    'user_id': row['seller_id'],
+                    'product_id': row['product_id'],
+                    'unlock_id': row['id'],
+                    'message': f"Your product was unlocked (seed unlock {row['id']})",
+                    'is_read': rng.random() < 0.7,
+                    'created_at': row['completed_at'],
+                })
+
+        inserted['unlocks'] = _insert(db, ProductUnlock, unlock_rows)
+        inserted['notifications'] = _insert(db, Notification, notification_rows)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a benchmark database')
+    parser.add_argument('--db', required=True, help='SQLite file to create')
+    parser.add_argument('--products', type=int, default=1000, help='1000 up to 1000000')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from benchmarks.run import make_app
+    app = make_app(args.db)
+    start = time.perf_counter()
+    counts = seed(app, args.products, args.seed)
+    print(f"Seeded {counts} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
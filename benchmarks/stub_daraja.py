@@ -0,0 +1,123 @@
+# benchmarks/stub_daraja.py
+"""Local stand-in for the Safaricom Daraja API.
+
+Answers the three calls MpesaGateway makes (OAuth token, STK push, STK
+query) with canned responses. Latency and failures can be injected so
+the same server is usable for load tests and for resilience checks.
+
+    python -m benchmarks.stub_daraja --port 8099 --latency 0.05 --error-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, error_rate=0.0, hang_rate=0.0, hang_seconds=30, result_code=0):
+        self.latency = latency            # seconds added to every response
+        self.error_rate = error_rate      # fraction of requests answered with HTTP 500
+        self.hang_rate = hang_rate        # fraction of requests that stall for hang_seconds
+        self.hang_seconds = hang_seconds
+        self.result_code = result_code    # ResultCode returned by STK query
+        self.calls = {}                   # path -> count
+        self._lock = threading.Lock()
+
+    def count(self, path):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+
+class DarajaHandler(BaseHTTPRequestHandler):
+    config = None  # set on the subclass built by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_faults(self):
+        config = self.config
+        config.count(self.path.split('?')[0])
+        if config.latency:
+            time.sleep(config.latency)
+        if config.hang_rate and random.random() < config.hang_rate:
+            time.sleep(config.hang_seconds)
+        if config.error_rate and random.random() < config.error_rate:
+            self._send(500, {'errorMessage': 'Injected failure'})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._inject_faults():
+            return
+        if self.path.startswith('/oauth/v1/generate'):
+            self._send(200, {'access_token': uuid.uuid4().hex, 'expires_in': '3599'})
+        else:
+            self._send(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self._inject_faults():
+            return
+
+        if self.path == '/mpesa/stkpush/v1/processrequest':
+            self._send(200, {
+                'MerchantRequestID': f"stub-{uuid.uuid4().hex[:12]}",
+                'CheckoutRequestID': f"ws_CO_{uuid.uuid4().hex}",
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing',
+            })
+        elif self.path == '/mpesa/stkpushquery/v1/query':
+            self._send(200, {
+                'ResponseCode': '0',
+                'CheckoutRequestID': payload.get('CheckoutRequestID'),
+                'ResultCode': self.config.result_code,
+                'ResultDesc': 'The service request is processed successfully.',
+            })
+        else:
+            self._send(404, {'errorMessage': 'Not found'})
+
+
+def make_server(port=0, config=None):
+    """Start the stub on a background thread; returns (server, base_url)"""
+    config = config or StubConfig()
+    handler = type('BoundDarajaHandler', (DarajaHandler,), {'config': config})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--hang-seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.error_rate, args.hang_rate, args.hang_seconds)
+    server, base_url = make_server(args.port, config)
+    print(f"Stub Daraja listening on {base_url} - set MPESA_BASE_URL to this")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# benchmarks/textdupes.py
+"""Near-duplicate listing detection at catalog scale.
+
+    python -m benchmarks.textdupes --products 100000 --families 200
+
+Signs and clusters the seeded catalog in batch, then writes spam families -
+a listing plus variants with a few words swapped, dropped or added - through
+the same index_listing() call the create route makes, alongside unrelated
+control listings. Reports the per-insert lookup time (next to a linear scan
+over every signature, for scale), how many variants were flagged as their
+family's earlier listing (overall, and of those whose exact Jaccard
+similarity is over the threshold), and how many controls were flagged.
+Results land in results/textdupes-<timestamp>-<rev>.json.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+from benchmarks.run import RESULTS_DIR, git_revision, make_app, percentile, prepare_database
+from benchmarks.seed import WORDS, ADJECTIVES
+
+FILLER = ('call text whatsapp now asap hurry offer deal price negotiable pickup delivery available '
+          'today tomorrow hostel gate library contact me dm for details genuine warranty box').split()
+
+
+def listing_text(rng):
+    words = WORDS + FILLER
+    title = f'{rng.choice(ADJECTIVES).title()} {rng.choice(WORDS)} {rng.choice(words)}'
+    return title, ' '.join(rng.choice(words) for _ in range(rng.randint(15, 40)))
+
+
+def vary(rng, title, description):
+    """A spammer's repost: a couple of words changed, dropped or added"""
+    words = description.split()
+    for _ in range(rng.randint(1, 2)):
+        action = rng.random()
+        position = rng.randrange(len(words))
+        if action < 0.4:
+            words[position] = rng.choice(FILLER)
+        elif action < 0.7 and len(words) > 5:
+            del words[position]
+        else:
+            words.insert(position, rng.choice(FILLER))
+    return title if rng.random() < 0.5 else f'{title} {rng.choice(FILLER)}', ' '.join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MinHash LSH duplicate detection benchmark')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--families', type=int, default=200, help='spam listings, each reposted --variants times')
+    parser.add_argument('--variants', type=int, default=4)
+    parser.add_argument('--controls', type=int, default=500, help='unrelated listings written alongside')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fresh', action='store_true', help='reseed even if the database exists')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    app = make_app(prepare_database(args.products, args.seed, args.fresh))
+    from app import db
+    from app.models import Product, ListingSignature, ListingBand
+    from app.textdupes import rebuild, cluster, index_listing, signature, from_blob, shingles
+
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        start = time.perf_counter()
+        signed = rebuild()
+        results['batch_sign_seconds'] = round(time.perf_counter() - start, 2)
+        start = time.perf_counter()
+        groups = cluster()
+        results['batch_cluster_seconds'] = round(time.perf_counter() - start, 2)
+        results['seeded_groups'] = len(groups)
+        results['band_rows'] = db.session.execute(db.select(db.func.count()).select_from(ListingBand)).scalar()
+        print(f"Signed {signed} listings in {results['batch_sign_seconds']}s, clustered in "
+              f"{results['batch_cluster_seconds']}s ({len(groups)} groups in the seeded text)")
+
+        import numpy as np
+        matrix = np.vstack([from_blob(blob) for blob in db.session.execute(
+            db.select(ListingSignature.signature).where(db.func.length(ListingSignature.signature) > 0)
+        ).scalars()])
+
+        next_id = db.session.execute(db.select(db.func.max(Product.id))).scalar() + 1
+        writes = []
+        for family in range(args.families):
+            title, description = listing_text(rng)
+            writes.append((family, title, description))
+            for _ in range(args.variants):
+                writes.append((family, *vary(rng, title, description)))
+        writes.extend((None, *listing_text(rng)) for _ in range(args.controls))
+        rng.shuffle(writes)
+
+        threshold = app.config['TEXTDUP_THRESHOLD']
+        family_of, shingles_of, lookup_times, linear_times = {}, {}, [], []
+        flagged_variants = flagged_controls = eligible = flagged_eligible = 0
+        for family, title, description in writes:
+            product_id = next_id
+            next_id += 1
+            db.session.execute(Product.__table__.insert(), [{
+                'id': product_id, 'title': title[:100], 'description': description, 'price': 100,
+                'category_id': 1, 'seller_id': 1, 'Token': 0, 'is_active': True, 'is_sold': False,
+            }])
+            start = time.perf_counter()
+            matches = index_listing(product_id, title, description)
+            lookup_times.append(time.perf_counter() - start)
+            db.session.commit()
+
+            # What the lookup replaces: compare against every signature
+            sig = signature(title, description)
+            start = time.perf_counter()
+            (matrix == sig).mean(axis=1)
+            linear_times.append(time.perf_counter() - start)
+
+            earlier_in_family = any(family_of.get(other) == family for _, other in matches)
+            own = shingles(title, description)
+            if family is None:
+                flagged_controls += bool(matches)
+            elif family in family_of.values():
+                flagged_variants += earlier_in_family
+                # Exact Jaccard against the family's earlier listings: what LSH should find
+                best = max(len(own & other) / len(own | other)
+                           for other_id, other in shingles_of.items() if family_of[other_id] == family)
+                if best >= threshold:
+                    eligible += 1
+                    flagged_eligible += earlier_in_family
+            family_of[product_id] = family
+            if family is not None:
+                shingles_of[product_id] = own
+
+        lookup_times.sort()
+        linear_times.sort()
+        reposts = args.families * args.variants
+        results.update({
+            'insert_p50_ms': round(percentile(lookup_times, 50) * 1000, 2),
+            'insert_p95_ms': round(percentile(lookup_times, 95) * 1000, 2),
+            'linear_scan_p50_ms': round(percentile(linear_times, 50) * 1000, 2),
+            'reposts_flagged': flagged_variants,
+            'reposts': reposts,
+            'reposts_above_threshold': eligible,
+            'reposts_above_threshold_flagged': flagged_eligible,
+            'controls_flagged': flagged_controls,
+            'controls': args.controls,
+        })
+        print(f"insert+lookup p50 {results['insert_p50_ms']}ms p95 {results['insert_p95_ms']}ms "
+              f"(numpy linear scan alone p50 {results['linear_scan_p50_ms']}ms)")
+        print(f"reposts flagged {flagged_variants}/{reposts} ({flagged_eligible}/{eligible} of those at Jaccard "
+              f">= {threshold}), controls flagged {flagged_controls}/{args.controls}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"textdupes-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{git_revision() or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {'revision': git_revision(), 'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                     'products': args.products, 'families': args.families, 'variants': args.variants},
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()